@@ -108,9 +108,11 @@ def init_permissions_provider():
 def init_extra_listeners():
   """Initializes listeners for additional services"""
   from ggrc.automapper import register_automapping_listeners
+  from ggrc.cache import metadata
   from ggrc.snapshotter.listeners import register_snapshot_listeners
   register_automapping_listeners()
   register_snapshot_listeners()
+  metadata.register_listeners()
 
 
 def _enable_debug_toolbar():
@@ -142,6 +144,12 @@ def _enable_jasmine():
         Asset("dashboard-js-specs"))
 
 
+def _enable_request_profiler():
+  """Register request profiler hooks if the profiler is enabled."""
+  from ggrc.utils import profiler
+  profiler.init_app(app)
+
+
 def _display_sql_queries():
   """Set up display database queries
 
@@ -206,4 +214,5 @@ notifications.register_notification_listeners()
 
 _enable_debug_toolbar()
 _enable_jasmine()
+_enable_request_profiler()
 _display_sql_queries()
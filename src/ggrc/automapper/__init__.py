@@ -5,6 +5,7 @@ from datetime import datetime
 from logging import getLogger
 import collections
 
+import flask
 from sqlalchemy.sql.expression import tuple_
 
 from ggrc import db
@@ -32,26 +33,59 @@ class Stub(collections.namedtuple("Stub", ["type", "id"])):
     return Stub(relationship.destination_type, relationship.destination_id)
 
 
+class AutomappingState(object):
+  """BFS state of automappings generated for one new relationship."""
+  # pylint: disable=too-few-public-methods
+
+  def __init__(self, relationship):
+    self.relationship = relationship
+    self.queue = set()
+    self.auto_mappings = set()
+
+  @property
+  def limit_exceeded(self):
+    return len(self.auto_mappings) > rules.count_limit
+
+
 class AutomapperGenerator(object):
+  """Generate automappings for new relationships.
+
+  All relationships passed to generate_automappings_batch are processed
+  together, one BFS level at a time. Neighborhoods of all stubs in a level are
+  fetched with a single query, instances needed by implicit rules with one
+  query per type, and all automappings are inserted with a single statement at
+  the end of the batch.
+  """
 
   def __init__(self, use_benchmark=True):
+    self.pending = []
     self.processed = set()
-    self.queue = set()
     self.cache = collections.defaultdict(set)
     self.instance_cache = {}
-    self.auto_mappings = set()
+    self.permission_cache = {}
     if use_benchmark:
       self.benchmark = benchmark
     else:
       self.benchmark = with_nop
 
+  def _reset(self):
+    """Drop data cached by a previous batch, since it could be stale."""
+    self.processed = set()
+    self.cache = collections.defaultdict(set)
+    self.instance_cache = {}
+    self.permission_cache = {}
+
   def related(self, obj):
-    if obj in self.cache:
-      return self.cache[obj]
-    # Pre-fetch neighborhood for enqueued object since we're gonna need that
-    # results in a few steps. This drastically reduces number of queries.
-    stubs = {s for rel in self.queue for s in rel}
-    stubs.add(obj)
+    if obj not in self.cache:
+      self._prefetch_neighborhoods([obj])
+    return self.cache[obj]
+
+  def _prefetch_neighborhoods(self, stubs):
+    """Fetch neighborhoods of all given stubs that are not cached yet."""
+    stubs = {stub for stub in stubs if stub not in self.cache}
+    if not stubs:
+      return
+    pairs = [(s.type, s.id) for s in stubs]
     # Union is here to convince mysql to use two separate indices and
     # merge te results. Just using `or` results in a full-table scan
     # Manual column list avoids loading the full object which would also try to
@@ -60,34 +94,39 @@ class AutomapperGenerator(object):
         Relationship.source_type, Relationship.source_id,
         Relationship.destination_type, Relationship.destination_id)
     relationships = cols.filter(
-        tuple_(Relationship.source_type, Relationship.source_id).in_(
-            [(s.type, s.id) for s in stubs]
-        )
+        tuple_(Relationship.source_type, Relationship.source_id).in_(pairs)
     ).union_all(
         cols.filter(
             tuple_(Relationship.destination_type,
-                   Relationship.destination_id).in_(
-                       [(s.type, s.id) for s in stubs]))
+                   Relationship.destination_id).in_(pairs))
     ).all()
-    batch_requests = collections.defaultdict(set)
+    # mark all stubs as fetched, including the ones without any neighbors
+    for stub in stubs:
+      self.cache[stub] = set()
     for (src_type, src_id, dst_type, dst_id) in relationships:
       src = Stub(src_type, src_id)
       dst = Stub(dst_type, dst_id)
       # only store a neighbor if we queried for it since this way we know
       # we'll be storing complete neighborhood by the end of the loop
-      batch_requests[src_type].add(src_id)
-      batch_requests[dst_type].add(dst_id)
       if src in stubs:
         self.cache[src].add(dst)
       if dst in stubs:
         self.cache[dst].add(src)
 
+  def _prefetch_instances(self, stubs):
+    """Load instances of the given stubs with one query per type."""
+    batch_requests = collections.defaultdict(set)
+    for stub in stubs:
+      if stub not in self.instance_cache:
+        batch_requests[stub.type].add(stub.id)
     for type_, ids in batch_requests.iteritems():
-      model = getattr(models.all_models, type_)
-      instances = model.query.filter(model.id.in_(ids))
-      for instance in instances:
+      model = getattr(models.all_models, type_, None)
+      if model is None:
+        continue
+      for id_ in ids:
+        self.instance_cache[Stub(type_, id_)] = None
+      for instance in model.query.filter(model.id.in_(ids)):
         self.instance_cache[Stub(type_, instance.id)] = instance
-    return self.cache[obj]
 
   def relate(self, src, dst):
     if src < dst:
@@ -96,111 +135,176 @@ class AutomapperGenerator(object):
       return (dst, src)
 
   def generate_automappings(self, relationship):
-    self.auto_mappings = set()
+    self.generate_automappings_batch([relationship])
+
+  def queue_relationships(self, relationships):
+    """Queue new relationships for the next generate_pending call."""
+    self.pending.extend(relationships)
+
+  def generate_pending(self):
+    """Generate automappings for all queued relationships in one batch."""
+    # relationships that were rolled back are no longer in the session
+    relationships = [relationship for relationship in self.pending
+                     if relationship in db.session]
+    self.pending = []
+    self.generate_automappings_batch(relationships)
+
+  def generate_automappings_batch(self, relationships):
+    """Generate automappings for a list of new relationships.
+
+    Each relationship keeps its own automapping limit and the automappings it
+    causes are stored with its id as automapping_id.
+    """
+    if not relationships:
+      return
+    self._reset()
     with self.benchmark("Automapping generate_automappings"):
-      # initial relationship is special since it is already created and
-      # processing it would abort the loop so we manually enqueue the
-      # neighborhood
-      src = Stub.from_source(relationship)
-      dst = Stub.from_destination(relationship)
-      self._step(src, dst)
-      self._step(dst, src)
-      count = 0
-      while len(self.queue) > 0:
-        if len(self.auto_mappings) > rules.count_limit:
-          break
-        count += 1
-        src, dst = entry = self.queue.pop()
-
-        if not (self._can_map_to(src, relationship) and
-                self._can_map_to(dst, relationship)):
-          continue
-
-        created = self._ensure_relationship(src, dst)
-        self.processed.add(entry)
-        if not created:
-          # If the edge already exists it means that auto mappings for it have
-          # already been processed and it is safe to cut here.
-          continue
-        self._step(src, dst)
-        self._step(dst, src)
-
-      if len(self.auto_mappings) <= rules.count_limit:
-        self._flush(relationship)
-      else:
-        relationship._json_extras = {
-            'automapping_limit_exceeded': True
-        }
+      states = [AutomappingState(relationship)
+                for relationship in relationships]
+      # initial relationships are special since they are already created
+      # and processing them would abort the loop so we manually enqueue
+      # their neighborhoods
+      steps = []
+      for state in states:
+        src = Stub.from_source(state.relationship)
+        dst = Stub.from_destination(state.relationship)
+        steps.extend([(state, src, dst), (state, dst, src)])
+      self._prefetch_neighborhoods(src for _, src, _ in steps)
+      levels = 0
+      while steps:
+        levels += 1
+        self._take_steps(steps)
+        steps = self._process_level(states)
+      self._flush(states)
+    logger.info("Automapping batch of %s relationships took %s BFS levels",
+                len(relationships), levels)
+
+  def _take_steps(self, steps):
+    """Enqueue neighbors of all sources of a level."""
+    self._prefetch_instances(
+        src for _, src, dst in steps if rules[src.type, dst.type][1])
+    for state, src, dst in steps:
+      self._step(state, src, dst)
+
+  def _process_level(self, states):
+    """Create automappings for the queued entries of a level.
+
+    Returns:
+      list of steps for the next level.
+    """
+    frontier = []
+    for state in states:
+      frontier.extend((state, entry) for entry in state.queue)
+      state.queue = set()
+    self._prefetch_neighborhoods(
+        stub for _, entry in frontier for stub in entry)
+
+    steps = []
+    for state, (src, dst) in frontier:
+      if state.limit_exceeded:
+        continue
+      if not (self._can_map_to(src, state.relationship) and
+              self._can_map_to(dst, state.relationship)):
+        continue
+
+      created = self._ensure_relationship(state, src, dst)
+      self.processed.add((src, dst))
+      if not created:
+        # If the edge already exists it means that auto mappings for it have
+        # already been processed and it is safe to cut here.
+        continue
+      steps.extend([(state, src, dst), (state, dst, src)])
+    return steps
 
   def _can_map_to(self, obj, parent_relationship):
-    return is_allowed_update(obj.type, obj.id, parent_relationship.context)
-
-  def _flush(self, parent_relationship):
-    if len(self.auto_mappings) == 0:
+    key = (obj, parent_relationship.context_id)
+    if key not in self.permission_cache:
+      self.permission_cache[key] = is_allowed_update(
+          obj.type, obj.id, parent_relationship.context)
+    return self.permission_cache[key]
+
+  def _flush(self, states):
+    """Insert automappings of all relationships within the limit."""
+    rows = []
+    for state in states:
+      if state.limit_exceeded:
+        state.relationship._json_extras = {
+            'automapping_limit_exceeded': True
+        }
+        continue
+      rows.extend(self._get_rows(state))
+    if not rows:
       return
     with self.benchmark("Automapping flush"):
       current_user = get_current_user()
       now = datetime.now()
+      for row in rows:
+        row.update({
+            "modified_by_id": current_user.id,
+            "created_at": now,
+            "updated_at": now,
+        })
       # We are doing an INSERT IGNORE INTO here to mitigate a race condition
       # that happens when multiple simultaneous requests create the same
       # automapping. If a relationship object fails our unique constraint
       # it means that the mapping was already created by another request
       # and we can safely ignore it.
       inserter = Relationship.__table__.insert().prefix_with("IGNORE")
-      original = self.relate(Stub.from_source(parent_relationship),
-                             Stub.from_destination(parent_relationship))
-      db.session.execute(inserter.values([{
-          "id": None,
-          "modified_by_id": current_user.id,
-          "created_at": now,
-          "updated_at": now,
-          "source_id": src.id,
-          "source_type": src.type,
-          "destination_id": dst.id,
-          "destination_type": dst.type,
-          "context_id": None,
-          "status": None,
-          "automapping_id": parent_relationship.id}
-          for src, dst in self.auto_mappings
-          if (src, dst) != original]))  # (src, dst) is sorted
+      db.session.execute(inserter.values(rows))
       cache = get_cache(create=True)
       if cache:
         # Add inserted relationships into new objects collection of the cache,
         # so that they will be logged within event and appropriate revisions
         # will be created.
+        parent_ids = {row["automapping_id"] for row in rows}
         cache.new.update(
-            (relationship, relationship.log_json())
-            for relationship in Relationship.query.filter_by(
-                automapping_id=parent_relationship.id,
-                modified_by_id=current_user.id,
-                created_at=now,
-                updated_at=now,
+            (relationship, None)
+            for relationship in Relationship.query.filter(
+                Relationship.automapping_id.in_(parent_ids),
+                Relationship.modified_by_id == current_user.id,
+                Relationship.created_at == now,
+                Relationship.updated_at == now,
             )
         )
 
-  def _step(self, src, dst):
+  def _get_rows(self, state):
+    """Get rows for inserting automappings of a relationship."""
+    parent_relationship = state.relationship
+    original = self.relate(Stub.from_source(parent_relationship),
+                           Stub.from_destination(parent_relationship))
+    return [{
+        "id": None,
+        "source_id": src.id,
+        "source_type": src.type,
+        "destination_id": dst.id,
+        "destination_type": dst.type,
+        "context_id": None,
+        "status": None,
+        "automapping_id": parent_relationship.id}
+        for src, dst in state.auto_mappings
+        if (src, dst) != original]  # (src, dst) is sorted
+
+  def _step(self, state, src, dst):
     explicit, implicit = rules[src.type, dst.type]
-    self._step_explicit(src, dst, explicit)
-    self._step_implicit(src, dst, implicit)
+    self._step_explicit(state, src, dst, explicit)
+    self._step_implicit(state, src, dst, implicit)
 
-  def _step_explicit(self, src, dst, explicit):
+  def _step_explicit(self, state, src, dst, explicit):
     if len(explicit) != 0:
       src_related = (o for o in self.related(src)
                      if o.type in explicit and o != dst)
       for r in src_related:
         entry = self.relate(r, dst)
         if entry not in self.processed:
-          self.queue.add(entry)
+          state.queue.add(entry)
 
-  def _step_implicit(self, src, dst, implicit):
+  def _step_implicit(self, state, src, dst, implicit):
     if not hasattr(models.all_models, src.type):
       logger.warning('Automapping by attr: cannot find model %s', src.type)
       return
-    instance = self.instance_cache.get(src)
-    if instance is None:
-      model = getattr(models.all_models, src.type)
-      instance = model.query.filter(model.id == src.id).first()
-      self.instance_cache[src] = instance
+    if src not in self.instance_cache:
+      self._prefetch_instances([src])
+    instance = self.instance_cache[src]
     if instance is None:
       logger.warning("Automapping by attr: cannot load model %s: %s",
                      src.type, src.id)
@@ -214,7 +318,7 @@ class AutomapperGenerator(object):
           if value is not None:
             entry = self.relate(Stub(value.type, value.id), dst)
             if entry not in self.processed:
-              self.queue.add(entry)
+              state.queue.add(entry)
           else:
             logger.warning('Automapping by attr: %s is None', attr.name)
       else:
@@ -223,13 +327,13 @@ class AutomapperGenerator(object):
             src, attr.name,
         )
 
-  def _ensure_relationship(self, src, dst):
+  def _ensure_relationship(self, state, src, dst):
     if dst in self.cache.get(src, []):
       return False
     if src in self.cache.get(dst, []):
       return False
 
-    self.auto_mappings.add((src, dst))
+    state.auto_mappings.add((src, dst))
 
     if src in self.cache:
       self.cache[src].add(dst)
@@ -239,6 +343,17 @@ class AutomapperGenerator(object):
     return True
 
 
+def get_automapper():
+  """Get the automapper of the current request.
+
+  Relationships created in different parts of a request, such as rows of an
+  import block, are queued on it and processed as a single batch.
+  """
+  if not hasattr(flask.g, "automapper"):
+    flask.g.automapper = AutomapperGenerator()
+  return flask.g.automapper
+
+
 def register_automapping_listeners():
   """Register event listeners for auto mapper."""
   # pylint: disable=unused-variable,unused-argument
@@ -247,15 +362,15 @@ def register_automapping_listeners():
   def handle_relationship_collection_post(sender, objects=None, **kwargs):
     """Handle bulk creation of relationships.
 
-    This handler reuses auto mapper cache and is more efficient than handling
-    one object at a time.
+    All posted relationships are processed as one automapping batch, which is
+    more efficient than handling one object at a time.
 
     Args:
       objects: list of relationship Models.
     """
-    automapper = AutomapperGenerator()
-    for obj in objects:
-      if obj is None:
-        logger.warning("Automapping listener: no obj, no mappings created")
-        return
-      automapper.generate_automappings(obj)
+    if any(obj is None for obj in objects):
+      logger.warning("Automapping listener: skipped None objects, mappings "
+                     "are created only for the other relationships")
+    automapper = get_automapper()
+    automapper.queue_relationships(obj for obj in objects if obj is not None)
+    automapper.generate_pending()
@@ -6,6 +6,7 @@
 # pylint: disable=no-name-in-module
 # false positive for RelationshipProperty
 
+import collections
 from datetime import datetime
 
 from flask import g
@@ -24,6 +25,7 @@ from ggrc.login import get_current_user_id
 from ggrc.models.reflection import AttributeInfo
 from ggrc.models.types import JsonType
 from ggrc.models.utils import PolymorphicRelationship
+from ggrc.utils import profiler
 from ggrc.utils import url_for
 from ggrc.utils import view_url_for
 
@@ -68,9 +70,10 @@ def publish(obj, inclusions=(), inclusion_filter=None):
       return True
   publisher = get_json_builder(obj)
   if publisher and getattr(publisher, '_publish_attrs', []):
-    ret = publish_base_properties(obj)
-    ret.update(publisher.publish_contribution(
-        obj, inclusions, inclusion_filter))
+    with profiler.timer("serialization"):
+      ret = publish_base_properties(obj)
+      ret.update(publisher.publish_contribution(
+          obj, inclusions, inclusion_filter))
     return ret
   # Otherwise, just return the value itself by default
   return obj
@@ -294,231 +297,180 @@ class UpdateAttrHandler(object):
     return json_obj.get(attr_name)
 
 
-"""
-Builder strategy:
-  * For each non-present attribute, return an "AttributeBuilder" instance
-    which describes the objects needed to complete the representation.
-  * Maintain a set of requested (type, condition, stub_only?) tuples
-  * stub_only? tuples can be requested en-masse via UNION queries
-  * non-stub_only? tuples can override stub_only? tuples with identical
-    conditions
-  * When all available object representations have been built:
-
-Query types:
-  (type, id) -> explicit link
-  (type, { keyX: valX, ... }) -> an actual query
-    note, keyX row/object values must be included in response to distinguish
-    results from aggregated queries on the same type
-  (type, [id, { keyX: valX, ... }, id2, { keyY: valY }, ...]) ->
-    an already-aggregated list of conditions
-
-Query combination:
-  (type, id) -> aggregate into "id IN (...)"
-  (type, {}) -> aggregate into "...OR keyX = valX OR keyY = valY"
-
-Query construction:
-  pass
-
-Result storing:
-  { type: { id: <result>, (keyX, ...): { (valX, ...): [<result>, ...] } } }
-
-Result dispatch:
-  singles = { (type, id): [<Builder>, ...] }
-"""
-
-
-def build_type_query(type_, result_spec):
-  model = ggrc.models.get_model(type_)
-  mapper = model._sa_class_manager.mapper
-  columns = []
-  columns_indexes = {}
-  if len(list(mapper.self_and_descendants)) == 1:
-    type_column = sqlalchemy.literal(mapper.class_.__name__)
-  else:
-    # Handle polymorphic types with CASE
-    type_column = sqlalchemy.case(
-        value=mapper.polymorphic_on,
-        whens={
-            val: mapper.class_.__name__
-            for val, mapper in mapper.polymorphic_map.items()
-        })
-  columns.append(type_column)
-  columns_indexes['type'] = 0
-  columns.append(model.id)
-  columns_indexes['id'] = 1
-  columns.append(mapper.c.context_id)
-  columns_indexes['context_id'] = 2
-  columns.append(mapper.c.updated_at)
-  columns_indexes['updated_at'] = 3
-
-  conditions = {}
-  for keys, vals in result_spec.items():
-    for key in keys:
-      if key not in columns_indexes:
-        columns_indexes[key] = len(columns)
-        columns.append(mapper.c[key])
-    conditions.setdefault(keys, []).extend(vals.keys())
-
-  where_clauses = []
-  for keys, vals in conditions.items():
-    if len(keys) == 1:
-      # If the key is singular, use `IN (...)`
-      where_clauses.append(
-          columns[columns_indexes[keys[0]]].in_([v[0] for v in vals]))
-    else:
-      # If multiple keys, build `OR` of multiple `AND` clauses
-      clauses = []
-      cols = [columns[columns_indexes[k]] for k in keys]
-      for val in vals:
-        # Now build OR clause with (key, val) pairs
-        clause = []
-        for i, _ in enumerate(val):
-          clause.append(cols[i] == val[i])
-        clauses.append(sqlalchemy.and_(*clause))
-      where_clauses.append(sqlalchemy.or_(*clauses))
-  where_clause = sqlalchemy.or_(*where_clauses)
-
-  query = db.session.query(*columns).filter(where_clause)
-
-  return columns_indexes, query
-
-
-def build_stub_union_query(queries):
-  results = {}
-  for (type_, conditions) in queries:
-    if isinstance(conditions, (int, long, str, unicode)):
-      # Assume `id` query
-      keys, vals = ('id',), (conditions,)
-      results.setdefault(type_, {}).setdefault(keys, {}).setdefault(vals, [])
-    elif isinstance(conditions, dict):
-      keys, vals = zip(*sorted(conditions.items()))
-      results.setdefault(type_, {}).setdefault(keys, {}).setdefault(vals, [])
-    else:
-      # FIXME: Handle aggregated conditions recursively
-      pass
-
-  column_count = 0
-  type_column_indexes = {}
-  type_queries = {}
-  for (type_, result_spec) in results.items():
-    columns_indexes, query = build_type_query(type_, result_spec)
-    type_column_indexes[type_] = columns_indexes
-    type_queries[type_] = query
-    if len(columns_indexes) > column_count:
-      column_count = len(columns_indexes)
-
-  for (type_, query) in type_queries.items():
-    for _ in range(column_count - len(type_column_indexes[type_])):
-      query = query.add_column(sqlalchemy.literal(None))
-    type_queries[type_] = query
-
-  queries_for_union = type_queries.values()
-  if len(queries_for_union) == 0:
-    query = None
-  elif len(queries_for_union) == 1:
-    query = queries_for_union[0]
-  else:
-    query = db.session.query(
-        sqlalchemy.sql.expression.union(
-            *[q for q in type_queries.values()]).alias('union_query'))
-  return results, type_column_indexes, query
-
-
-def _render_stub_from_match(match, type_columns):
-  type_ = match[type_columns['type']]
-  id_ = match[type_columns['id']]
+def _render_stub(type_, id_, context_id):
   return {
       'type': type_,
       'id': id_,
-      'context_id': match[type_columns['context_id']],
+      'context_id': context_id,
       'href': url_for(type_, id=id_),
   }
 
 
-class LazyStubRepresentation(object):
-
-  def __init__(self, type_, conditions):
-    self.type = type_
-    if isinstance(conditions, (int, long)):
-      conditions = {'id': conditions}
-    self.conditions = conditions
-    self.condition_key, self.condition_val = zip(*sorted(conditions.items()))
-
-  def get_matches(self, results):
-    return results\
-        .get(self.type, {})\
-        .get(self.condition_key, {})\
-        .get(self.condition_val, [])
-
-  def render(self, results, type_columns):
-    matches = self.get_matches(results)
-    assert len(matches) <= 1, (results, self.type, self.condition_key,
-                               self.condition_val)
-    if len(matches) == 1:
-      return _render_stub_from_match(matches[0], type_columns[self.type])
-    else:
-      return None
+def _get_loaded_instance(type_, id_):
+  """Get an instance from the session if its context_id is already loaded."""
+  if not db.session.registry.has():
+    return None
+  model = ggrc.models.get_model(type_)
+  if model is None:
+    return None
+  mapper = model._sa_class_manager.mapper
+  instance = db.session.identity_map.get(
+      mapper.identity_key_from_primary_key([id_]))
+  if instance is None or 'context_id' not in instance.__dict__:
+    return None
+  if not isinstance(instance, model) or instance in db.session.deleted:
+    return None
+  return instance
 
 
-def walk_representation(obj):  # noqa
-  if isinstance(obj, dict):
-    for key, value in obj.items():
-      if isinstance(value, dict):
-        for attr in walk_representation(value):
-          yield attr
-      elif isinstance(value, (list, tuple)):
-        for attr in walk_representation(value):
-          yield attr
-      else:
-        yield value, key, obj
-  elif isinstance(obj, (list, tuple)):
-    for index, value in enumerate(obj):
-      if isinstance(value, dict):
-        for attr in walk_representation(value):
-          yield attr
-      elif isinstance(value, (list, tuple)):
-        for attr in walk_representation(value):
-          yield attr
-      else:
-        yield value, index, obj
+def build_stub_query(ids_by_type):
+  """Build a single query for stubs of all types.
 
+  Args:
+    ids_by_type: dict of type name to ids of stubs of that type.
 
-def gather_queries(resource):
+  Returns:
+    query returning (requested type, type, id, context_id) rows.
+  """
   queries = []
-  for val, key, obj in walk_representation(resource):
-    if isinstance(val, LazyStubRepresentation):
-      queries.append((val.type, val.conditions))
-  return queries
+  for type_, ids in ids_by_type.items():
+    model = ggrc.models.get_model(type_)
+    mapper = model._sa_class_manager.mapper
+    if len(list(mapper.self_and_descendants)) == 1:
+      type_column = sqlalchemy.literal(mapper.class_.__name__)
+    else:
+      # Handle polymorphic types with CASE
+      type_column = sqlalchemy.case(
+          value=mapper.polymorphic_on,
+          whens={
+              val: mapper.class_.__name__
+              for val, mapper in mapper.polymorphic_map.items()
+          })
+    queries.append(db.session.query(
+        sqlalchemy.literal(type_).label('requested_type'),
+        type_column.label('type'),
+        model.id,
+        mapper.c.context_id,
+    ).filter(model.id.in_(ids)))
+  return queries[0].union_all(*queries[1:])
+
+
+class StubResolver(object):
+  """Request scoped resolver of LazyStubRepresentation objects.
+
+  Stubs register themselves when they are created. Stubs of instances that
+  are loaded in the session or that were already resolved during the request
+  are filled in right away, all other stubs are resolved with a single query
+  when the representation is published.
+  """
 
+  def __init__(self):
+    self.pending = []
+    self.resolved = {}
+    self.has_missing = False
+
+  def register(self, stub):
+    """Fill in the stub or queue it for resolving."""
+    key = (stub.type, stub.id)
+    if key not in self.resolved:
+      instance = _get_loaded_instance(stub.type, stub.id)
+      if instance is None:
+        self.pending.append(stub)
+        return
+      self.resolved[key] = _render_stub(
+          instance.__class__.__name__, instance.id, instance.context_id)
+    self._fill(stub)
+
+  def _fill(self, stub):
+    rendered = self.resolved[(stub.type, stub.id)]
+    if rendered is None:
+      self.has_missing = True
+    else:
+      stub.update(rendered)
+
+  def resolve(self):
+    """Resolve all pending stubs."""
+    pending, self.pending = self.pending, []
+    ids_by_type = collections.defaultdict(set)
+    for stub in pending:
+      if (stub.type, stub.id) not in self.resolved:
+        if ggrc.models.get_model(stub.type) is None:
+          self.resolved[(stub.type, stub.id)] = None
+        else:
+          ids_by_type[stub.type].add(stub.id)
+    if ids_by_type:
+      for type_, ids in ids_by_type.items():
+        for id_ in ids:
+          self.resolved[(type_, id_)] = None
+      for requested_type, type_, id_, context_id in \
+              build_stub_query(ids_by_type):
+        self.resolved[(requested_type, id_)] = _render_stub(
+            type_, id_, context_id)
+    for stub in pending:
+      self._fill(stub)
+
+
+def get_stub_resolver():
+  """Get the stub resolver of the current request."""
+  if not hasattr(g, "stub_resolver"):
+    g.stub_resolver = StubResolver()
+  return g.stub_resolver
+
+
+class LazyStubRepresentation(dict):
+  """Link object that is filled in once the referenced object is resolved.
+
+  Stubs of objects that do not exist are replaced with None by
+  publish_representation.
+  """
 
-def reify_representation(resource, results, type_columns):
-  for val, key, obj in walk_representation(resource):
-    if isinstance(val, LazyStubRepresentation):
-      obj[key] = val.render(results, type_columns)
-  return resource
+  def __init__(self, type_, id_):
+    super(LazyStubRepresentation, self).__init__()
+    self.type = type_
+    self.id = id_
+    get_stub_resolver().register(self)
+
+
+def remove_missing_stubs(resource):
+  """Replace stubs of objects that do not exist with None."""
+  containers = [resource]
+  while containers:
+    container = containers.pop()
+    if isinstance(container, dict):
+      items = container.items()
+    elif isinstance(container, list):
+      items = enumerate(container)
+    else:
+      continue
+    for key, value in items:
+      if isinstance(value, LazyStubRepresentation) and not value:
+        container[key] = None
+      elif isinstance(value, (dict, list)):
+        containers.append(value)
 
 
 def publish_representation(resource):
-  queries = gather_queries(resource)
-
-  if len(queries) == 0:
-    return resource
-  else:
-    results, type_columns, query = build_stub_union_query(queries)
-    rows = query.all()
-    for row in rows:
-      type_ = row[0]
-      for columns, matches in results[type_].items():
-        vals = tuple(row[type_columns[type_][c]] for c in columns)
-        if vals in matches:
-          matches[vals].append(row)
+  """Resolve all stubs created during the request.
 
-    return reify_representation(resource, results, type_columns)
+  Stubs are filled in place, so the result tree only needs to be walked if
+  some stubs reference objects that do not exist.
+  """
+  with profiler.timer("serialization"):
+    resolver = get_stub_resolver()
+    resolver.resolve()
+    if resolver.has_missing:
+      remove_missing_stubs(resource)
+  return resource
 
 
 class Builder(AttributeInfo):
   """JSON Dictionary builder for ggrc.models.* objects and their mixins."""
 
+  def __init__(self, tgt_class):
+    super(Builder, self).__init__(tgt_class)
+    self._attr_publishers = {}
+    self._publish_plans = {}
+
   def generate_link_object_for(
           self, obj, inclusions, include, inclusion_filter):
     """Generate a link object for this object. If there are property paths
@@ -636,59 +588,113 @@ class Builder(AttributeInfo):
       else:
         return None
 
-  def publish_attr(
-          self, obj, attr_name, inclusions, include, inclusion_filter):
-    class_attr = getattr(obj.__class__, attr_name)
-    result = None
+  def _publish_custom(self, obj, attr_name, *_):
+    return obj.__class__._custom_publish[attr_name](obj)
+
+  def _publish_raw_association_proxy(self, obj, attr_name, *_):
+    published_attr = getattr(obj, attr_name)
+    if hasattr(published_attr, "copy"):
+      return published_attr.copy()
+    return published_attr
+
+  def _publish_property(
+          self, obj, attr_name, class_attr, inclusions, include,
+          inclusion_filter):
+    if not inclusions or include:
+      if getattr(obj, '{0}_id'.format(attr_name)):
+        return LazyStubRepresentation(
+            getattr(obj, '{0}_type'.format(attr_name)),
+            getattr(obj, '{0}_id'.format(attr_name)))
+      return None
+    return self.publish_link(
+        obj, attr_name, inclusions, include, inclusion_filter)
+
+  def _publish_value(self, obj, attr_name, *_):
+    return getattr(obj, attr_name)
+
+  def _get_attr_publisher(self, cls, attr_name):
+    """Get the method publishing an attribute of instances of a class.
+
+    The kind of the attribute only depends on the class, so it is inspected
+    once per class and attribute.
+
+    Returns:
+      tuple of a method with the publish_association_proxy signature and the
+      class attribute that gets passed to it.
+    """
+    key = (cls, attr_name)
+    if key in self._attr_publishers:
+      return self._attr_publishers[key]
+    class_attr = getattr(cls, attr_name)
 
-    if attr_name in getattr(obj.__class__, "_custom_publish", {}):
+    if attr_name in getattr(cls, "_custom_publish", {}):
       # The attribute has a custom publish logic
-      result = obj.__class__._custom_publish[attr_name](obj)
+      method = self._publish_custom
     elif isinstance(class_attr, AssociationProxy):
       if getattr(class_attr, 'publish_raw', False):
-        published_attr = getattr(obj, attr_name)
-        if hasattr(published_attr, "copy"):
-          result = published_attr.copy()
-        else:
-          result = published_attr
+        method = self._publish_raw_association_proxy
       else:
-        result = self.publish_association_proxy(
-            obj, attr_name, class_attr, inclusions, include, inclusion_filter)
+        method = self.publish_association_proxy
     elif isinstance(class_attr, InstrumentedAttribute) and \
             isinstance(class_attr.property, RelationshipProperty):
-      result = self.publish_relationship(
-          obj, attr_name, class_attr, inclusions, include, inclusion_filter)
+      method = self.publish_relationship
     elif class_attr.__class__.__name__ == 'property':
-      if not inclusions or include:
-        if getattr(obj, '{0}_id'.format(attr_name)):
-          result = LazyStubRepresentation(
-              getattr(obj, '{0}_type'.format(attr_name)),
-              getattr(obj, '{0}_id'.format(attr_name)))
-      else:
-        result = self.publish_link(
-            obj, attr_name, inclusions, include, inclusion_filter)
+      method = self._publish_property
     else:
-      result = getattr(obj, attr_name)
+      method = self._publish_value
 
-    return result
+    self._attr_publishers[key] = method, class_attr
+    return method, class_attr
 
-  def _publish_attrs_for(
-          self, obj, attrs, json_obj, inclusions=None, inclusion_filter=None):
-    if inclusions is None:
-      inclusions = []
+  def publish_attr(
+          self, obj, attr_name, inclusions, include, inclusion_filter):
+    method, class_attr = self._get_attr_publisher(obj.__class__, attr_name)
+    return method(
+        obj, attr_name, class_attr, inclusions, include, inclusion_filter)
+
+  def _compile_publish_plan(self, cls, attrs, inclusions):
+    """Get a list of publishing steps for the given attributes of a class.
+
+    Each step is a tuple of attribute name, publishing method, class
+    attribute, remaining inclusion path and include flag.
+    """
+    local_inclusions = {}
+    # the first inclusion for an attribute takes precedence
+    for inclusion in reversed(inclusions):
+      local_inclusions[inclusion[0]] = inclusion
+    plan = []
     for attr in attrs:
       if hasattr(attr, '__call__'):
         attr_name = attr.attr_name
       else:
         attr_name = attr
-      local_inclusion = ()
-      for inclusion in inclusions:
-        if inclusion[0] == attr_name:
-          local_inclusion = inclusion
-          break
-      json_obj[attr_name] = self.publish_attr(
-          obj, attr_name, local_inclusion[1:], len(local_inclusion) > 0,
-          inclusion_filter)
+      local_inclusion = local_inclusions.get(attr_name, ())
+      method, class_attr = self._get_attr_publisher(cls, attr_name)
+      plan.append((attr_name, method, class_attr, local_inclusion[1:],
+                   len(local_inclusion) > 0))
+    return plan
+
+  def _get_publish_plan(self, cls, extra_inclusions):
+    """Get the cached publishing plan of _publish_attrs for a class."""
+    key = (cls, tuple(extra_inclusions))
+    plan = self._publish_plans.get(key)
+    if plan is None:
+      inclusions = tuple((attr,) for attr in self._include_links)
+      inclusions = tuple(set(inclusions).union(set(extra_inclusions)))
+      plan = self._compile_publish_plan(cls, self._publish_attrs, inclusions)
+      self._publish_plans[key] = plan
+    return plan
+
+  @staticmethod
+  def _publish_plan(obj, plan, json_obj, inclusion_filter):
+    for attr_name, method, class_attr, inclusions, include in plan:
+      json_obj[attr_name] = method(
+          obj, attr_name, class_attr, inclusions, include, inclusion_filter)
+
+  def _publish_attrs_for(
+          self, obj, attrs, json_obj, inclusions=None, inclusion_filter=None):
+    plan = self._compile_publish_plan(obj.__class__, attrs, inclusions or ())
+    self._publish_plan(obj, plan, json_obj, inclusion_filter)
 
   def publish_attrs(self, obj, json_obj, extra_inclusions, inclusion_filter):
     """Translate the state represented by ``obj`` into the JSON dictionary
@@ -705,11 +711,12 @@ class Builder(AttributeInfo):
       ('directives')
       [('directives'),('cycles')]
       [('directives', ('audit_frequency','organization')),('cycles')]
+
+    The attributes to publish are dispatched through a plan that is compiled
+    once per class and set of inclusions.
     """
-    inclusions = tuple((attr,) for attr in self._include_links)
-    inclusions = tuple(set(inclusions).union(set(extra_inclusions)))
-    return self._publish_attrs_for(
-        obj, self._publish_attrs, json_obj, inclusions, inclusion_filter)
+    plan = self._get_publish_plan(obj.__class__, extra_inclusions)
+    self._publish_plan(obj, plan, json_obj, inclusion_filter)
 
   @classmethod
   def do_update_attrs(cls, obj, json_obj, attrs):
@@ -0,0 +1,203 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Selection of the memcache client used by MemCache.
+
+MEMCACHE_BACKEND selects the App Engine memcache service ("appengine") or
+memcached servers listed in MEMCACHE_SERVERS ("memcached"). With a positive
+MEMCACHE_LOCAL_SIZE, values are also kept in an LRU cache in process memory
+for MEMCACHE_LOCAL_TTL seconds. Writes through a client of the process update
+the local values right away, while changes made by other processes are seen
+once the local values expire. Keys with a prefix registered by
+add_shared_prefix, such as version counters used for invalidation, are never
+kept locally.
+"""
+
+import cPickle
+import time
+
+from ggrc import settings
+from ggrc.utils.structures import LRUCache
+
+
+# Prefixes of keys that are always read from and written to the shared client.
+_shared_prefixes = set()
+
+
+def add_shared_prefix(prefix):
+  """Keep keys starting with prefix out of the local tier.
+
+  Counters that other processes increment to invalidate cached values must
+  be registered, so their changes are seen right away.
+  """
+  _shared_prefixes.add(prefix)
+
+
+class TieredClient(object):
+  """Memcache client that serves recently used values from process memory.
+
+  Values are stored pickled, so callers can modify the returned values. Any
+  method that is not handled by the local tier is passed to the shared
+  client.
+
+  Args:
+    client: shared memcache client.
+    cache: LRUCache for local values.
+    ttl: number of seconds a local value is used.
+  """
+
+  def __init__(self, client, cache, ttl):
+    self.client = client
+    self.cache = cache
+    self.ttl = ttl
+
+  def __getattr__(self, name):
+    return getattr(self.client, name)
+
+  @staticmethod
+  def _get_local_key(key, key_prefix="", namespace=None):
+    return namespace, key_prefix + key
+
+  @staticmethod
+  def _is_local(key, key_prefix=""):
+    return not (key_prefix + key).startswith(tuple(_shared_prefixes))
+
+  def _set_local(self, local_key, value):
+    self.cache.set(local_key, (time.time() + self.ttl,
+                               cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)))
+
+  def get(self, key, namespace=None, for_cas=False):
+    return self.get_multi([key], namespace=namespace, for_cas=for_cas).get(key)
+
+  def gets(self, key, namespace=None):
+    return self.get(key, namespace=namespace, for_cas=True)
+
+  def get_multi(self, keys, key_prefix="", namespace=None, for_cas=False):
+    """Get values from the local tier and missing values from the client.
+
+    Reads for a later cas and reads of shared keys always go to the shared
+    client.
+    """
+    result = {}
+    missing = []
+    now = time.time()
+    for key in keys:
+      entry = None
+      if not for_cas and self._is_local(key, key_prefix):
+        entry = self.cache.get(self._get_local_key(key, key_prefix, namespace))
+      if entry is not None and entry[0] > now:
+        result[key] = cPickle.loads(entry[1])
+      else:
+        missing.append(key)
+    if missing:
+      values = self.client.get_multi(missing, key_prefix=key_prefix,
+                                     namespace=namespace, for_cas=for_cas)
+      for key, value in values.iteritems():
+        if self._is_local(key, key_prefix):
+          self._set_local(self._get_local_key(key, key_prefix, namespace),
+                          value)
+      result.update(values)
+    return result
+
+  def _store_multi(self, method, mapping, time_, key_prefix, namespace):
+    """Store values with the client and keep the stored values locally."""
+    not_stored = method(mapping, time_, key_prefix=key_prefix,
+                        namespace=namespace)
+    failed = set(not_stored)
+    for key, value in mapping.iteritems():
+      local_key = self._get_local_key(key, key_prefix, namespace)
+      if key in failed or not self._is_local(key, key_prefix):
+        self.cache.delete(local_key)
+      else:
+        self._set_local(local_key, value)
+    return not_stored
+
+  def set(self, key, value, time=0, namespace=None):
+    # pylint: disable=redefined-outer-name
+    return not self.set_multi({key: value}, time, namespace=namespace)
+
+  def set_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    # pylint: disable=redefined-outer-name
+    return self._store_multi(self.client.set_multi, mapping, time,
+                             key_prefix, namespace)
+
+  def add(self, key, value, time=0, namespace=None):
+    # pylint: disable=redefined-outer-name
+    return not self.add_multi({key: value}, time, namespace=namespace)
+
+  def add_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    # pylint: disable=redefined-outer-name
+    return self._store_multi(self.client.add_multi, mapping, time,
+                             key_prefix, namespace)
+
+  def cas(self, key, value, time=0, namespace=None):
+    # pylint: disable=redefined-outer-name
+    return not self.cas_multi({key: value}, time, namespace=namespace)
+
+  def cas_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    # pylint: disable=redefined-outer-name
+    return self._store_multi(self.client.cas_multi, mapping, time,
+                             key_prefix, namespace)
+
+  def delete(self, key, seconds=0, namespace=None):
+    self.cache.delete(self._get_local_key(key, namespace=namespace))
+    return self.client.delete(key, seconds, namespace=namespace)
+
+  def delete_multi(self, keys, seconds=0, key_prefix="", namespace=None):
+    for key in keys:
+      self.cache.delete(self._get_local_key(key, key_prefix, namespace))
+    return self.client.delete_multi(keys, seconds, key_prefix=key_prefix,
+                                    namespace=namespace)
+
+  def incr(self, key, delta=1, namespace=None, initial_value=None):
+    return self.offset_multi({key: delta}, namespace=namespace,
+                             initial_value=initial_value).get(key)
+
+  def decr(self, key, delta=1, namespace=None, initial_value=None):
+    return self.offset_multi({key: -delta}, namespace=namespace,
+                             initial_value=initial_value).get(key)
+
+  def offset_multi(self, mapping, key_prefix="", namespace=None,
+                   initial_value=None):
+    for key in mapping:
+      self.cache.delete(self._get_local_key(key, key_prefix, namespace))
+    return self.client.offset_multi(mapping, key_prefix=key_prefix,
+                                    namespace=namespace,
+                                    initial_value=initial_value)
+
+  def flush_all(self):
+    self.cache.clear()
+    return self.client.flush_all()
+
+
+_local_cache = None
+
+
+def _get_local_cache(size):
+  global _local_cache  # pylint: disable=global-statement
+  if _local_cache is None or _local_cache.size != size:
+    _local_cache = LRUCache(size)
+  return _local_cache
+
+
+def get_client():
+  """Get a memcache client for the configured backend."""
+  backend = getattr(settings, "MEMCACHE_BACKEND", "appengine")
+  if backend == "appengine":
+    from google.appengine.api import memcache
+    client = memcache.Client()
+  elif backend == "memcached":
+    from ggrc.cache import memcached
+    client = memcached.Client(
+        getattr(settings, "MEMCACHE_SERVERS", ["127.0.0.1:11211"]),
+        pool_size=getattr(settings, "MEMCACHE_POOL_SIZE", 10),
+        timeout=getattr(settings, "MEMCACHE_TIMEOUT", 1.0),
+    )
+  else:
+    raise ValueError("Unknown memcache backend: {}".format(backend))
+
+  local_size = getattr(settings, "MEMCACHE_LOCAL_SIZE", 0)
+  if local_size > 0:
+    client = TieredClient(client, _get_local_cache(local_size),
+                          getattr(settings, "MEMCACHE_LOCAL_TTL", 5))
+  return client
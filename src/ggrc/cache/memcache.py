@@ -2,14 +2,15 @@
 # Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
 
 
-from google.appengine.api import memcache
+from backends import get_client
 from cache import Cache
 from cache import all_cache_entries
 from collections import OrderedDict
 from copy import deepcopy
 
 """
-    Memcache implements the remote AppEngine Memcache mechanism
+    Memcache implements the remote Memcache mechanism, using the client
+    selected by MEMCACHE_BACKEND (see ggrc.cache.backends)
 
 """
 class MemCache(Cache):
@@ -20,7 +21,7 @@ class MemCache(Cache):
     for cache_entry in all_cache_entries():
       if cache_entry.cache_type is self.name:
         self.supported_resources[cache_entry.model_plural]=cache_entry.class_name
-        self.memcache_client = memcache.Client()
+    self.memcache_client = get_client()
 
   def get_name(self):
     return self.name
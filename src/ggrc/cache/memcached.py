@@ -0,0 +1,446 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Memcached client for deployments without the App Engine memcache service.
+
+The client talks the memcached binary protocol and implements the subset of
+the `google.appengine.api.memcache.Client` API that GGRC uses, so it can be
+used in place of the App Engine client, see ggrc.cache.backends.
+
+Multi key operations are sent as pipelined quiet requests terminated by a
+NOOP, which gives one round trip per server for every PIPELINE_SIZE keys.
+Keys are distributed over the servers by the crc32 of the key. Connections
+are pooled per server and shared by all clients of the process. Like the App
+Engine client, the client does not raise on network errors, it logs them and
+reports the affected keys as missing or not stored.
+"""
+
+import collections
+import contextlib
+import cPickle
+import hashlib
+import logging
+import socket
+import struct
+import threading
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+REQUEST_MAGIC = 0x80
+RESPONSE_MAGIC = 0x81
+
+HEADER = struct.Struct("!BBHBBHIIQ")
+FLAGS = struct.Struct("!I")
+STORE_EXTRAS = struct.Struct("!II")
+COUNTER_EXTRAS = struct.Struct("!QQI")
+COUNTER = struct.Struct("!Q")
+
+OP_GET = 0x00
+OP_SET = 0x01
+OP_ADD = 0x02
+OP_DELETE = 0x04
+OP_INCREMENT = 0x05
+OP_DECREMENT = 0x06
+OP_FLUSH = 0x08
+OP_NOOP = 0x0a
+OP_GETKQ = 0x0d
+OP_SETQ = 0x11
+OP_ADDQ = 0x12
+OP_DELETEQ = 0x14
+
+STATUS_OK = 0x00
+STATUS_KEY_NOT_FOUND = 0x01
+
+FLAG_PICKLE = 1
+FLAG_INTEGER = 2
+
+# Expiration of counter operations that must fail for missing keys.
+NO_INITIAL_VALUE = 0xffffffff
+
+MAX_KEY_LENGTH = 250
+
+# Number of pipelined requests sent to a server before reading responses.
+PIPELINE_SIZE = 100
+
+# Return values of `delete`, same as in the App Engine memcache API.
+DELETE_NETWORK_FAILURE = 0
+DELETE_ITEM_MISSING = 1
+DELETE_SUCCESSFUL = 2
+
+Request = collections.namedtuple(
+    "Request", "opcode key extras value cas")
+Response = collections.namedtuple(
+    "Response", "opcode status opaque cas extras key value")
+
+
+class ProtocolError(Exception):
+  pass
+
+
+class _Connection(object):
+  """Buffered connection to a memcached server."""
+
+  def __init__(self, address, timeout):
+    self.socket = socket.create_connection(address, timeout)
+    self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self.buffer = ""
+
+  def send(self, data):
+    self.socket.sendall(data)
+
+  def _read(self, size):
+    """Read exactly size bytes."""
+    chunks = [self.buffer]
+    length = len(self.buffer)
+    while length < size:
+      chunk = self.socket.recv(max(size - length, 65536))
+      if not chunk:
+        raise socket.error("Connection closed by the server")
+      chunks.append(chunk)
+      length += len(chunk)
+    data = "".join(chunks)
+    self.buffer = data[size:]
+    return data[:size]
+
+  def read_response(self):
+    """Read a single response packet."""
+    (magic, opcode, key_length, extras_length, _, status, body_length,
+     opaque, cas) = HEADER.unpack(self._read(HEADER.size))
+    if magic != RESPONSE_MAGIC:
+      raise ProtocolError("Invalid response magic {:#x}".format(magic))
+    body = self._read(body_length)
+    value_start = extras_length + key_length
+    return Response(opcode, status, opaque, cas, body[:extras_length],
+                    body[extras_length:value_start], body[value_start:])
+
+  def close(self):
+    try:
+      self.socket.close()
+    except socket.error:
+      pass
+
+
+class _Pool(object):
+  """Pool of idle connections to a single server."""
+
+  def __init__(self, address, size, timeout):
+    self.address = address
+    self.size = size
+    self.timeout = timeout
+    self._idle = []
+    self._lock = threading.Lock()
+
+  @contextlib.contextmanager
+  def connection(self):
+    """Get a connection that is returned to the pool if no error occurs."""
+    with self._lock:
+      conn = self._idle.pop() if self._idle else None
+    if conn is None:
+      conn = _Connection(self.address, self.timeout)
+    try:
+      yield conn
+    except Exception:
+      conn.close()
+      raise
+    with self._lock:
+      if len(self._idle) < self.size:
+        self._idle.append(conn)
+        return
+    conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(server, size, timeout):
+  """Get the shared connection pool of a "host:port" server."""
+  with _pools_lock:
+    if server not in _pools:
+      host, _, port = server.rpartition(":")
+      _pools[server] = _Pool((host, int(port)), size, timeout)
+    return _pools[server]
+
+
+def _encode_key(key):
+  """Get a key that memcached accepts."""
+  if isinstance(key, unicode):
+    key = key.encode("utf-8")
+  else:
+    key = str(key)
+  if len(key) > MAX_KEY_LENGTH:
+    key = "sha1:" + hashlib.sha1(key).hexdigest()
+  return key
+
+
+def _serialize(value):
+  """Get flags and bytes of a value."""
+  if isinstance(value, str):
+    return 0, value
+  if type(value) in (int, long):  # pylint: disable=unidiomatic-typecheck
+    return FLAG_INTEGER, str(value)
+  return FLAG_PICKLE, cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(flags, data):
+  if flags & FLAG_PICKLE:
+    return cPickle.loads(data)
+  if flags & FLAG_INTEGER:
+    return int(data)
+  return data
+
+
+def _pack(request, opaque):
+  body_length = len(request.extras) + len(request.key) + len(request.value)
+  return "".join((
+      HEADER.pack(REQUEST_MAGIC, request.opcode, len(request.key),
+                  len(request.extras), 0, 0, body_length, opaque,
+                  request.cas),
+      request.extras,
+      request.key,
+      request.value,
+  ))
+
+
+class Client(object):
+  """Memcached client with the App Engine memcache client API.
+
+  Args:
+    servers: list of "host:port" strings.
+    pool_size: number of idle connections kept for each server.
+    timeout: socket timeout in seconds.
+  """
+
+  def __init__(self, servers, pool_size=10, timeout=1.0):
+    if not servers:
+      raise ValueError("At least one memcached server is required")
+    self._pools = [_get_pool(server, pool_size, timeout)
+                   for server in servers]
+    self._cas_ids = {}
+
+  def _get_pool_index(self, key):
+    return (zlib.crc32(key) & 0xffffffff) % len(self._pools)
+
+  def _execute(self, requests):
+    """Send requests in pipelines and collect their responses.
+
+    Returns:
+      tuple of a dict of request index -> response for requests that got a
+      response and a set of indexes of requests that failed on network
+      errors.
+    """
+    by_pool = collections.defaultdict(list)
+    for index, request in enumerate(requests):
+      by_pool[self._get_pool_index(request.key)].append(index)
+
+    responses = {}
+    failed = set()
+    for pool_index, indexes in by_pool.iteritems():
+      pool = self._pools[pool_index]
+      try:
+        with pool.connection() as conn:
+          for start in range(0, len(indexes), PIPELINE_SIZE):
+            batch = indexes[start:start + PIPELINE_SIZE]
+            conn.send("".join(
+                [_pack(requests[index], index) for index in batch] +
+                [_pack(Request(OP_NOOP, "", "", "", 0), len(requests))]))
+            while True:
+              response = conn.read_response()
+              if response.opcode == OP_NOOP:
+                break
+              responses[response.opaque] = response
+      except (socket.error, ProtocolError) as error:
+        logger.warning("Memcached server %s:%s failed: %s",
+                       pool.address[0], pool.address[1], error)
+        failed.update(index for index in indexes if index not in responses)
+    return responses, failed
+
+  def get(self, key, namespace=None, for_cas=False):
+    return self.get_multi([key], namespace=namespace, for_cas=for_cas).get(key)
+
+  def gets(self, key, namespace=None):
+    return self.get(key, namespace=namespace, for_cas=True)
+
+  def get_multi(self, keys, key_prefix="", namespace=None, for_cas=False):
+    """Get values of keys that are present in the cache.
+
+    Returns:
+      dict of key -> value for keys that were found.
+    """
+    if namespace:
+      key_prefix = "{}:{}".format(namespace, key_prefix)
+    encoded = collections.OrderedDict(
+        (_encode_key(key_prefix + key), key) for key in keys)
+    responses, _ = self._execute([Request(OP_GETKQ, key, "", "", 0)
+                                  for key in encoded])
+    result = {}
+    for response in responses.itervalues():
+      if response.status != STATUS_OK:
+        continue
+      key = encoded[response.key]
+      flags, = FLAGS.unpack(response.extras)
+      result[key] = _deserialize(flags, response.value)
+      if for_cas:
+        self._cas_ids[response.key] = response.cas
+    return result
+
+  def _store_multi(self, opcode, mapping, time, key_prefix, namespace,
+                   cas=False):
+    """Store values and get keys that were not stored."""
+    if namespace:
+      key_prefix = "{}:{}".format(namespace, key_prefix)
+    keys = []
+    requests = []
+    not_stored = []
+    for key, value in mapping.iteritems():
+      encoded_key = _encode_key(key_prefix + key)
+      cas_id = 0
+      if cas:
+        cas_id = self._cas_ids.pop(encoded_key, None)
+        if cas_id is None:
+          not_stored.append(key)
+          continue
+      flags, data = _serialize(value)
+      keys.append(key)
+      requests.append(Request(opcode, encoded_key,
+                              STORE_EXTRAS.pack(flags, int(time)), data,
+                              cas_id))
+    responses, failed = self._execute(requests)
+    not_stored.extend(
+        keys[index] for index in range(len(requests))
+        if index in failed or (index in responses and
+                               responses[index].status != STATUS_OK))
+    return not_stored
+
+  def set(self, key, value, time=0, namespace=None):
+    return not self.set_multi({key: value}, time, namespace=namespace)
+
+  def set_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    """Set values of keys.
+
+    Returns:
+      list of keys that were not set.
+    """
+    return self._store_multi(OP_SETQ, mapping, time, key_prefix, namespace)
+
+  def add(self, key, value, time=0, namespace=None):
+    return not self.add_multi({key: value}, time, namespace=namespace)
+
+  def add_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    """Set values of keys that are not present in the cache.
+
+    Returns:
+      list of keys that were not added.
+    """
+    return self._store_multi(OP_ADDQ, mapping, time, key_prefix, namespace)
+
+  def cas(self, key, value, time=0, namespace=None):
+    return not self.cas_multi({key: value}, time, namespace=namespace)
+
+  def cas_multi(self, mapping, time=0, key_prefix="", namespace=None):
+    """Set values of keys that were not changed since they were read with
+    `gets` or `get_multi(..., for_cas=True)`.
+
+    Returns:
+      list of keys that were not set.
+    """
+    return self._store_multi(OP_SETQ, mapping, time, key_prefix, namespace,
+                             cas=True)
+
+  def delete(self, key, seconds=0, namespace=None):
+    """Delete a key.
+
+    The `seconds` lock of the App Engine API is not supported by memcached
+    and is ignored.
+
+    Returns:
+      DELETE_SUCCESSFUL, DELETE_ITEM_MISSING or DELETE_NETWORK_FAILURE.
+    """
+    # pylint: disable=unused-argument
+    if namespace:
+      key = "{}:{}".format(namespace, key)
+    responses, failed = self._execute([
+        Request(OP_DELETE, _encode_key(key), "", "", 0)])
+    if failed or 0 not in responses:
+      return DELETE_NETWORK_FAILURE
+    if responses[0].status == STATUS_OK:
+      return DELETE_SUCCESSFUL
+    if responses[0].status == STATUS_KEY_NOT_FOUND:
+      return DELETE_ITEM_MISSING
+    return DELETE_NETWORK_FAILURE
+
+  def delete_multi(self, keys, seconds=0, key_prefix="", namespace=None):
+    """Delete keys.
+
+    Returns:
+      True if all keys were deleted or missing, False on network errors.
+    """
+    # pylint: disable=unused-argument
+    if namespace:
+      key_prefix = "{}:{}".format(namespace, key_prefix)
+    responses, failed = self._execute([
+        Request(OP_DELETEQ, _encode_key(key_prefix + key), "", "", 0)
+        for key in keys])
+    return not failed and all(
+        response.status in (STATUS_OK, STATUS_KEY_NOT_FOUND)
+        for response in responses.itervalues())
+
+  def incr(self, key, delta=1, namespace=None, initial_value=None):
+    return self.offset_multi({key: delta}, namespace=namespace,
+                             initial_value=initial_value).get(key)
+
+  def decr(self, key, delta=1, namespace=None, initial_value=None):
+    return self.offset_multi({key: -delta}, namespace=namespace,
+                             initial_value=initial_value).get(key)
+
+  def offset_multi(self, mapping, key_prefix="", namespace=None,
+                   initial_value=None):
+    """Increment or decrement counters.
+
+    Args:
+      mapping: dict of key -> delta, negative deltas decrement the counter.
+      initial_value: value of missing counters before the delta is applied,
+        counters are not created if it is None.
+
+    Returns:
+      dict of key -> new value or None if the counter was not changed.
+    """
+    if namespace:
+      key_prefix = "{}:{}".format(namespace, key_prefix)
+    keys = mapping.keys()
+    requests = []
+    for key in keys:
+      delta = mapping[key]
+      opcode = OP_INCREMENT if delta >= 0 else OP_DECREMENT
+      if initial_value is None:
+        extras = COUNTER_EXTRAS.pack(abs(delta), 0, NO_INITIAL_VALUE)
+      else:
+        initial = max(initial_value + delta, 0)
+        extras = COUNTER_EXTRAS.pack(abs(delta), initial, 0)
+      requests.append(Request(opcode, _encode_key(key_prefix + key),
+                              extras, "", 0))
+    responses, _ = self._execute(requests)
+    result = {}
+    for index, key in enumerate(keys):
+      response = responses.get(index)
+      if response is None or response.status != STATUS_OK:
+        result[key] = None
+      else:
+        result[key], = COUNTER.unpack(response.value)
+    return result
+
+  def flush_all(self):
+    """Delete all keys on all servers."""
+    success = True
+    for pool in self._pools:
+      try:
+        with pool.connection() as conn:
+          conn.send(_pack(Request(OP_FLUSH, "", "", "", 0), 0))
+          success &= conn.read_response().status == STATUS_OK
+      except (socket.error, ProtocolError) as error:
+        logger.warning("Memcached server %s:%s failed: %s",
+                       pool.address[0], pool.address[1], error)
+        success = False
+    return success
@@ -0,0 +1,218 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Process local cache for values computed from read-mostly metadata.
+
+Values such as published custom attribute definitions are kept in memory of
+the process together with versions of the metadata regions they depend on.
+Commits that change models from MODEL_REGIONS increment the versions of
+their regions. The versions are shared through memcache, so a commit in one
+process invalidates the values cached by all processes. Without
+MEMCACHE_MECHANISM there are no shared versions and values that depend on
+metadata regions are only reused within a single request. Values that do not
+depend on any region are computed once per process.
+
+Versions are read once per request. Until the changes are committed, values
+of regions changed in the current transaction are computed without the cache.
+
+Hit and miss counters of every cached value name are returned by get_stats.
+"""
+
+import collections
+import copy
+import itertools
+import threading
+import time
+
+import flask
+from sqlalchemy import event
+
+from ggrc import db
+from ggrc import settings
+from ggrc.cache.backends import add_shared_prefix
+from ggrc.cache.backends import get_client
+from ggrc.utils.structures import LRUCache
+
+
+MODEL_REGIONS = {
+    "CustomAttributeDefinition": "custom_attributes",
+    "Role": "roles",
+    "Option": "options",
+}
+
+CACHE_SIZE = 1000
+
+# Version keys are incremented by other processes, so they are never kept in
+# the local memcache tier.
+VERSION_KEY = "metadata:version:{}"
+add_shared_prefix(VERSION_KEY.format(""))
+
+# flask.g attribute with versions read in the current request.
+VERSIONS_KEY = "metadata_versions"
+
+# flask.g attribute with values cached for the current request only.
+REQUEST_CACHE_KEY = "metadata_request_cache"
+
+SESSION_INFO_KEY = "metadata_regions"
+
+_entries = LRUCache(CACHE_SIZE)
+_local_versions = itertools.count()
+_lock = threading.Lock()
+_stats = collections.defaultdict(lambda: {"hits": 0, "misses": 0})
+
+
+def _count(name, counter):
+  with _lock:
+    _stats[name][counter] += 1
+
+
+def get_stats():
+  """Get hit and miss counters of cached values of this process."""
+  with _lock:
+    return {name: dict(counters) for name, counters in _stats.iteritems()}
+
+
+def reset_stats():
+  with _lock:
+    _stats.clear()
+
+
+def _initial_version():
+  """Get a version for a missing version key.
+
+  Versions start at the current time, so a version key that was evicted from
+  memcache never gets a version that a cached value already has.
+  """
+  return int(time.time() * 1000000)
+
+
+def _get_shared_versions(regions):
+  """Get versions of regions from memcache, creating missing keys."""
+  if not getattr(settings, "MEMCACHE_MECHANISM", False):
+    return {}
+  client = get_client()
+  keys = {VERSION_KEY.format(region): region for region in regions}
+  versions = client.get_multi(keys.keys())
+  missing = {key: _initial_version() for key in keys if key not in versions}
+  if missing:
+    client.add_multi(missing)
+    versions.update(client.get_multi(missing.keys()))
+  return {keys[key]: version for key, version in versions.iteritems()}
+
+
+def _get_versions(regions):
+  """Get versions of regions for the current request.
+
+  Regions without a shared version get a version that is unique to the
+  request, so values that depend on them are not reused by other requests.
+  """
+  versions = getattr(flask.g, VERSIONS_KEY, None)
+  if versions is None:
+    versions = {}
+    setattr(flask.g, VERSIONS_KEY, versions)
+  missing = [region for region in regions if region not in versions]
+  if missing:
+    versions.update(_get_shared_versions(missing))
+    for region in missing:
+      if versions.get(region) is None:
+        versions[region] = ("local", next(_local_versions))
+  return tuple(versions[region] for region in regions)
+
+
+def _has_pending_changes(regions):
+  pending = db.session.info.get(SESSION_INFO_KEY)
+  return bool(pending and pending.intersection(regions))
+
+
+def get(name, key, regions, compute, copy_value=True):
+  """Get a cached value or compute and cache it.
+
+  Args:
+    name: name of the cached value used for stats.
+    key: hashable arguments the value is computed from.
+    regions: names of metadata regions the value depends on.
+    compute: function without arguments that computes the value.
+    copy_value: return copies of cached values, so the callers can modify
+      them.
+
+  Returns:
+    the cached or computed value.
+  """
+  if not flask.has_app_context() or _has_pending_changes(regions):
+    return compute()
+  versions = _get_versions(regions)
+  entry = _entries.get((name, key))
+  if entry is not None and entry[0] == versions:
+    _count(name, "hits")
+    value = entry[1]
+    return copy.deepcopy(value) if copy_value else value
+  _count(name, "misses")
+  value = compute()
+  _entries.set((name, key), (
+      versions, copy.deepcopy(value) if copy_value else value))
+  return value
+
+
+def get_for_request(name, key, compute):
+  """Get a value that is computed at most once per request."""
+  if not flask.has_app_context():
+    return compute()
+  values = getattr(flask.g, REQUEST_CACHE_KEY, None)
+  if values is None:
+    values = {}
+    setattr(flask.g, REQUEST_CACHE_KEY, values)
+  if (name, key) in values:
+    _count(name, "hits")
+  else:
+    _count(name, "misses")
+    values[(name, key)] = compute()
+  return values[(name, key)]
+
+
+def clear():
+  """Drop all values cached in this process."""
+  _entries.clear()
+
+
+def _collect_regions(session, _):
+  """Collect metadata regions changed by flushed objects."""
+  regions = {
+      MODEL_REGIONS[obj.__class__.__name__]
+      for obj in itertools.chain(session.new, session.dirty, session.deleted)
+      if obj.__class__.__name__ in MODEL_REGIONS
+  }
+  if regions:
+    session.info.setdefault(SESSION_INFO_KEY, set()).update(regions)
+
+
+def _after_commit(session):
+  """Increment versions of regions changed in the committed transaction.
+
+  Values cached for the current request are dropped on every commit, since
+  the commit can change the permissions they were computed with.
+  """
+  if flask.has_app_context() and hasattr(flask.g, REQUEST_CACHE_KEY):
+    delattr(flask.g, REQUEST_CACHE_KEY)
+  regions = session.info.pop(SESSION_INFO_KEY, None)
+  if not regions:
+    return
+  if flask.has_app_context():
+    versions = getattr(flask.g, VERSIONS_KEY, {})
+    for region in regions:
+      versions.pop(region, None)
+  if getattr(settings, "MEMCACHE_MECHANISM", False):
+    get_client().offset_multi(
+        {VERSION_KEY.format(region): 1 for region in regions},
+        initial_value=_initial_version())
+
+
+def _discard_regions(session):
+  session.info.pop(SESSION_INFO_KEY, None)
+
+
+def register_listeners():
+  """Register session listeners that invalidate cached metadata."""
+  session_class = db.session.__class__
+  event.listen(session_class, "after_flush", _collect_regions)
+  event.listen(session_class, "after_commit", _after_commit)
+  event.listen(session_class, "after_rollback", _discard_regions)
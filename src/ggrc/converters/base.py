@@ -12,6 +12,7 @@ from ggrc.cache.memcache import MemCache
 from ggrc.converters import get_exportables
 from ggrc.converters.base_block import BlockConverter
 from ggrc.converters.import_helper import extract_relevant_data
+from ggrc.converters.import_helper import generate_csv_chunks
 from ggrc.converters.import_helper import split_array
 from ggrc.fulltext import get_indexer
 
@@ -71,6 +72,33 @@ class Converter(object):
     with benchmark("Make block array"):
       return self.to_block_array()
 
+  def to_csv_chunks(self):
+    """Generate csv file string for export in chunks.
+
+    Unlike to_array, objects are loaded and converted one chunk of ids at a
+    time and each chunk is turned into a csv string as soon as it is ready,
+    so the whole export is never held in memory.
+    """
+    with benchmark("Create block converters"):
+      self.block_converters_from_ids(load_rows=False)
+    width = max([len(b.fields) for b in self.block_converters] or [0]) + 1
+    return generate_csv_chunks(self.generate_block_array_chunks(), width)
+
+  def generate_block_array_chunks(self):
+    """Generate 2d array chunks with the same layout as to_block_array."""
+    for block_converter in self.block_converters:
+      csv_header = block_converter.generate_csv_header()
+      for line in csv_header:
+        line.insert(0, "")
+      csv_header[0][0] = "Object type"
+      csv_header[1][0] = block_converter.name
+      yield csv_header
+      for csv_body in block_converter.generate_csv_body_chunks():
+        for line in csv_body:
+          line.insert(0, "")
+        yield csv_body
+      yield [[""], [""]]
+
   def to_block_array(self):
     """ exporting each in it's own block separated by empty lines
 
@@ -110,10 +138,14 @@ class Converter(object):
     for converter in self.block_converters:
       converter.row_converters_from_csv()
 
-  def block_converters_from_ids(self):
+  def block_converters_from_ids(self, load_rows=True):
     """ fill the block_converters class variable
 
     Generate block converters from a list of tuples with an object name and ids
+
+    Args:
+      load_rows (bool): create row converters for all objects right away.
+        Chunked exports skip this and load rows in generate_csv_body_chunks.
     """
     object_map = {o.__name__: o for o in self.exportable.values()}
     for object_data in self.ids_by_type:
@@ -125,7 +157,8 @@ class Converter(object):
                                        fields=fields, object_ids=object_ids,
                                        class_name=class_name)
       block_converter.check_block_restrictions()
-      block_converter.row_converters_from_ids()
+      if load_rows:
+        block_converter.row_converters_from_ids()
       self.block_converters.append(block_converter)
 
   def block_converters_from_csv(self):
@@ -19,8 +19,12 @@ from sqlalchemy.orm.exc import UnmappedInstanceError
 
 from ggrc import db
 from ggrc import models
+from ggrc.automapper import get_automapper
+from ggrc.models.reflection import SanitizeHtmlInfo
 from ggrc.rbac import permissions
 from ggrc.utils import benchmark
+from ggrc.utils import html_cleaner
+from ggrc.utils import list_chunks
 from ggrc.utils import structures
 from ggrc.converters import errors
 from ggrc.converters import get_shared_unique_rules
@@ -43,6 +47,8 @@ logger = getLogger(__name__)
 
 CACHE_EXPIRY_IMPORT = 600
 
+EXPORT_CHUNK_SIZE = 500
+
 
 class BlockConverter(object):
   # pylint: disable=too-many-public-methods
@@ -100,6 +106,10 @@ class BlockConverter(object):
     self._roles_cache = None
     self._user_roles_cache = None
     self._ca_definitions_cache = None
+    self._chunk_ids = None
+    self._key_cache = {}
+    self._prefetched_columns = set()
+    self._options_cache = None
     self.converter = converter
     self.offset = options.get("offset", 0)
     self.object_class = options.get("object_class")
@@ -177,7 +187,8 @@ class BlockConverter(object):
     relationship = models.Relationship
     with benchmark("Fetch all block relationships"):
       relationships = []
-      if self.object_ids:
+      object_ids = self._get_current_object_ids()
+      if object_ids:
         relationships = db.session.query(
             relationship.source_id,
             relationship.source_type,
@@ -186,11 +197,11 @@ class BlockConverter(object):
         ).filter(or_(
             and_(
                 relationship.source_type == self.object_class.__name__,
-                relationship.source_id.in_(self.object_ids),
+                relationship.source_id.in_(object_ids),
             ),
             and_(
                 relationship.destination_type == self.object_class.__name__,
-                relationship.destination_id.in_(self.object_ids),
+                relationship.destination_id.in_(object_ids),
             )
         )).all()
       return relationships
@@ -241,6 +252,96 @@ class BlockConverter(object):
       self._mapping_cache = self._create_mapping_cache()
     return self._mapping_cache
 
+  def _get_column_values(self, column):
+    """Get all distinct values from a column in the current block.
+
+    Multi line cells, such as mapping and owner columns, are split into
+    separate values.
+    """
+    try:
+      index = self.headers.keys().index(column)
+    except ValueError:
+      return set()
+    values = set()
+    for row in self.rows:
+      if len(row) <= index:
+        continue
+      for line in row[index].splitlines():
+        line = line.strip()
+        if line:
+          values.add(line)
+    return values
+
+  def _prefetch_objects(self, model, key, values):
+    """Load all objects with the given key values into the key cache.
+
+    Values that have already been looked up are skipped, and values without
+    matching objects are cached as well, so each value is queried only once.
+
+    Returns:
+      case insensitive dict with a list of matching objects for each value.
+    """
+    cache = self._key_cache.setdefault(
+        (model, key), structures.CaseInsensitiveDict())
+    values = [value for value in values if value not in cache]
+    for value in values:
+      cache[value] = []
+    column = getattr(model, key)
+    for values_chunk in list_chunks(values):
+      for obj in model.query.filter(column.in_(values_chunk)):
+        obj_value = getattr(obj, key)
+        if obj_value not in cache:
+          cache[obj_value] = []
+        cache[obj_value].append(obj)
+    return cache
+
+  def find_objects(self, model, key, value, column=None):
+    """Find all objects of a given model by a key such as slug or email.
+
+    The first lookup coming from a column loads objects for all values in
+    that column with a few IN queries, so rows are served from the cache
+    instead of issuing a query per cell.
+
+    Args:
+      model (db.Model): model of the objects we are looking for.
+      key (str): name of the model attribute that holds the value.
+      value: value of the key attribute.
+      column (str): header key of the column that references the objects.
+
+    Returns:
+      list of objects with the given key value.
+    """
+    if not value:
+      return []
+    if column is not None and \
+       (model, key, column) not in self._prefetched_columns:
+      self._prefetched_columns.add((model, key, column))
+      with benchmark("Prefetch {} by {}".format(model.__name__, key)):
+        self._prefetch_objects(model, key, self._get_column_values(column))
+    cache = self._key_cache.get((model, key))
+    if cache is None or value not in cache:
+      cache = self._prefetch_objects(model, key, [value])
+    return cache[value]
+
+  def find_object(self, model, key, value, column=None):
+    """Find the first object of a given model by a key.
+
+    See find_objects for details.
+    """
+    objects = self.find_objects(model, key, value, column)
+    return objects[0] if objects else None
+
+  def get_options_cache(self):
+    """Get all options indexed by role and lower case title."""
+    if self._options_cache is None:
+      self._options_cache = {}
+      for option in models.Option.query.order_by(models.Option.id):
+        if option.title is None:
+          continue
+        key = (option.role, option.title.lower())
+        self._options_cache.setdefault(key, option)
+    return self._options_cache
+
   def get_role(self, name):
     """Get role from local cache for a given name."""
     if not self._roles_cache:
@@ -338,6 +439,34 @@ class BlockConverter(object):
     """ Generate 2D array populated with object values """
     return [r.to_array(self.fields) for r in self.row_converters]
 
+  def generate_csv_body_chunks(self, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generate 2D arrays populated with object values, one id chunk at a time.
+
+    Only the objects, row converters and caches for a single chunk of ids are
+    held at once, so memory usage does not grow with the number of exported
+    objects.
+
+    Args:
+      chunk_size (int): number of objects loaded per chunk.
+
+    Yields:
+      2D array of csv cell values for each chunk of objects.
+    """
+    if self.ignore or not self.object_ids:
+      return
+    try:
+      for chunk_ids in list_chunks(sorted(self.object_ids), chunk_size):
+        self._chunk_ids = chunk_ids
+        self._reset_row_caches()
+        self.row_converters_from_ids()
+        for row_converter in self.row_converters:
+          row_converter.handle_row_data()
+        yield self.generate_csv_body()
+    finally:
+      self._chunk_ids = None
+      self._reset_row_caches()
+      self.row_converters = []
+
   def to_array(self):
     csv_header = self.generate_csv_header()
     csv_body = self.generate_csv_body()
@@ -401,13 +530,29 @@ class BlockConverter(object):
                          headers=self.headers, index=i)
       self.row_converters.append(row)
 
+  def _get_current_object_ids(self):
+    """Get ids of objects for which the row converters are built.
+
+    When exporting in chunks this is only the current chunk of ids.
+    """
+    if self._chunk_ids is not None:
+      return self._chunk_ids
+    return self.object_ids
+
+  def _reset_row_caches(self):
+    """Drop caches that are built for the current row converters."""
+    self._mapping_cache = None
+    self._owners_cache = None
+    self._user_roles_cache = None
+
   def row_converters_from_ids(self):
     """ Generate a row converter object for every csv row """
-    if self.ignore or not self.object_ids:
+    object_ids = self._get_current_object_ids()
+    if self.ignore or not object_ids:
       return
     self.row_converters = []
     objects = self.object_class.eager_query().filter(
-        self.object_class.id.in_(self.object_ids)).all()
+        self.object_class.id.in_(object_ids)).all()
     for i, obj in enumerate(objects):
       row = RowConverter(self, self.object_class, obj=obj,
                          headers=self.headers, index=i)
@@ -480,10 +625,21 @@ class BlockConverter(object):
           row_converter.add_error(errors.UNKNOWN_ERROR)
       self.save_import()
 
+  def _get_sanitized_values(self):
+    """Get all values that will be assigned to sanitized attributes."""
+    # pylint: disable=protected-access
+    sanitized_attrs = set(SanitizeHtmlInfo(self.object_class)._sanitize_html)
+    return [item_handler.value
+            for row_converter in self.row_converters
+            if not row_converter.ignore
+            for key, item_handler in row_converter.attrs.items()
+            if key in sanitized_attrs]
+
   def _import_objects_prepare(self):
     """Setup all objects and do pre-commit checks for them."""
-    for row_converter in self.row_converters:
-      row_converter.setup_object()
+    with html_cleaner.precleaned(self._get_sanitized_values()):
+      for row_converter in self.row_converters:
+        row_converter.setup_object()
 
     for row_converter in self.row_converters:
       self._check_object(row_converter)
@@ -553,6 +709,7 @@ class BlockConverter(object):
   def save_import(self):
     """Commit all changes in the session and update memcache."""
     try:
+      get_automapper().generate_pending()
       modified_objects = get_modified_objects(db.session)
       import_event = log_event(db.session, None)
       update_memcache_before_commit(
@@ -8,10 +8,9 @@ from datetime import date
 from dateutil.parser import parse
 
 from sqlalchemy import and_
-from sqlalchemy import or_
 
 from ggrc import db
-from ggrc.automapper import AutomapperGenerator
+from ggrc.automapper import get_automapper
 from ggrc.converters import errors
 from ggrc.converters import get_exportables
 from ggrc.login import get_current_user
@@ -19,7 +18,6 @@ from ggrc.models import CategoryBase
 from ggrc.models import Contract
 from ggrc.models import Assessment
 from ggrc.models import ObjectPerson
-from ggrc.models import Option
 from ggrc.models import Person
 from ggrc.models import Policy
 from ggrc.models import Program
@@ -70,10 +68,11 @@ class ColumnHandler(object):
       return
     if not self.row_converter.obj:
       return
-    nr_duplicates = self.row_converter.object_class.query.filter(and_(
-        getattr(self.row_converter.object_class, self.key) == self.value,
-        self.row_converter.object_class.id != self.row_converter.obj.id
-    )).count()
+    obj_id = self.row_converter.obj.id
+    objects = self.row_converter.block_converter.find_objects(
+        self.row_converter.object_class, self.key, self.value, self.key)
+    nr_duplicates = len([obj for obj in objects
+                         if obj_id is None or obj.id != obj_id])
     if nr_duplicates > 0:
       self.add_error(errors.DUPLICATE_VALUE,
                      column_name=self.key,
@@ -237,7 +236,9 @@ class UserColumnHandler(ColumnHandler):
   def get_person(self, email):
     new_objects = self.row_converter.block_converter.converter.new_objects
     if email not in new_objects[Person]:
-      new_objects[Person][email] = Person.query.filter_by(email=email).first()
+      new_objects[Person][email] = \
+          self.row_converter.block_converter.find_object(
+              Person, "email", email, self.key)
     return new_objects[Person].get(email)
 
   def parse_item(self):
@@ -437,8 +438,9 @@ class MappingColumnHandler(ColumnHandler):
     lines = set(self.raw_value.splitlines())
     slugs = set([slug.lower() for slug in lines if slug.strip()])
     objects = []
+    block_converter = self.row_converter.block_converter
     for slug in slugs:
-      obj = class_.query.filter_by(slug=slug).first()
+      obj = block_converter.find_object(class_, "slug", slug, self.key)
       if obj:
         if permissions.is_allowed_update_for(obj):
           objects.append(obj)
@@ -480,12 +482,9 @@ class MappingColumnHandler(ColumnHandler):
       elif self.unmap and mapping:
         db.session.delete(mapping)
     db.session.flush()
-    # it is safe to reuse this automapper since no other objects will be
-    # created while creating automappings and cache reuse yields significant
-    # performance boost
-    automapper = AutomapperGenerator(use_benchmark=False)
-    for relation in relationships:
-      automapper.generate_automappings(relation)
+    # automappings for all rows of the block are generated in one batch
+    # before the block is saved
+    get_automapper().queue_relationships(relationships)
     self.dry_run = True
 
   def get_value(self):
@@ -530,10 +529,9 @@ class OptionColumnHandler(ColumnHandler):
       return None
     table_singular = self.row_converter.object_class._inflector.table_singular
     prefixed_key = "{}_{}".format(table_singular, self.key)
-    item = Option.query.filter(
-        and_(Option.title == self.raw_value.strip(),
-             or_(Option.role == self.key,
-                 Option.role == prefixed_key))).first()
+    options = self.row_converter.block_converter.get_options_cache()
+    title = self.raw_value.strip().lower()
+    item = options.get((self.key, title)) or options.get((prefixed_key, title))
 
     if not item:
       self.add_warning(errors.WRONG_VALUE, column_name=self.display_name)
@@ -566,7 +564,8 @@ class ParentColumnHandler(ColumnHandler):
     slug = self.raw_value
     obj = self.new_objects.get(self.parent, {}).get(slug)
     if obj is None:
-      obj = self.parent.query.filter(self.parent.slug == slug).first()
+      obj = self.row_converter.block_converter.find_object(
+          self.parent, "slug", slug, self.key)
     if obj is None:
       self.add_error(errors.UNKNOWN_OBJECT,
                      object_type=self.parent._inflector.human_singular.title(),
@@ -620,7 +619,8 @@ class SectionDirectiveColumnHandler(MappingColumnHandler):
   def get_directive_from_slug(self, directive_class, slug):
     if slug in self.new_objects[directive_class]:
       return self.new_objects[directive_class][slug]
-    return directive_class.query.filter_by(slug=slug).first()
+    return self.row_converter.block_converter.find_object(
+        directive_class, "slug", slug, self.key)
 
   def parse_item(self):
     """ get a directive from slug """
@@ -8,7 +8,7 @@ from cached_property import cached_property
 
 from ggrc import db
 from ggrc import models
-from ggrc.automapper import AutomapperGenerator
+from ggrc.automapper import get_automapper
 from ggrc.converters import errors
 from ggrc.converters.handlers.handlers import MappingColumnHandler
 
@@ -105,12 +105,9 @@ class SnapshotInstanceColumnHandler(MappingColumnHandler):
       elif self.unmap and mapping:
         db.session.delete(mapping)
     db.session.flush(relationships)
-    # it is safe to reuse this automapper since no other objects will be
-    # created while creating automappings and cache reuse yields significant
-    # performance boost
-    automapper = AutomapperGenerator(use_benchmark=False)
-    for relation in relationships:
-      automapper.generate_automappings(relation)
+    # automappings for all rows of the block are generated in one batch
+    # before the block is saved
+    get_automapper().queue_relationships(relationships)
     self.dry_run = True
 
   def get_value(self):
@@ -68,6 +68,26 @@ def generate_csv_string(csv_data):
   return body
 
 
+def generate_csv_chunks(csv_data_chunks, width):
+  """Turn chunks of 2d string arrays into chunks of a csv file string.
+
+  Args:
+    csv_data_chunks (iterable): iterable of 2d string arrays.
+    width (int): number of cells that every csv row is expanded to.
+
+  Yields:
+    csv file string for each chunk of csv data.
+  """
+  for csv_data in csv_data_chunks:
+    output_buffer = StringIO()
+    writer = csv.writer(output_buffer)
+    for row in utf_8_encode_array(csv_data):
+      row.extend([""] * (width - len(row)))
+      writer.writerow(row)
+    yield output_buffer.getvalue()
+    output_buffer.close()
+
+
 def extract_relevant_data(csv_data):
   """ Split csv data into data and metadata """
   striped_data = [[unicode.strip(c) for c in line]
@@ -26,7 +26,7 @@ from ggrc.models.custom_attribute_definition import CustomAttributeDefinition
 from ggrc.models.custom_attribute_value import CustomAttributeValue
 from ggrc.converters import get_exportables
 from ggrc.rbac import context_query_filter
-from ggrc.utils import query_helpers, benchmark, convert_date_format
+from ggrc.utils import query_helpers, benchmark, convert_date_format, keyset
 from ggrc_basic_permissions import UserRole
 
 
@@ -55,6 +55,9 @@ class QueryHelper(object):
         }
       ]
       limit: [from, to] - limit the result list to a slice result[from, to]
+      cursor: optional; use keyset pagination, null for the first page or
+              "next_cursor" of the previous page for the following pages.
+              The page size is to - from and the offset is ignored.
       filters: {
         relevant_filters:
           these filters will return all ids of the "search class name" object
@@ -302,14 +305,18 @@ class QueryHelper(object):
 
     return objects
 
-  def _get_ids(self, object_query):
-    """Get a set of ids of objects described in the filters."""
+  def _build_query(self, object_query):
+    """Get an unordered query for ids of objects described in the filters.
+
+    Returns:
+      query for object ids or None if the object query has no filters.
+    """
 
     object_name = object_query["object_name"]
     expression = object_query.get("filters", {}).get("expression")
 
     if expression is None:
-      return set()
+      return None
     object_class = self.object_map[object_name]
     query = db.session.query(object_class.id)
 
@@ -319,11 +326,11 @@ class QueryHelper(object):
       tgt_class = getattr(models.all_models, child_type, object_class)
 
     requested_permissions = object_query.get("permissions", "read")
-    with benchmark("Get permissions: _get_ids > _get_type_query"):
+    with benchmark("Get permissions: _build_query > _get_type_query"):
       type_query = self._get_type_query(object_class, requested_permissions)
       if type_query is not None:
         query = query.filter(type_query)
-    with benchmark("Parse filter query: _get_ids > _build_expression"):
+    with benchmark("Parse filter query: _build_query > _build_expression"):
       filter_expression = self._build_expression(
           expression,
           object_class,
@@ -331,41 +338,58 @@ class QueryHelper(object):
       )
       if filter_expression is not None:
         query = query.filter(filter_expression)
-    if object_query.get("order_by"):
-      with benchmark("Sorting: _get_ids > order_by"):
-        query = self._apply_order_by(
+    return query
+
+  @staticmethod
+  def _clear_similar_objects_query():
+    """Delete similar_objects_query after the object query is done.
+
+    This is for the case when several queries are POSTed in one request, the
+    first one filters by similarity and the second one doesn't but tries to
+    sort by __similarity__.
+    """
+    if hasattr(flask.g, "similar_objects_query"):
+      delattr(flask.g, "similar_objects_query")
+
+  def _get_ids(self, object_query):
+    """Get a set of ids of objects described in the filters."""
+
+    query = self._build_query(object_query)
+    if query is None:
+      return set()
+    object_class = self.object_map[object_query["object_name"]]
+    if "cursor" in object_query:
+      with benchmark("Apply keyset limit: _get_ids > _apply_keyset_limit"):
+        ids, total, next_cursor = self._apply_keyset_limit(
             object_class,
             query,
-            object_query["order_by"],
+            object_query,
         )
-    with benchmark("Apply limit"):
-      limit = object_query.get("limit")
-      if limit:
-        ids, total = self._apply_limit(query, limit)
-      else:
-        ids = [obj.id for obj in query]
-        total = len(ids)
       object_query["total"] = total
+      object_query["next_cursor"] = next_cursor
+    else:
+      if object_query.get("order_by"):
+        with benchmark("Sorting: _get_ids > order_by"):
+          query = self._apply_order_by(
+              object_class,
+              query,
+              object_query["order_by"],
+          )
+      with benchmark("Apply limit"):
+        limit = object_query.get("limit")
+        if limit:
+          ids, total = self._apply_limit(query, limit)
+        else:
+          ids = [obj.id for obj in query]
+          total = len(ids)
+        object_query["total"] = total
 
-    if hasattr(flask.g, "similar_objects_query"):
-      # delete similar_objects_query for the case when several queries are
-      # POSTed in one request, the first one filters by similarity and the
-      # second one doesn't but tries to sort by __similarity__
-      delattr(flask.g, "similar_objects_query")
+    self._clear_similar_objects_query()
     return ids
 
   @staticmethod
-  def _apply_limit(query, limit):
-    """Apply limits for pagination.
-
-    Args:
-      query: filter query;
-      limit: a tuple of indexes in format (from, to); objects is sliced to
-            objects[from, to].
-
-    Returns:
-      matched objects ids and total count.
-    """
+  def _parse_limit(limit):
+    """Validate a limit in format (from, to) and convert it to integers."""
     try:
       first, last = limit
       first, last = int(first), int(last)
@@ -376,26 +400,109 @@ class QueryHelper(object):
       raise BadQueryException("Limit cannot contain negative numbers.")
     elif first >= last:
       raise BadQueryException("Limit start should be smaller than end.")
-    else:
-      page_size = last - first
-      with benchmark("Apply limit: _apply_limit > query_limit"):
-        # Note: limit request syntax is limit:[0,10]. We are counting
-        # offset from 0 as the offset of the initial row for sql is 0 (not 1).
-        ids = [obj.id for obj in query.limit(page_size).offset(first)]
-      with benchmark("Apply limit: _apply_limit > query_count"):
-        if len(ids) < page_size:
-          total = len(ids) + first
-        else:
-          # Note: using func.count() as query.count() is generating additional
-          # subquery
-          count_q = query.statement.with_only_columns([sa.func.count()])
-          total = db.session.execute(count_q).scalar()
+    return first, last
+
+  @staticmethod
+  def _count_query(query):
+    # Note: using func.count() as query.count() is generating additional
+    # subquery
+    count_q = query.statement.with_only_columns([sa.func.count()])
+    return db.session.execute(count_q).scalar()
+
+  def _apply_limit(self, query, limit):
+    """Apply limits for pagination.
+
+    Args:
+      query: filter query;
+      limit: a tuple of indexes in format (from, to); objects is sliced to
+            objects[from, to].
+
+    Returns:
+      matched objects ids and total count.
+    """
+    first, last = self._parse_limit(limit)
+    page_size = last - first
+    with benchmark("Apply limit: _apply_limit > query_limit"):
+      # Note: limit request syntax is limit:[0,10]. We are counting
+      # offset from 0 as the offset of the initial row for sql is 0 (not 1).
+      ids = [obj.id for obj in query.limit(page_size).offset(first)]
+    with benchmark("Apply limit: _apply_limit > query_count"):
+      if len(ids) < page_size:
+        total = len(ids) + first
+      else:
+        total = self._count_query(query)
 
     return ids, total
 
+  def _apply_keyset_limit(self, model, query, object_query):
+    """Get a page of ids that starts after the position of a cursor.
+
+    The page size is given by the "limit" of the object query, the cursor
+    replaces its offset. Objects are ordered by "order_by" and id, the total
+    is counted only for the first page and carried in the cursors.
+
+    Args:
+      model: the model instances of which are requested in query;
+      query: filter query;
+      object_query: object query with "cursor" and "limit" keys, the cursor
+                    is None for the first page.
+
+    Returns:
+      matched objects ids, total count and the cursor of the next page or
+      None if this is the last page.
+    """
+    if not object_query.get("limit"):
+      raise BadQueryException("Cursor can only be used with limit.")
+    first, last = self._parse_limit(object_query["limit"])
+    page_size = last - first
+
+    orders = []
+    if object_query.get("order_by"):
+      query, orders = self._get_order_by(model, query,
+                                         object_query["order_by"])
+    orders.append((model.id, False))
+
+    total = None
+    page_query = query
+    if object_query["cursor"]:
+      try:
+        values, total = keyset.decode_cursor(object_query["cursor"],
+                                             len(orders))
+      except ValueError as error:
+        raise BadQueryException(error.message)
+      page_query = page_query.filter(keyset.after(orders, values))
+    page_query = page_query.add_columns(*[
+        order for order, _ in orders
+    ]).order_by(*[
+        order.desc() if desc else order for order, desc in orders
+    ]).limit(page_size + 1)
+    with benchmark("Apply keyset limit: _apply_keyset_limit > query_limit"):
+      rows = page_query.all()
+    ids = [row[0] for row in rows[:page_size]]
+
+    next_cursor = None
+    if total is None:
+      with benchmark("Apply keyset limit: _apply_keyset_limit > query_count"):
+        if object_query["cursor"] or len(rows) > page_size:
+          total = self._count_query(query)
+        else:
+          total = len(ids)
+    if len(rows) > page_size:
+      next_cursor = keyset.encode_cursor(rows[page_size - 1][1:], total)
+    return ids, total, next_cursor
+
   def _apply_order_by(self, model, query, order_by):
     """Add ordering parameters to a query for objects.
 
+    See _get_order_by for the supported ordering parameters.
+    """
+    query, orders = self._get_order_by(model, query, order_by)
+    return query.order_by(*[order.desc() if desc else order
+                            for order, desc in orders])
+
+  def _get_order_by(self, model, query, order_by):
+    """Get ordering columns for a query for objects.
+
     This works only on direct model properties and related objects defined with
     foreign keys and fails if any CAs are specified in order_by.
 
@@ -417,7 +524,8 @@ class QueryHelper(object):
     3. Otherwise, raise a NotImplementedError.
 
     Returns:
-      the query with sorting parameters.
+      the query with joins required for sorting and a list of
+      (ordering column, desc) tuples.
     """
     def joins_and_order(clause):
       """Get join operations and ordering field from item of order_by list.
@@ -427,10 +535,11 @@ class QueryHelper(object):
                  "desc": reverse sort on this field if True}
 
       Returns:
-        ([joins], order) - a tuple of joins required for this ordering to work
-                           and ordering clause itself; join is None if no join
-                           required or [(aliased entity, relationship field)]
-                           if joins required.
+        ([joins], (order, desc)) - a tuple of joins required for this
+                           ordering to work and ordering column with its
+                           direction; join is None if no join required or
+                           [(aliased entity, relationship field)] if joins
+                           required.
       """
       def by_similarity():
         """Join similar_objects subquery, order by weight from it."""
@@ -490,10 +599,7 @@ class QueryHelper(object):
           self._count += 1
           joins, order = by_fulltext()
 
-      if clause.get("desc", False):
-        order = order.desc()
-
-      return joins, order
+      return joins, (order, clause.get("desc", False))
 
     join_lists, orders = zip(*[joins_and_order(clause) for clause in order_by])
     for join_list in join_lists:
@@ -501,7 +607,7 @@ class QueryHelper(object):
         for join in join_list:
           query = query.outerjoin(*join)
 
-    return query.order_by(*orders)
+    return query, list(orders)
 
   def _build_expression(self, exp, object_class, tgt_class):
     """Make an SQLAlchemy filtering expression from exp expression tree."""
@@ -18,9 +18,21 @@ class Indexer(object):
   def delete_record(self, key):
     raise NotImplementedError()
 
+  def create_records(self, records):
+    raise NotImplementedError()
+
+  def update_records(self, records):
+    raise NotImplementedError()
+
+  def delete_records(self, keys):
+    raise NotImplementedError()
+
   def search(self, terms):
     raise NotImplementedError()
 
+  def search_counts(self, terms):
+    raise NotImplementedError()
+
 
 class Record(object):
 
@@ -1,15 +1,20 @@
 # Copyright (C) 2017 Google Inc.
 # Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
 
+import re
 from collections import defaultdict, Iterable
 
+import flask
 from sqlalchemy import and_
 from sqlalchemy import case
 from sqlalchemy import distinct
 from sqlalchemy import func
 from sqlalchemy import literal
+from sqlalchemy import literal_column
 from sqlalchemy import or_
+from sqlalchemy import tuple_
 from sqlalchemy import union
+from sqlalchemy import union_all
 from sqlalchemy.sql import false
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import aliased
@@ -20,10 +25,20 @@ from ggrc.login import is_creator
 from ggrc.models import all_models
 from ggrc.utils import query_helpers
 from ggrc.rbac import context_query_filter
+from ggrc.fulltext import get_indexed_model_names
+from ggrc.fulltext import get_indexer
+from ggrc.fulltext.recordbuilder import fts_record_for
 from ggrc.fulltext.sql import SqlIndexer
 from ggrc.fulltext.mixin import Indexed
 
 
+# Max number of keys per type returned by search_counts.
+SEARCH_COUNTS_LIMIT = 50
+
+# Max length of an integer key with a separator in a GROUP_CONCAT result.
+KEY_LENGTH = 12
+
+
 class MysqlRecordProperty(db.Model):
   __tablename__ = 'fulltext_record_properties'
 
@@ -58,6 +73,56 @@ class MysqlIndexer(SqlIndexer):
     elif terms:
       return and_(whitelist, MysqlRecordProperty.content.contains(terms))
 
+  @staticmethod
+  def _get_permissions_cache():
+    """Get request cache of permission filters or None outside requests."""
+    if not flask.has_request_context():
+      return None
+    if not hasattr(flask.g, "fulltext_permission_filters"):
+      flask.g.fulltext_permission_filters = {}
+    return flask.g.fulltext_permission_filters
+
+  def _get_type_permissions_query(self, model_name, permission_type,
+                                  permission_model):
+    """Get filter for records of a single model the user has access to.
+
+    Filters are cached for the current request, so allowed contexts and
+    resources of a model are collected only once even if several search
+    queries are built.
+
+    Returns:
+      filter for the given model or None if the user has no access to it.
+    """
+    cache_key = (model_name, permission_type, permission_model)
+    cache = self._get_permissions_cache()
+    if cache is not None and cache_key in cache:
+      return cache[cache_key]
+
+    type_query = None
+    contexts, resources = query_helpers.get_context_resource(
+        model_name=model_name,
+        permission_type=permission_type,
+        permission_model=permission_model
+    )
+    if contexts is not None:
+      if resources:
+        resource_sql = and_(
+            MysqlRecordProperty.type == model_name,
+            MysqlRecordProperty.key.in_(resources))
+      else:
+        resource_sql = false()
+
+      type_query = or_(
+          and_(
+              MysqlRecordProperty.type == model_name,
+              context_query_filter(MysqlRecordProperty.context_id, contexts)
+          ),
+          resource_sql)
+
+    if cache is not None:
+      cache[cache_key] = type_query
+    return type_query
+
   def get_permissions_query(self, model_names, permission_type='read',
                             permission_model=None):
     """Prepare the query based on the allowed contexts and resources for
@@ -65,25 +130,9 @@ class MysqlIndexer(SqlIndexer):
     """
     type_queries = []
     for model_name in model_names:
-      contexts, resources = query_helpers.get_context_resource(
-          model_name=model_name,
-          permission_type=permission_type,
-          permission_model=permission_model
-      )
-      if contexts is not None:
-        if resources:
-          resource_sql = and_(
-              MysqlRecordProperty.type == model_name,
-              MysqlRecordProperty.key.in_(resources))
-        else:
-          resource_sql = false()
-
-        type_query = or_(
-            and_(
-                MysqlRecordProperty.type == model_name,
-                context_query_filter(MysqlRecordProperty.context_id, contexts)
-            ),
-            resource_sql)
+      type_query = self._get_type_permissions_query(
+          model_name, permission_type, permission_model)
+      if type_query is not None:
         type_queries.append(type_query)
 
     return and_(
@@ -211,6 +260,176 @@ class MysqlIndexer(SqlIndexer):
       query = query.union(extra_q)
     return query.all()
 
+  def _add_relevant_objects_query(self, query, types, relevant_objects):
+    """Filter records to objects related to all relevant objects."""
+    relationship = all_models.Relationship
+    for relevant_type, relevant_id in relevant_objects or []:
+      src_query = db.session.query(
+          relationship.source_type, relationship.source_id
+      ).filter(
+          relationship.destination_type == relevant_type,
+          relationship.destination_id == relevant_id
+      )
+      dst_query = db.session.query(
+          relationship.destination_type, relationship.destination_id
+      ).filter(
+          relationship.source_type == relevant_type,
+          relationship.source_id == relevant_id
+      )
+      if types is not None:
+        src_query = src_query.filter(relationship.source_type.in_(types))
+        dst_query = dst_query.filter(relationship.destination_type.in_(types))
+      query = query.filter(
+          tuple_(self.record_type.type, self.record_type.key).in_(
+              src_query.union(dst_query)))
+    return query
+
+  def _get_objects_query(self, label, terms, model_names, owner_types,
+                         contact_id, extra_param=None, relevant_objects=None):
+    """Get query for matching objects with a key for ordering them.
+
+    Objects are ordered the same way as in search(): objects with a matching
+    title first, then by the content of the first matching record.
+    """
+    sort_key = func.min(func.concat(
+        case([(self.record_type.property == "title", literal("0"))],
+             else_=literal("1")),
+        self.record_type.content))
+    query = db.session.query(
+        literal(label).label("label"),
+        self.record_type.type.label("type"),
+        self.record_type.key.label("key"),
+        sort_key.label("sort_key"),
+    )
+    query = query.filter(self.get_permissions_query(model_names))
+    query = query.filter(self._get_filter_query(terms))
+    query = self.search_get_owner_query(query, owner_types, contact_id)
+    if extra_param:
+      query = self._add_extra_params_query(query, model_names[0], extra_param)
+    query = self._add_relevant_objects_query(
+        query, owner_types, relevant_objects)
+    return query.group_by(self.record_type.type, self.record_type.key)
+
+  def search_counts(self, terms, types=None, contact_id=None,
+                    extra_params=None, extra_columns=None,
+                    relevant_objects=None, limit=SEARCH_COUNTS_LIMIT):
+    """Get counts and first keys of matching objects with a single query.
+
+    Args:
+      terms: search terms.
+      types: list of model names to search or None for all models.
+      contact_id: id of person for returning only their objects.
+      extra_params: dict of model name -> dict of attribute filters.
+      extra_columns: dict of label -> model name, counted separately.
+      relevant_objects: list of (type, id) pairs that all returned objects
+        must be related to.
+      limit: max number of returned keys per type.
+
+    Returns:
+      list of (label, type, count, keys) tuples. Label is an empty string
+      for the counts of regular types.
+    """
+    extra_params = extra_params or {}
+    extra_columns = extra_columns or {}
+    queries = [self._get_objects_query(
+        "", terms, self._get_grouped_types(types, extra_params), types,
+        contact_id, relevant_objects=relevant_objects)]
+    all_extra_columns = dict(extra_columns.items() +
+                             [(p, p) for p in extra_params
+                              if p not in extra_columns])
+    for label, model_name in all_extra_columns.iteritems():
+      queries.append(self._get_objects_query(
+          label, terms, [model_name], [model_name], contact_id,
+          extra_params.get(label), relevant_objects))
+
+    objects = union_all(*[query.statement for query in queries]).alias(
+        "objects")
+    first_keys = literal_column(
+        "GROUP_CONCAT(objects.`key` ORDER BY objects.sort_key SEPARATOR ',')")
+    query = select([
+        objects.c.label,
+        objects.c.type,
+        func.count(),
+        first_keys,
+    ]).group_by(objects.c.label, objects.c.type)
+
+    # GROUP_CONCAT results are truncated to group_concat_max_len bytes, which
+    # must fit the first `limit` keys. The connection is pooled, so the
+    # previous value is restored after the query.
+    max_len = db.session.execute(
+        "SELECT @@SESSION.group_concat_max_len").scalar()
+    db.session.execute(
+        "SET SESSION group_concat_max_len = GREATEST(:old_len, :max_len)",
+        {"old_len": max_len, "max_len": limit * KEY_LENGTH},
+    )
+    try:
+      rows = db.session.execute(query).fetchall()
+    finally:
+      db.session.execute("SET SESSION group_concat_max_len = :max_len",
+                         {"max_len": max_len})
+    return [
+        (label, type_, count, [int(key) for key in keys.split(",")[:limit]])
+        for label, type_, count, keys in rows
+    ]
+
+
+class MysqlFulltextIndexer(MysqlIndexer):
+  """Indexer that looks up search terms in a MySQL FULLTEXT index.
+
+  Every word of the search terms is matched as a word prefix with MATCH ...
+  AGAINST in boolean mode, so rows are found through the FULLTEXT index on
+  the content column instead of scanning the whole table with LIKE. The LIKE
+  condition is still applied to the found rows to keep phrase matching.
+
+  Words shorter than innodb_ft_min_token_size and InnoDB stopwords are not
+  stored in the index, so they are only matched by the LIKE condition. Note
+  that the search now matches words by prefix, so a term inside a word (like
+  "trol" in "control") is no longer found.
+
+  The index is only created on MySQL 5.6 and newer, see migration 4c8e1f2d7a3b.
+  """
+
+  WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+  STOPWORDS = frozenset([
+      "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en",
+      "for", "from", "how", "i", "in", "is", "it", "la", "of", "on", "or",
+      "that", "the", "this", "to", "was", "what", "when", "where", "who",
+      "will", "with", "und", "www",
+  ])
+
+  MAX_TOKEN_SIZE = 84
+
+  def __init__(self, settings):
+    super(MysqlFulltextIndexer, self).__init__(settings)
+    self.min_token_size = getattr(settings, "FULLTEXT_MIN_TOKEN_SIZE", 3)
+
+  def get_match_terms(self, terms):
+    """Get boolean mode search string that requires all indexed words.
+
+    Returns:
+      search string for MATCH ... AGAINST or None if none of the words in
+      terms can be found in the FULLTEXT index.
+    """
+    words = []
+    for word in self.WORD_PATTERN.findall(terms or u""):
+      word = word.lower()
+      if (self.min_token_size <= len(word) <= self.MAX_TOKEN_SIZE and
+              word not in self.STOPWORDS and word not in words):
+        words.append(word)
+    if not words:
+      return None
+    return u" ".join(u"+{}*".format(word) for word in words)
+
+  def _get_filter_query(self, terms):
+    """Get the whitelist and FULLTEXT filter for full text table."""
+    filter_query = super(MysqlFulltextIndexer, self)._get_filter_query(terms)
+    match_terms = self.get_match_terms(terms)
+    if match_terms is None:
+      return filter_query
+    return and_(self.record_type.content.match(match_terms), filter_query)
+
+
 Indexer = MysqlIndexer
 
 
@@ -238,5 +457,13 @@ def update_indexer(session):
       for to_index in to_index_list:
         key = "{}-{}".format(to_index.__class__.__name__, to_index.id)
         reindex_dict[key] = to_index
-  for for_index in reindex_dict.values():
-    for_index.update_indexer()
+  indexed_model_names = get_indexed_model_names()
+  to_index = [obj for obj in reindex_dict.values()
+              if obj.__class__.__name__ in indexed_model_names]
+  if not to_index:
+    return
+  indexer = get_indexer()
+  indexer.delete_records(
+      [(obj.__class__.__name__, obj.id) for obj in to_index], commit=False)
+  indexer.create_records(
+      [fts_record_for(obj) for obj in to_index], commit=False)
@@ -0,0 +1,305 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Full text index rebuilding.
+
+A full reindex writes all records into a shadow table which replaces the live
+table with a single atomic RENAME once it is complete, so search keeps serving
+the previous index for the whole duration of the rebuild. The work is split by
+model and id range and can be spread across a pool of worker processes.
+
+An incremental reindex only updates records of objects that were modified
+after the watermark stored by the last successful reindex. Both remove records
+of objects that no longer exist.
+"""
+
+import logging
+import multiprocessing
+
+import flask
+import sqlalchemy as sa
+from sqlalchemy.sql import column
+from sqlalchemy.sql import table
+
+from ggrc import db
+from ggrc import settings
+from ggrc.fulltext import get_indexer
+from ggrc.fulltext import get_indexed_model_names
+from ggrc.fulltext.recordbuilder import fts_record_for
+from ggrc.models import all_models
+from ggrc.models.inflector import get_model
+from ggrc.snapshotter import indexer as snapshot_indexer
+from ggrc.utils import benchmark
+from ggrc.utils import list_chunks
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+CHUNK_SIZE = 1000
+
+WATERMARK_NAME = "fulltext"
+
+watermarks = db.Table(
+    "fulltext_watermarks",
+    db.Column("name", db.String(250), primary_key=True),
+    db.Column("watermark", db.DateTime, nullable=False),
+)
+
+# People map used by record builders in worker processes. It is loaded once
+# per worker process instead of once per chunk.
+_people_map = None
+
+
+def _get_people_map():
+  """Get id -> (name, email) map of all people."""
+  people = db.session.query(all_models.Person.id, all_models.Person.name,
+                            all_models.Person.email)
+  return {p.id: (p.name, p.email) for p in people}
+
+
+def get_live_table():
+  """Get the table that the current indexer reads from."""
+  return get_indexer().record_type.__table__
+
+
+def _get_table(name):
+  """Get a lightweight table clause with the columns of the index table."""
+  live_table = get_live_table()
+  return table(name, *[column(col.name) for col in live_table.columns])
+
+
+def get_watermark():
+  """Get the time of the last successful reindex or None."""
+  return db.session.query(watermarks.c.watermark).filter(
+      watermarks.c.name == WATERMARK_NAME).scalar()
+
+
+def set_watermark(value):
+  """Store the start time of a successful reindex."""
+  db.session.execute(watermarks.delete().where(
+      watermarks.c.name == WATERMARK_NAME))
+  db.session.execute(watermarks.insert().values(
+      name=WATERMARK_NAME, watermark=value))
+  db.session.commit()
+
+
+def _get_changed_ids_query(model, since):
+  """Get query for ids of objects of a model modified after `since`."""
+  return db.session.query(model.id).filter(model.updated_at >= since)
+
+
+def index_range(task):
+  """Create records for objects of one model in a given id range.
+
+  Args:
+    task: tuple of model name, first id, id after the last one, target table
+      name, and an optional time for indexing only modified objects.
+
+  Returns:
+    number of indexed objects.
+  """
+  # pylint: disable=protected-access
+  model_name, id_from, id_to, table_name, since = task
+  model = get_model(model_name)
+  mapper_class = model._sa_class_manager.mapper.base_mapper.class_
+  query = model.query.options(
+      db.undefer_group(mapper_class.__name__ + '_complete'),
+  ).filter(
+      model.id >= id_from,
+      model.id < id_to,
+  )
+  if since is not None:
+    query = query.filter(model.updated_at >= since)
+  records = [fts_record_for(instance) for instance in query]
+  indexer = get_indexer()
+  target = _get_table(table_name)
+  if since is None:
+    indexer.create_records(records, commit=False, table=target)
+  else:
+    indexer.update_records(records, commit=False, table=target)
+  db.session.commit()
+  return len(records)
+
+
+def _init_worker():
+  """Drop database state inherited from the parent process.
+
+  Connections are discarded without closing them, because closing would also
+  close the sockets that the parent process still uses.
+  """
+  db.session.registry.clear()
+  db.engine.pool = db.engine.pool.recreate()
+
+
+def _worker_index_range(task):
+  """Run index_range inside an app context of a worker process."""
+  # pylint: disable=global-statement
+  global _people_map
+  from ggrc.app import app
+  with app.app_context():
+    try:
+      if _people_map is None:
+        _people_map = _get_people_map()
+      flask.g.people_map = _people_map
+      return index_range(task)
+    finally:
+      db.session.remove()
+
+
+def get_tasks(model_names, table_name, since=None):
+  """Split indexing of the given models into id ranges.
+
+  Returns:
+    list of tasks for index_range.
+  """
+  tasks = []
+  for model_name in sorted(model_names):
+    model = get_model(model_name)
+    if since is not None:
+      if not hasattr(model, "updated_at"):
+        continue
+      id_query = _get_changed_ids_query(model, since).subquery()
+      min_id, max_id = db.session.query(
+          sa.func.min(id_query.c.id), sa.func.max(id_query.c.id)).one()
+    else:
+      min_id, max_id = db.session.query(
+          sa.func.min(model.id), sa.func.max(model.id)).one()
+    if min_id is None:
+      continue
+    for id_from in xrange(min_id, max_id + 1, CHUNK_SIZE):
+      tasks.append((model_name, id_from, id_from + CHUNK_SIZE,
+                    table_name, since))
+  return tasks
+
+
+def run_tasks(tasks, workers=None):
+  """Run indexing tasks in this process or in a pool of worker processes.
+
+  Returns:
+    total number of indexed objects.
+  """
+  if workers is None:
+    workers = getattr(settings, "FULLTEXT_REINDEX_WORKERS", 1)
+  if workers <= 1 or len(tasks) <= 1:
+    people_map_set = hasattr(flask.g, "people_map")
+    if not people_map_set:
+      flask.g.people_map = _get_people_map()
+    try:
+      return sum(index_range(task) for task in tasks)
+    finally:
+      if not people_map_set:
+        delattr(flask.g, "people_map")
+
+  db.session.commit()
+  pool = multiprocessing.Pool(workers, initializer=_init_worker)
+  try:
+    return sum(pool.imap_unordered(_worker_index_range, tasks))
+  finally:
+    pool.close()
+    pool.join()
+
+
+def _reindex_snapshots_since(since):
+  """Reindex snapshots modified after `since`."""
+  snapshot = all_models.Snapshot
+  snapshot_ids = [id_ for id_, in _get_changed_ids_query(snapshot, since)]
+  for ids_chunk in list_chunks(snapshot_ids):
+    snapshot_indexer.reindex_snapshots(ids_chunk)
+
+
+def _delete_removed_records(model_names, table_name):
+  """Delete records of objects of the given models that no longer exist."""
+  target = _get_table(table_name)
+  count = 0
+  for model_name in sorted(model_names):
+    model = get_model(model_name)
+    count += db.session.execute(target.delete().where(sa.and_(
+        target.c.type == model_name,
+        ~target.c.key.in_(db.session.query(model.id).statement),
+    ))).rowcount
+  db.session.commit()
+  return count
+
+
+def _swap_tables(live_name, shadow_name):
+  """Atomically replace the live index table with the shadow table."""
+  old_name = "{}_old".format(live_name)
+  db.session.commit()
+  db.engine.execute("DROP TABLE IF EXISTS {}".format(old_name))
+  db.engine.execute("RENAME TABLE {live} TO {old}, {shadow} TO {live}".format(
+      live=live_name, old=old_name, shadow=shadow_name))
+  db.engine.execute("DROP TABLE {}".format(old_name))
+
+
+def full_reindex(workers=None):
+  """Rebuild the whole full text index in a shadow table and swap it in."""
+  start = db.session.query(sa.func.now()).scalar()
+  model_names = get_indexed_model_names()
+  live_name = get_live_table().name
+  shadow_name = "{}_shadow".format(live_name)
+
+  with benchmark("Create shadow index table"):
+    db.engine.execute("DROP TABLE IF EXISTS {}".format(shadow_name))
+    db.engine.execute("CREATE TABLE {} LIKE {}".format(shadow_name, live_name))
+
+  with benchmark("Build shadow index"):
+    count = run_tasks(get_tasks(model_names, shadow_name), workers)
+    logger.info("Indexed %s objects into %s", count, shadow_name)
+
+  with benchmark("Catch up with changes made during the rebuild"):
+    run_tasks(get_tasks(model_names, shadow_name, since=start), workers)
+
+  with benchmark("Copy snapshot records and swap index tables"):
+    db.engine.execute(
+        "INSERT INTO {shadow} SELECT * FROM {live} "
+        "WHERE type = 'Snapshot'".format(shadow=shadow_name, live=live_name))
+    _swap_tables(live_name, shadow_name)
+
+  with benchmark("Index changes made during the swap"):
+    run_tasks(get_tasks(model_names, live_name, since=start), workers)
+    _delete_removed_records(model_names | {"Snapshot"}, live_name)
+
+  with benchmark("Reindex snapshots"):
+    snapshot_indexer.reindex()
+
+  set_watermark(start)
+
+
+def incremental_reindex(workers=None):
+  """Reindex objects modified since the last successful reindex.
+
+  Falls back to a full reindex if there is no stored watermark. Note that
+  only objects with a newer updated_at value get reindexed, so changes that
+  only touch related objects are not picked up.
+  """
+  since = get_watermark()
+  if since is None:
+    full_reindex(workers)
+    return
+  start = db.session.query(sa.func.now()).scalar()
+  live_name = get_live_table().name
+  with benchmark("Incremental reindex since {}".format(since)):
+    tasks = get_tasks(get_indexed_model_names(), live_name, since=since)
+    count = run_tasks(tasks, workers)
+    logger.info("Reindexed %s objects modified since %s", count, since)
+  with benchmark("Reindex modified snapshots"):
+    _reindex_snapshots_since(since)
+  with benchmark("Delete records of removed objects"):
+    count = _delete_removed_records(
+        get_indexed_model_names() | {"Snapshot"}, live_name)
+    logger.info("Deleted %s records of removed objects", count)
+  set_watermark(start)
+
+
+def reindex(incremental=False, workers=None):
+  """Update the full text index.
+
+  Args:
+    incremental: only reindex objects modified after the last reindex.
+    workers: number of worker processes, defaults to the
+      FULLTEXT_REINDEX_WORKERS setting.
+  """
+  if incremental:
+    incremental_reindex(workers)
+  else:
+    full_reindex(workers)
@@ -3,24 +3,94 @@
 
 """SQL routines for full-text indexing."""
 
+from sqlalchemy import tuple_
+
 from ggrc import db
 from ggrc.fulltext import Indexer
 
 
 class SqlIndexer(Indexer):
-  def create_record(self, record, commit=True):
+
+  @staticmethod
+  def get_record_rows(record):
+    """Get index table rows for all non empty properties of a record."""
+    rows = []
     for prop, value in record.properties.items():
       for subproperty, content in value.items():
         if content is not None:
-          db.session.add(self.record_type(
-              key=record.key,
-              type=record.type,
-              context_id=record.context_id,
-              tags=record.tags,
-              property=prop,
-              subproperty=unicode(subproperty),
-              content=unicode(content),
-          ))
+          rows.append({
+              "key": record.key,
+              "type": record.type,
+              "context_id": record.context_id,
+              "tags": record.tags,
+              "property": prop,
+              "subproperty": unicode(subproperty),
+              "content": unicode(content),
+          })
+    return rows
+
+  def create_record(self, record, commit=True):
+    for row in self.get_record_rows(record):
+      db.session.add(self.record_type(**row))
+    if commit:
+      db.session.commit()
+
+  def _get_table(self, table=None):
+    """Get the table that batched operations write to."""
+    if table is None:
+      return self.record_type.__table__
+    return table
+
+  def create_records(self, records, commit=True, table=None):
+    """Insert index rows for many records with a single INSERT statement.
+
+    Args:
+      records: list of Record objects.
+      commit: commit the session after inserting the rows.
+      table: table to write to, defaults to the table of record_type.
+    """
+    table = self._get_table(table)
+    rows = {}
+    for record in records:
+      for row in self.get_record_rows(record):
+        row_key = (row["key"], row["type"], row["property"],
+                   row["subproperty"])
+        rows[row_key] = row
+    if rows:
+      db.session.execute(table.insert(), rows.values())
+    if commit:
+      db.session.commit()
+
+  def update_records(self, records, commit=True, table=None):
+    """Replace index rows for many records.
+
+    Obsolete rows of all record properties are removed with a single DELETE
+    statement and new rows are added with a single INSERT statement.
+    """
+    table = self._get_table(table)
+    properties = {
+        (record.type, record.key, prop)
+        for record in records
+        for prop in record.properties
+    }
+    if properties:
+      db.session.execute(table.delete().where(
+          tuple_(table.c.type, table.c.key, table.c.property).in_(properties)
+      ))
+    self.create_records(records, commit=commit, table=table)
+
+  def delete_records(self, keys, commit=True, table=None):
+    """Delete index rows for many objects with a single DELETE statement.
+
+    Args:
+      keys: iterable of (type, key) tuples of objects to remove.
+    """
+    table = self._get_table(table)
+    keys = set(keys)
+    if keys:
+      db.session.execute(table.delete().where(
+          tuple_(table.c.type, table.c.key).in_(keys)
+      ))
     if commit:
       db.session.commit()
 
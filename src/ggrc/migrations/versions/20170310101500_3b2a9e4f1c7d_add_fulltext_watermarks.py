@@ -0,0 +1,32 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""
+Add fulltext watermarks table
+
+Create Date: 2017-03-10 10:15:00.000000
+"""
+# disable Invalid constant name pylint warning for mandatory Alembic variables.
+# pylint: disable=invalid-name
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b2a9e4f1c7d"
+down_revision = "2127ea770285"
+
+
+def upgrade():
+  """Add table for storing the time of the last full text reindex."""
+  op.create_table(
+      "fulltext_watermarks",
+      sa.Column("name", sa.String(length=250), nullable=False),
+      sa.Column("watermark", sa.DateTime(), nullable=False),
+      sa.PrimaryKeyConstraint("name"),
+  )
+
+
+def downgrade():
+  """Drop fulltext watermarks table."""
+  op.drop_table("fulltext_watermarks")
@@ -0,0 +1,54 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""
+Add FULLTEXT index on fulltext record content
+
+Create Date: 2017-03-13 09:45:00.000000
+"""
+# disable Invalid constant name pylint warning for mandatory Alembic variables.
+# pylint: disable=invalid-name
+
+import logging
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4c8e1f2d7a3b"
+down_revision = "3b2a9e4f1c7d"
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "ft_fulltext_record_properties_content"
+
+
+def _supports_innodb_fulltext():
+  """Check if the server supports FULLTEXT indexes on InnoDB tables."""
+  version = op.get_bind().execute("SELECT VERSION()").scalar()
+  major, minor = [int(part) for part in version.split(".")[:2]]
+  return (major, minor) >= (5, 6)
+
+
+def _has_index():
+  return op.get_bind().execute(
+      "SHOW INDEX FROM fulltext_record_properties WHERE key_name = %s",
+      INDEX_NAME,
+  ).first() is not None
+
+
+def upgrade():
+  """Add FULLTEXT index used by MysqlFulltextIndexer."""
+  if not _supports_innodb_fulltext():
+    logger.warning("Skipping %s, MySQL 5.6 or newer is required for FULLTEXT "
+                   "indexes on InnoDB tables.", INDEX_NAME)
+    return
+  op.execute(
+      "ALTER TABLE fulltext_record_properties "
+      "ADD FULLTEXT INDEX {} (content)".format(INDEX_NAME)
+  )
+
+
+def downgrade():
+  """Drop FULLTEXT index on content if it exists."""
+  if _has_index():
+    op.drop_index(INDEX_NAME, "fulltext_record_properties")
@@ -0,0 +1,45 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""
+Add compact revision storage
+
+Create Date: 2017-03-16 12:00:00.000000
+"""
+# disable Invalid constant name pylint warning for mandatory Alembic variables.
+# pylint: disable=invalid-name
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = "5d9a3c7e2b14"
+down_revision = "4c8e1f2d7a3b"
+
+
+def upgrade():
+  """Add compressed revision content and the shared content blobs table."""
+  op.create_table(
+      "revision_blobs",
+      sa.Column("hash", sa.String(length=40), nullable=False),
+      sa.Column("content", mysql.LONGBLOB(), nullable=False),
+      sa.PrimaryKeyConstraint("hash"),
+  )
+  op.add_column(
+      "revisions",
+      sa.Column("compact_content", mysql.LONGBLOB(), nullable=True),
+  )
+  op.alter_column("revisions", "content", existing_type=mysql.LONGTEXT(),
+                  nullable=True)
+
+
+def downgrade():
+  """Drop compact revision storage.
+
+  Compacted revisions must be expanded before the downgrade.
+  """
+  op.alter_column("revisions", "content", existing_type=mysql.LONGTEXT(),
+                  nullable=False)
+  op.drop_column("revisions", "compact_content")
+  op.drop_table("revision_blobs")
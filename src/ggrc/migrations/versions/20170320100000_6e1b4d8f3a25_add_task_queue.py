@@ -0,0 +1,46 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""
+Add task queue for local background task workers
+
+Create Date: 2017-03-20 10:00:00.000000
+"""
+# disable Invalid constant name pylint warning for mandatory Alembic variables.
+# pylint: disable=invalid-name
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6e1b4d8f3a25"
+down_revision = "5d9a3c7e2b14"
+
+
+def upgrade():
+  """Create the table polled by local background task workers."""
+  op.create_table(
+      "task_queue",
+      sa.Column("id", sa.Integer(), nullable=False),
+      sa.Column("background_task_id", sa.Integer(), nullable=False),
+      sa.Column("name", sa.String(length=250), nullable=False),
+      sa.Column("method", sa.String(length=16), nullable=False),
+      sa.Column("url", sa.Text(), nullable=False),
+      sa.Column("headers", sa.Text(), nullable=False),
+      sa.Column("attempts", sa.Integer(), nullable=False,
+                server_default="0"),
+      sa.Column("available_at", sa.DateTime(), nullable=False),
+      sa.Column("leased_until", sa.DateTime(), nullable=True),
+      sa.Column("leased_by", sa.String(length=250), nullable=True),
+      sa.Column("created_at", sa.DateTime(), nullable=False),
+      sa.ForeignKeyConstraint(["background_task_id"],
+                              ["background_tasks.id"], ondelete="CASCADE"),
+      sa.PrimaryKeyConstraint("id"),
+  )
+  op.create_index("ix_task_queue_name_leased_until", "task_queue",
+                  ["name", "leased_until"])
+
+
+def downgrade():
+  """Drop the task queue table."""
+  op.drop_table("task_queue")
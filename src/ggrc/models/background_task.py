@@ -69,6 +69,23 @@ class BackgroundTask(Base, Stateful, db.Model):
     db.session.add(self)
     db.session.commit()
 
+  def report_progress(self, content):
+    """Store a progress message as the result of a running task.
+
+    The message is written in its own transaction, so pending changes of the
+    task are not committed with it. Until the task finishes, its response
+    has status 202 and the message as content.
+    """
+    self.result = {'content': content,
+                   'status_code': 202,
+                   'headers': [('Content-Type', 'text/html')]}
+    db.engine.execute(
+        BackgroundTask.__table__.update().where(
+            BackgroundTask.__table__.c.id == self.id
+        ).values(status=self.status, result=self.result)
+    )
+    db.session.expire(self, ['status', 'result'])
+
   def make_response(self, default=None):
     if self.result is None:
       return default
@@ -78,6 +95,12 @@ class BackgroundTask(Base, Stateful, db.Model):
                               self.result['headers']))
 
 
+def use_task_queue():
+  """Check if tasks run outside of the request that created them."""
+  return (getattr(settings, 'APP_ENGINE', False) or
+          getattr(settings, 'LOCAL_TASK_QUEUE', False))
+
+
 def create_task(name, url, queued_callback=None, parameters=None):
 
   # task name must be unique
@@ -101,6 +124,9 @@ def create_task(name, url, queued_callback=None, parameters=None):
         params={'task_id': task.id},
         method=request.method,
         headers=headers)
+  elif getattr(settings, 'LOCAL_TASK_QUEUE', False):
+    from ggrc import task_queue
+    task_queue.enqueue(task, name, url, request.method, request.headers)
   elif queued_callback:
     queued_callback(task)
   return task
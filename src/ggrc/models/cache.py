@@ -5,25 +5,29 @@ class Cache:
   """
   Tracks modified objects in the session distinguished by
   type of modification: new, dirty and deleted.
+
+  Each of them maps objects to their JSON for log, or to None if the JSON
+  should be computed when the event is logged.
   """
   def __init__(self):
     self.clear()
 
   def update_before_flush(self, session, flush_context):
     """
-    Before the flush happens, we can still access to-be-deleted objects, so
-    record JSON for log here
+    Record modified objects with None in place of their JSON for log, which
+    is only computed once when the event is logged. Before the flush happens,
+    we can still access to-be-deleted objects, so record their JSON here.
     """
     for o in session.new:
       if hasattr(o, 'log_json'):
-        self.new[o] = o.log_json()
+        self.new[o] = None
     for o in session.deleted:
-      if hasattr(o, 'log_json'):
+      if hasattr(o, 'log_json') and self.deleted.get(o) is None:
         self.deleted[o] = o.log_json()
-    dirty = set(o for o in session.dirty if session.is_modified(o))
-    for o in dirty - set(self.new) - set(self.deleted):
-      if hasattr(o, 'log_json'):
-        self.dirty[o] = o.log_json()
+    for o in session.dirty:
+      if (o not in self.new and o not in self.deleted and
+              hasattr(o, 'log_json') and session.is_modified(o)):
+        self.dirty[o] = None
 
   def update_after_flush(self, session, flush_context):
     """
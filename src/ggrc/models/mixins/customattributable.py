@@ -4,8 +4,10 @@
 """Module containing custom attributable mixin."""
 
 import collections
+import contextlib
 from logging import getLogger
 
+import flask
 from sqlalchemy import and_
 from sqlalchemy import orm
 from sqlalchemy import or_
@@ -25,6 +27,43 @@ from ggrc.models.reflection import AttributeInfo
 logger = getLogger(__name__)
 
 
+def _get_preloaded_definitions():
+  """Get definitions loaded by preloaded_log_definitions or None."""
+  if not flask.has_app_context():
+    return None
+  return getattr(flask.g, "log_json_definitions", None)
+
+
+@contextlib.contextmanager
+def preloaded_log_definitions(objects):
+  """Load definitions logged by log_json of all objects with one query.
+
+  Inside of the context, CustomAttributable.log_json uses the loaded
+  definitions instead of querying the definitions of every object.
+  """
+  from ggrc.models.custom_attribute_definition import \
+      CustomAttributeDefinition
+
+  if not flask.has_app_context():
+    yield
+    return
+  ids = {value.custom_attribute_id
+         for obj in objects if isinstance(obj, CustomAttributable)
+         for value in obj.custom_attribute_values}
+  definitions = {}
+  for ids_chunk in utils.list_chunks(list(ids)):
+    definitions.update(
+        (definition.id, definition)
+        for definition in CustomAttributeDefinition.query.filter(
+            CustomAttributeDefinition.id.in_(ids_chunk)))
+  previous = _get_preloaded_definitions()
+  flask.g.log_json_definitions = definitions
+  try:
+    yield
+  finally:
+    flask.g.log_json_definitions = previous
+
+
 # pylint: disable=attribute-defined-outside-init; CustomAttributable is a mixin
 class CustomAttributable(object):
   """Custom Attributable mixin."""
@@ -417,15 +456,20 @@ class CustomAttributable(object):
     if self.custom_attribute_values:
       res["custom_attribute_values"] = [
           value.log_json() for value in self.custom_attribute_values]
-      # fetch definitions form database because `self.custom_attribute`
-      # may not be populated
-      defs = CustomAttributeDefinition.query.filter(
-          CustomAttributeDefinition.definition_type == self._inflector.table_singular,  # noqa # pylint: disable=protected-access
-          CustomAttributeDefinition.id.in_([
-              value.custom_attribute_id
-              for value in self.custom_attribute_values
-          ])
-      )
+      definition_type = self._inflector.table_singular  # noqa # pylint: disable=protected-access
+      ids = sorted({value.custom_attribute_id
+                    for value in self.custom_attribute_values})
+      preloaded = _get_preloaded_definitions()
+      if preloaded is not None and all(id_ in preloaded for id_ in ids):
+        defs = [preloaded[id_] for id_ in ids
+                if preloaded[id_].definition_type == definition_type]
+      else:
+        # fetch definitions form database because `self.custom_attribute`
+        # may not be populated
+        defs = CustomAttributeDefinition.query.filter(
+            CustomAttributeDefinition.definition_type == definition_type,
+            CustomAttributeDefinition.id.in_(ids),
+        )
       # also log definitions to freeze field names in time
       res["custom_attribute_definitions"] = [
           definition.log_json() for definition in defs]
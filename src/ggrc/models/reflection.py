@@ -364,11 +364,30 @@ class AttributeInfo(object):
     This function joins custom attribute definitions, mapping definitions and
     the extra delete column.
 
+    Definitions that are loaded from the database are kept in the metadata
+    cache until custom attribute definitions change.
+
     Args:
       object_class: Model for which we want the attribute definitions.
       ca_cache: dictionary containing custom attribute definitions.
       include_oca: Flag for including object level custom attributes.
     """
+    if ca_cache is None:
+      from ggrc.cache import metadata
+      return metadata.get(
+          "object_attr_definitions",
+          (object_class.__name__, include_oca),
+          ("custom_attributes",),
+          lambda: cls._get_object_attr_definitions(object_class,
+                                                   include_oca=include_oca),
+      )
+    return cls._get_object_attr_definitions(object_class, ca_cache=ca_cache,
+                                            include_oca=include_oca)
+
+  @classmethod
+  def _get_object_attr_definitions(cls, object_class, ca_cache=None,
+                                   include_oca=True):
+    """Get all column definitions for object_class without the cache."""
     definitions = {}
 
     aliases = AttributeInfo.gather_aliases(object_class)
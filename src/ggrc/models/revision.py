@@ -3,9 +3,13 @@
 
 """Defines a Revision model for storing snapshots."""
 
+from sqlalchemy.ext.hybrid import hybrid_property
+
 from ggrc import db
+from ggrc.models import revision_storage
 from ggrc.models.computed_property import computed_property
 from ggrc.models.mixins import Base
+from ggrc.models.types import CompressedJsonType
 from ggrc.models.types import LongJsonType
 
 
@@ -19,7 +23,10 @@ class Revision(Base, db.Model):
   event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
   action = db.Column(db.Enum(u'created', u'modified', u'deleted'),
                      nullable=False)
-  content = db.Column(LongJsonType, nullable=False)
+  # Full content, or NULL if the revision is stored in compact_content. Use
+  # the content property to get the content of both kinds of revisions.
+  _content = db.Column("content", LongJsonType, nullable=True)
+  compact_content = db.Column(CompressedJsonType, nullable=True)
 
   resource_slug = db.Column(db.String, nullable=True)
   source_type = db.Column(db.String, nullable=True)
@@ -74,6 +81,55 @@ class Revision(Base, db.Model):
                  "destination_id"]:
       setattr(self, attr, getattr(obj, attr, None))
 
+  def _needs_expansion(self):
+    """Check if the loaded revision is compacted and not expanded yet.
+
+    Only loaded attributes are checked, so expired instances are not
+    refreshed.
+    """
+    state = self.__dict__
+    return (state.get("_content") is None and
+            state.get("compact_content") is not None and
+            state.get("_expanded_content") is None)
+
+  @classmethod
+  def preload_contents(cls, revisions):
+    """Expand contents of compacted revisions with a single load_contents."""
+    revisions = [rev for rev in revisions if rev._needs_expansion()]
+    if not revisions:
+      return
+    contents = revision_storage.load_contents([rev.id for rev in revisions])
+    for rev in revisions:
+      rev._expanded_content = contents.get(rev.id)
+
+  @hybrid_property
+  def content(self):
+    """Full content of the revision, expanded if it is stored compacted.
+
+    The first compacted revision that is read expands all compacted
+    revisions loaded in the session, so publishing a collection of revisions
+    or snapshots does not load contents one revision at a time.
+    """
+    if self._content is None and self.compact_content is not None:
+      if getattr(self, "_expanded_content", None) is None:
+        session_revisions = [
+            obj for obj in db.session.identity_map.values()
+            if isinstance(obj, Revision) and obj is not self
+        ]
+        self.preload_contents([self] + session_revisions)
+      return self._expanded_content
+    return self._content
+
+  @content.setter
+  def content(self, value):
+    self._content = value
+    self.compact_content = None
+    self._expanded_content = None
+
+  @content.expression
+  def content(cls):  # pylint: disable=no-self-argument
+    return cls._content
+
   def _description_mapping(self, link_objects):
     """Compute description for revisions with <-> in display name."""
     display_name = self.content['display_name']
@@ -0,0 +1,183 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Compact storage of revision content.
+
+Revisions are written with their full content in revisions.content. Compacted
+revisions have a NULL content and store zlib compressed JSON in
+revisions.compact_content instead:
+
+  {
+      "base_id": id of the previous revision of the same object, or None for
+                 key revisions,
+      "set": {key: value} of values that differ from the base revision,
+      "unset": [keys missing in this revision but present in the base],
+  }
+
+Values with a JSON encoding of at least REVISION_BLOB_MIN_SIZE bytes, such as
+lists of custom attribute definitions, are replaced with {"$blob": <sha1>}
+references to revision_blobs, so each distinct value is stored only once.
+
+Code that rewrites revisions.content directly with SQL must expand compacted
+revisions first (see ggrc.utils.revisions.expand_revisions), because later
+revisions can be stored as deltas against them.
+"""
+
+import hashlib
+import json
+
+from ggrc import db
+from ggrc import settings
+from ggrc.models.types import CompressedJsonType
+from ggrc.utils import list_chunks
+
+
+BLOB_KEY = "$blob"
+
+revision_blobs = db.Table(
+    "revision_blobs",
+    db.Column("hash", db.String(40), primary_key=True),
+    db.Column("content", CompressedJsonType, nullable=False),
+)
+
+
+def _get_revisions_table():
+  from ggrc.models.revision import Revision
+  return Revision.__table__
+
+
+def _dumps(value):
+  return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def _is_blob_ref(value):
+  return isinstance(value, dict) and value.keys() == [BLOB_KEY]
+
+
+def encode(content, base_content=None, base_id=None):
+  """Get compact content of a revision.
+
+  Args:
+    content: full content of the revision.
+    base_content: full content of the revision the delta is computed
+      against, or None for a key revision.
+    base_id: id of the base revision.
+
+  Returns:
+    tuple of compact content and dict of blob hash -> value of all blobs
+    referenced by it.
+  """
+  if base_content is None:
+    base_content, base_id = {}, None
+  changed = {key: value for key, value in content.iteritems()
+             if key not in base_content or base_content[key] != value}
+  blobs = {}
+  min_size = getattr(settings, "REVISION_BLOB_MIN_SIZE", 512)
+  for key, value in changed.items():
+    if isinstance(value, (dict, list)):
+      dumped = _dumps(value)
+      if len(dumped) >= min_size:
+        hash_ = hashlib.sha1(dumped).hexdigest()
+        blobs[hash_] = value
+        changed[key] = {BLOB_KEY: hash_}
+  return {
+      "base_id": base_id,
+      "set": changed,
+      "unset": sorted(key for key in base_content if key not in content),
+  }, blobs
+
+
+def decode(compact, base_content, blobs):
+  """Get full content from compact content.
+
+  Args:
+    compact: compact content of the revision.
+    base_content: full content of the base revision or None for key
+      revisions.
+    blobs: dict of blob hash -> value containing all referenced blobs.
+  """
+  content = dict(base_content or {})
+  for key in compact["unset"]:
+    content.pop(key, None)
+  for key, value in compact["set"].iteritems():
+    if _is_blob_ref(value):
+      value = blobs[value[BLOB_KEY]]
+    content[key] = value
+  return content
+
+
+def store_blobs(blobs):
+  """Insert blobs that are not stored yet."""
+  if blobs:
+    db.session.execute(
+        revision_blobs.insert().prefix_with("IGNORE"),
+        [{"hash": hash_, "content": value}
+         for hash_, value in blobs.iteritems()],
+    )
+
+
+def _load_blobs(hashes):
+  blobs = {}
+  for hashes_chunk in list_chunks(list(hashes)):
+    blobs.update(db.session.query(
+        revision_blobs.c.hash, revision_blobs.c.content,
+    ).filter(revision_blobs.c.hash.in_(hashes_chunk)))
+  return blobs
+
+
+def _load_rows(revision_ids):
+  """Get (content, compact_content) of revisions by id."""
+  revisions_table = _get_revisions_table()
+  rows = {}
+  for ids_chunk in list_chunks(list(revision_ids)):
+    query = db.session.query(
+        revisions_table.c.id,
+        revisions_table.c.content,
+        revisions_table.c.compact_content,
+    ).filter(revisions_table.c.id.in_(ids_chunk))
+    rows.update((id_, (content, compact)) for id_, content, compact in query)
+  return rows
+
+
+def load_contents(revision_ids):
+  """Get full contents of revisions with one query per level of deltas.
+
+  Returns:
+    dict of revision id -> full content.
+  """
+  rows = _load_rows(revision_ids)
+  missing = {compact["base_id"] for _, compact in rows.itervalues()
+             if compact is not None and compact["base_id"] is not None}
+  while missing - set(rows):
+    base_rows = _load_rows(missing - set(rows))
+    rows.update(base_rows)
+    missing = {compact["base_id"] for _, compact in base_rows.itervalues()
+               if compact is not None and compact["base_id"] is not None}
+
+  blobs = _load_blobs({
+      value[BLOB_KEY]
+      for _, compact in rows.itervalues() if compact is not None
+      for value in compact["set"].itervalues() if _is_blob_ref(value)
+  })
+
+  contents = {}
+
+  def get_content(revision_id):
+    """Get content of a revision, decoding its base revisions first."""
+    chain = []
+    while revision_id not in contents:
+      content, compact = rows[revision_id]
+      if content is not None or compact["base_id"] is None:
+        contents[revision_id] = (
+            content if content is not None else decode(compact, None, blobs))
+        break
+      chain.append(revision_id)
+      revision_id = compact["base_id"]
+    base_content = contents[revision_id]
+    for chain_id in reversed(chain):
+      base_content = decode(rows[chain_id][1], base_content, blobs)
+      contents[chain_id] = base_content
+    return base_content
+
+  return {revision_id: get_content(revision_id)
+          for revision_id in revision_ids if revision_id in rows}
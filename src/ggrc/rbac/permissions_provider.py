@@ -142,123 +142,165 @@ _CONDITIONS_MAP = {
 }
 
 
-class DefaultUserPermissions(UserPermissions):
-  # super user, context_id 0 indicates all contexts
-  ADMIN_PERMISSION = Permission(
-      '__GGRC_ADMIN__',
-      '__GGRC_ALL__',
-      None,
-      0,
-  )
+# super user, context_id 0 indicates all contexts
+ADMIN_PERMISSION = Permission(
+    '__GGRC_ADMIN__',
+    '__GGRC_ALL__',
+    None,
+    0,
+)
 
-  def _admin_permission_for_context(self, context_id):
-    """Create an admin permission object for the given context"""
-    return Permission(
-        self.ADMIN_PERMISSION.action,
-        self.ADMIN_PERMISSION.resource_type,
-        None,
-        context_id)
+_EMPTY = frozenset()
 
-  def _permission_match(self, permission, permissions):
-    """Check if the user has the given permission"""
 
-    if None in \
-        permissions\
-            .get(permission.action, {})\
-            .get(permission.resource_type, {})\
-            .get('contexts', []):
-      return True
-    return \
-        permission.resource_id in permissions\
-        .get(permission.action, {})\
-        .get(permission.resource_type, {})\
-        .get('resources', [])\
-        or permission.context_id in \
-        permissions\
-        .get(permission.action, {})\
-        .get(permission.resource_type, {})\
-        .get('contexts', [])\
-        or permission.context_id in \
-        permissions\
-        .get(permission.action, {})\
-        .get(self.ADMIN_PERMISSION.resource_type, {})\
-        .get('contexts', [])
+class PermissionsIndex(object):
+  """Permissions dict of a user compiled for fast lookups.
 
-  @staticmethod
-  def _permissions():
-    """Returns request permission from the global scope"""
-    return getattr(g, '_request_permissions', {})
+  The nested permissions dict is turned into frozensets of contexts and
+  resources for each (action, resource_type) pair and condition names are
+  resolved to their functions, so permission checks are set lookups instead
+  of list scans. Results of permission checks are memoized.
+  """
 
-  def _is_allowed(self, permission):
-    permissions = self._permissions()
-    if permission.resource_type != '/admin' \
-       and permission.context_id \
-       and self._is_allowed(permission._replace(context_id=None)):
-      return True
-    if self._permission_match(permission, permissions):
-      return True
-    if self._permission_match(self.ADMIN_PERMISSION, permissions):
-      return True
-    return self._permission_match(
-        self._admin_permission_for_context(permission.context_id),
-        permissions)
+  def __init__(self, permissions):
+    self.permissions = permissions
+    self.contexts = {}
+    self.resources = {}
+    self.conditions = {}
+    self._allowed = {}
+    for action, resource_types in (permissions or {}).iteritems():
+      if not isinstance(resource_types, dict):
+        continue
+      for resource_type, type_permissions in resource_types.iteritems():
+        if not type_permissions:
+          continue
+        key = (action, resource_type)
+        self.contexts[key] = frozenset(type_permissions.get('contexts', ()))
+        self.resources[key] = frozenset(type_permissions.get('resources', ()))
+        self.conditions[key] = {
+            context_id: [
+                (_CONDITIONS_MAP[str(condition['condition'])],
+                 condition.get('terms') or {})
+                for condition in conditions
+            ]
+            for context_id, conditions in
+            type_permissions.get('conditions', {}).iteritems()
+        }
+    self.is_admin = self.match(ADMIN_PERMISSION.action,
+                               ADMIN_PERMISSION.resource_type,
+                               ADMIN_PERMISSION.resource_id,
+                               ADMIN_PERMISSION.context_id)
+
+  def match(self, action, resource_type, resource_id, context_id):
+    """Check if the user has the given permission"""
+    contexts = self.contexts.get((action, resource_type), _EMPTY)
+    return (
+        None in contexts or
+        context_id in contexts or
+        resource_id in self.resources.get((action, resource_type), _EMPTY) or
+        context_id in self.contexts.get(
+            (action, ADMIN_PERMISSION.resource_type), _EMPTY)
+    )
+
+  def is_allowed(self, action, resource_type, resource_id, context_id):
+    """Check permission directly or through admin permissions.
+
+    Permissions without a context also apply to all contexts.
+    """
+    key = (action, resource_type, resource_id, context_id)
+    if key not in self._allowed:
+      self._allowed[key] = (
+          self.is_admin or
+          self.match(action, resource_type, resource_id, context_id) or
+          self.match(ADMIN_PERMISSION.action, ADMIN_PERMISSION.resource_type,
+                     None, context_id) or
+          (bool(context_id) and resource_type != '/admin' and (
+              self.match(action, resource_type, resource_id, None) or
+              self.match(ADMIN_PERMISSION.action,
+                         ADMIN_PERMISSION.resource_type, None, None)))
+      )
+    return self._allowed[key]
+
+  def get_conditions(self, action, resource_type, context_id):
+    """Get conditions applied to the given context or to all contexts."""
+    conditions = self.conditions.get((action, resource_type), {})
+    if context_id is None:
+      return conditions.get(None, [])
+    return conditions.get(None, []) + conditions.get(context_id, [])
 
   @staticmethod
-  def _check_conditions(instance, action, conditions):
+  def check_conditions(instance, action, conditions):
     """Check if any condition is valid for the instance."""
-    for condition in conditions:
-      func = _CONDITIONS_MAP[str(condition['condition'])]
-      terms = condition.setdefault('terms', {})
+    for func, terms in conditions:
       if func(instance, _current_action=action, **terms):
         return True
     return False
 
-  def _is_allowed_for(self, instance, action):
-    permissions = self._permissions()
-    # Check for admin permission
-    if self._permission_match(self.ADMIN_PERMISSION, permissions):
-      conditions = permissions[self.ADMIN_PERMISSION.action]\
-          .get(self.ADMIN_PERMISSION.resource_type)\
-          .get("conditions", {})\
-          .get(None, [])
+  def is_allowed_for(self, instance, action):
+    """Check permission for an instance including permission conditions."""
+    if self.is_admin:
+      conditions = self.get_conditions(
+          ADMIN_PERMISSION.action, ADMIN_PERMISSION.resource_type, None)
       if not conditions:
         return True
-      return self._check_conditions(instance, action, conditions)
-    if (not permissions.get(action) or
-       not permissions[action].get(instance._inflector.model_singular)):
+      return self.check_conditions(instance, action, conditions)
+    key = (action, instance._inflector.model_singular)
+    if key not in self.contexts:
       return False
-    resources = self._permissions()\
-        .setdefault(action, {})\
-        .setdefault(instance._inflector.model_singular, {})\
-        .setdefault('resources', [])
-    contexts = self._permissions()\
-        .setdefault(action, {})\
-        .setdefault(instance._inflector.model_singular, {})\
-        .setdefault('contexts', [])
+    if instance.id in self.resources[key]:
+      return True
     # We can't use instance.context_id, because it requires the
     # object <-> context mapping to be created,
     # which isn't the case when creating objects
     context_id = None
     if hasattr(instance, 'context') and hasattr(instance.context, 'id'):
       context_id = instance.context.id
-    if instance.id in resources:
-      return True
-    no_context_conditions = self._permissions()\
-        .setdefault(action, {})\
-        .setdefault(instance._inflector.model_singular, {})\
-        .setdefault('conditions', {})\
-        .setdefault(None, [])
-
-    context_conditions = self._permissions()\
-        .setdefault(action, {})\
-        .setdefault(instance._inflector.model_singular, {})\
-        .setdefault('conditions', {})\
-        .setdefault(context_id, [])
-    conditions = no_context_conditions + context_conditions
+    conditions = self.get_conditions(key[0], key[1], context_id)
     # Check any conditions applied per resource
+    contexts = self.contexts[key]
     if (None in contexts or context_id in contexts) and not conditions:
       return True
-    return self._check_conditions(instance, action, conditions)
+    return self.check_conditions(instance, action, conditions)
+
+
+class DefaultUserPermissions(UserPermissions):
+  ADMIN_PERMISSION = ADMIN_PERMISSION
+
+  def _admin_permission_for_context(self, context_id):
+    """Create an admin permission object for the given context"""
+    return Permission(
+        self.ADMIN_PERMISSION.action,
+        self.ADMIN_PERMISSION.resource_type,
+        None,
+        context_id)
+
+  def _permission_match(self, permission, permissions):
+    """Check if the user has the given permission"""
+    return self._permissions_index(permissions).match(*permission)
+
+  @staticmethod
+  def _permissions():
+    """Returns request permission from the global scope"""
+    return getattr(g, '_request_permissions', {})
+
+  def _permissions_index(self, permissions=None):
+    """Get permissions index compiled once per request.
+
+    The index is rebuilt whenever the request permissions are replaced.
+    """
+    if permissions is None:
+      permissions = self._permissions()
+    index = getattr(g, '_request_permissions_index', None)
+    if index is None or index.permissions is not permissions:
+      index = PermissionsIndex(permissions)
+      g._request_permissions_index = index
+    return index
+
+  def _is_allowed(self, permission):
+    return self._permissions_index().is_allowed(*permission)
+
+  def _is_allowed_for(self, instance, action):
+    return self._permissions_index().is_allowed_for(instance, action)
 
   def is_allowed_create(self, resource_type, resource_id, context_id):
     """Whether or not the user is allowed to create a resource of the specified
@@ -305,7 +347,7 @@ class DefaultUserPermissions(UserPermissions):
     resource_type"""
     permissions = self._permissions()
 
-    if self._permission_match(self.ADMIN_PERMISSION, permissions):
+    if self._permissions_index(permissions).is_admin:
       return None
 
     # Get the list of resources for a given resource type and any
@@ -326,7 +368,7 @@ class DefaultUserPermissions(UserPermissions):
     #   permissions are expected (e.g. that every user has ADMIN_PERMISSION).
     permissions = self._permissions()
 
-    if self._permission_match(self.ADMIN_PERMISSION, permissions):
+    if self._permissions_index(permissions).is_admin:
       return None
 
     # Get the list of contexts for a given resource type and any
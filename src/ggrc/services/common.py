@@ -30,7 +30,8 @@ from werkzeug.exceptions import BadRequest, Forbidden
 import ggrc.builder.json
 import ggrc.models
 from ggrc import db, utils
-from ggrc.utils import as_json, benchmark
+from ggrc.utils import as_json, benchmark, keyset
+from ggrc.utils import profiler
 from ggrc.fulltext import get_indexer
 from ggrc.fulltext.recordbuilder import fts_record_for
 from ggrc.login import get_current_user_id, get_current_user
@@ -38,9 +39,11 @@ from ggrc.models.cache import Cache
 from ggrc.models.event import Event
 from ggrc.models.revision import Revision
 from ggrc.models.exceptions import ValidationError, translate_message
+from ggrc.models.mixins.customattributable import preloaded_log_definitions
 from ggrc.rbac import permissions, context_query_filter
 from ggrc.services.attribute_query import AttributeQueryBuilder
 from ggrc.models.background_task import BackgroundTask, create_task
+from ggrc.models.background_task import use_task_queue
 from ggrc import settings
 
 
@@ -261,7 +264,6 @@ def update_memcache_after_commit(context):
     if delete_result is not True:
       logger.error("CACHE: Failed to remove status entries from cache")
 
-  clear_permission_cache()
   cache_manager.clear_cache()
 
 
@@ -316,28 +318,47 @@ def update_index(session, cache):
   reindex_snapshots_list = []
   if cache:
     indexer = get_indexer()
+    new_records = []
     for obj in cache.new:
       if obj.type == "Snapshot":
         reindex_snapshots_list.append(obj.id)
       else:
-        indexer.create_record(fts_record_for(obj), commit=False)
+        new_records.append(fts_record_for(obj))
+    dirty_records = []
     for obj in cache.dirty:
       if obj.type == "Snapshot":
         reindex_snapshots_list.append(obj.id)
       else:
-        indexer.update_record(fts_record_for(obj), commit=False)
-    for obj in cache.deleted:
-      indexer.delete_record(obj.id, obj.__class__.__name__, commit=False)
+        dirty_records.append(fts_record_for(obj))
+    indexer.create_records(new_records, commit=False)
+    indexer.update_records(dirty_records, commit=False)
+    indexer.delete_records(
+        [(obj.__class__.__name__, obj.id) for obj in cache.deleted],
+        commit=False,
+    )
     session.commit()
   if reindex_snapshots_list:
-    for snapshot_id in reindex_snapshots_list:
-      indexer.delete_record(snapshot_id, "Snapshot", commit=False)
+    indexer.delete_records(
+        [("Snapshot", snapshot_id) for snapshot_id in reindex_snapshots_list],
+        commit=False,
+    )
     reindex_snapshots(reindex_snapshots_list)
 
 
+def _get_cached_log_json(objects, obj):
+  """Get log JSON of obj recorded in a cache collection or None."""
+  if isinstance(objects, dict):
+    return objects.get(obj)
+  return None
+
+
 def _revision_generator(user_id, action, objects):
+  """Generate revisions with cached or freshly computed log JSON."""
   for obj in objects:
-    yield Revision(obj, user_id, action, obj.log_json())
+    content = _get_cached_log_json(objects, obj)
+    if content is None:
+      content = obj.log_json()
+    yield Revision(obj, user_id, action, content)
 
 
 def _get_log_revisions(current_user_id, obj=None, force_obj=False):
@@ -349,25 +370,30 @@ def _get_log_revisions(current_user_id, obj=None, force_obj=False):
   all_edited_objects = itertools.chain(cache.new, cache.dirty, cache.deleted)
   owner_modified_objects = [o.ownable for o in all_edited_objects
                             if o.type == "ObjectOwner" and o.ownable]
-  revisions.extend(_revision_generator(
-      current_user_id, "created", cache.new
-  ))
-  revisions.extend(_revision_generator(
-      current_user_id, "modified", cache.dirty
-  ))
-  revisions.extend(_revision_generator(
-      current_user_id, "modified", owner_modified_objects
-  ))
-  if force_obj and obj is not None and obj not in cache.dirty:
-    # If the ``obj`` has been updated, but only its custom attributes have
-    # been changed, then this object will not be added into
-    # ``cache.dirty set``. So that its revision will not be created.
-    # The ``force_obj`` flag solves the issue, but in a bit dirty way.
-    revision = Revision(obj, current_user_id, 'modified', obj.log_json())
-    revisions.append(revision)
-  revisions.extend(_revision_generator(
-      current_user_id, "deleted", cache.deleted
-  ))
+  logged_objects = itertools.chain(
+      cache.new, cache.dirty, owner_modified_objects, [obj],
+      (o for o in cache.deleted
+       if _get_cached_log_json(cache.deleted, o) is None))
+  with preloaded_log_definitions(logged_objects):
+    revisions.extend(_revision_generator(
+        current_user_id, "created", cache.new
+    ))
+    revisions.extend(_revision_generator(
+        current_user_id, "modified", cache.dirty
+    ))
+    revisions.extend(_revision_generator(
+        current_user_id, "modified", owner_modified_objects
+    ))
+    if force_obj and obj is not None and obj not in cache.dirty:
+      # If the ``obj`` has been updated, but only its custom attributes have
+      # been changed, then this object will not be added into
+      # ``cache.dirty set``. So that its revision will not be created.
+      # The ``force_obj`` flag solves the issue, but in a bit dirty way.
+      revision = Revision(obj, current_user_id, 'modified', obj.log_json())
+      revisions.append(revision)
+    revisions.extend(_revision_generator(
+        current_user_id, "deleted", cache.deleted
+    ))
   return revisions
 
 
@@ -412,17 +438,6 @@ def log_event(session, obj=None, current_user_id=None, flush=True,
   return event
 
 
-def clear_permission_cache():
-  if not getattr(settings, 'MEMCACHE_MECHANISM', False):
-    return
-  cache = _get_cache_manager().cache_object.memcache_client
-  cached_keys_set = cache.get('permissions:list') or set()
-  cached_keys_set.add('permissions:list')
-  # We delete all the cached user permissions as well as
-  # the permissions:list value itself
-  cache.delete_multi(cached_keys_set)
-
-
 class ModelView(View):
   """Basic view handler for all models"""
   # pylint: disable=protected-access
@@ -996,7 +1011,7 @@ class Resource(ModelView):
   def delete(self, id):
     if 'X-Appengine-Taskname' not in request.headers:
       task = create_task(request.method, request.full_path)
-      if getattr(settings, 'APP_ENGINE', False):
+      if use_task_queue():
         return self.json_success_response(
             self.object_for_json(task, 'background_task'),
             self.modified_at(task))
@@ -1078,6 +1093,51 @@ class Resource(ModelView):
     }
     return matches, collection_extras
 
+  def apply_keyset_paging(self, matches_query):
+    """Get a page of matches that starts after the `__cursor` request arg.
+
+    Pages are ordered by the default collection ordering, which is the
+    modification time and id. The total number of matches is counted only
+    for the first page and carried in cursors of the following pages, unless
+    `__no_total` is requested.
+    """
+    if '__sort' in request.args or '__limit' in request.args:
+      raise BadRequest("__cursor can not be combined with __sort or __limit")
+    page_size = min(
+        int(request.args.get('__page_size', self.DEFAULT_PAGE_SIZE)),
+        self.MAX_PAGE_SIZE)
+    order = [(self.modified_attr, True), (self.model.id, True)]
+    query = matches_query
+    total = None
+    if request.args['__cursor']:
+      try:
+        values, total = keyset.decode_cursor(request.args['__cursor'],
+                                             len(order))
+      except ValueError as error:
+        raise BadRequest(error.message)
+      query = query.filter(keyset.after(order, values))
+    matches = query.limit(page_size + 1).all()
+    has_next = len(matches) > page_size
+    matches = matches[:page_size]
+    if total is None and '__no_total' not in request.args:
+      if request.args['__cursor'] or has_next:
+        total = matches_query.count()
+      else:
+        total = len(matches)
+
+    def page_url(cursor):
+      args = dict([(k, unicode(v)) for k, v in request.args.items()])
+      args['__cursor'] = cursor
+      return self.url_for() + '?' + urlencode(utils.encoded_dict(args))
+
+    paging_obj = {'first': page_url(''), 'total': total}
+    if has_next:
+      last = matches[-1]
+      paging_obj['next_cursor'] = keyset.encode_cursor(
+          (getattr(last, self.modified_attr_name), last.id), total)
+      paging_obj['next'] = page_url(paging_obj['next_cursor'])
+    return matches, {'paging': paging_obj}
+
   def get_matched_resources(self, matches):
     cache_objs = {}
     if self.has_cache():
@@ -1118,7 +1178,10 @@ class Resource(ModelView):
       matches_query = self.get_collection_matches(
           self.model, filter_by_contexts)
     with benchmark("dispatch_request > collection_get > Query Data"):
-      if '__page' in request.args or '__page_only' in request.args:
+      if '__cursor' in request.args:
+        with benchmark("Query matches with keyset paging"):
+          matches, extras = self.apply_keyset_paging(matches_query)
+      elif '__page' in request.args or '__page_only' in request.args:
         with benchmark("Query matches with paging"):
           matches, extras = self.apply_paging(matches_query)
       else:
@@ -1182,13 +1245,10 @@ class Resource(ModelView):
       key = get_cache_key(None, id=match[0], type=match[1])
       key_matches[key] = match
       keys.append(key)
-    while len(keys) > 0:
-      slice_keys = keys[:32]
-      keys = keys[32:]
-      result = memcache_client.get_multi(slice_keys)
-      for key in result:
-        if 'selfLink' in result[key]:
-          resources[key_matches[key]] = result[key]
+    result = memcache_client.get_multi(keys)
+    for key in result:
+      if 'selfLink' in result[key]:
+        resources[key_matches[key]] = result[key]
     return resources
 
   def add_resources_to_cache(self, match_obj_pairs):
@@ -1204,17 +1264,10 @@ class Resource(ModelView):
       keys.append(key)
       key_objs[key] = obj
       key_blockers[key] = delete_op_key
-    while len(keys) > 0:
-      slice_keys = keys[:32]
-      keys = keys[32:]
-      blocker_keys = [key_blockers[slice_key] for slice_key in slice_keys]
-      result = memcache_client.get_multi(blocker_keys)
-      # Reduce `slice_keys` to only unblocked keys
-      slice_keys = [
-          slice_key for slice_key in slice_keys
-          if key_blockers[slice_key] not in result]
-      memcache_client.add_multi(
-          {key: key_objs[key] for key in slice_keys})
+    result = memcache_client.get_multi(key_blockers.values())
+    # Reduce `keys` to only unblocked keys
+    keys = [k for k in keys if key_blockers[k] not in result]
+    memcache_client.add_multi({k: key_objs[k] for k in keys})
 
   def json_create(self, obj, src):
     ggrc.builder.json.create(obj, src)
@@ -1440,7 +1493,7 @@ class Resource(ModelView):
         if 'X-Appengine-Taskname' not in request.headers:
           task = create_task(request.method, request.full_path,
                              None, request.data)
-          if getattr(settings, 'APP_ENGINE', False):
+          if use_task_queue():
             return self.json_success_response(
                 self.object_for_json(task, 'background_task'),
                 self.modified_at(task))
@@ -1529,7 +1582,8 @@ class Resource(ModelView):
   # Response helpers
   @classmethod
   def as_json(cls, obj, **kwargs):
-    return as_json(obj, **kwargs)
+    with profiler.timer("serialization"):
+      return as_json(obj, **kwargs)
 
   def get_properties_to_include(self, inclusions):
     # FIXME This needs to be improved to deal with branching paths... if that's
@@ -1658,25 +1712,27 @@ class ReadOnlyResource(Resource):
       raise NotImplementedError()
 
 
-def filter_resource(resource, depth=0, user_permissions=None):  # noqa
-  """
-  Returns:
-     The subset of resources which are readable based on user_permissions
+class ReadFilter(object):
+  """Filter JSON representations by read permissions of the current user.
+
+  All objects in the representation are collected first, so that every
+  distinct (type, id, context_id) triple is checked only once and instances
+  needed for checking Revision permissions are loaded with one query per
+  type. The representation is then pruned with the collected results.
   """
 
-  if user_permissions is None:
-    user_permissions = permissions.permissions_for(get_current_user())
+  def __init__(self, user_permissions):
+    self.user_permissions = user_permissions
+    self.is_creator = _is_creator()
+    self.read_checks = set()
+    self.revision_resources = defaultdict(set)
+    self.allowed = {}
+    self.allowed_revision_resources = set()
+    self.type_permissions = {}
 
-  if isinstance(resource, (list, tuple)):
-    filtered = []
-    for sub_resource in resource:
-      filtered_sub_resource = filter_resource(
-          sub_resource, depth=depth + 1, user_permissions=user_permissions)
-      if filtered_sub_resource is not None:
-        filtered.append(filtered_sub_resource)
-    return filtered
-  elif isinstance(resource, dict) and 'type' in resource:
-    # First check current level
+  @staticmethod
+  def _get_context_id(resource):
+    """Get context id of a typed resource dict."""
     context_id = False
     if 'context' in resource:
       if resource['context'] is None:
@@ -1686,57 +1742,129 @@ def filter_resource(resource, depth=0, user_permissions=None):  # noqa
     elif 'context_id' in resource:
       context_id = resource['context_id']
     assert context_id is not False, "No context found for object"
+    return context_id
 
-    # In order to avoid loading full instances and using is_allowed_read_for,
-    # we are making a special test for the Creator here. Creator can only
-    # see relationship objects where he has read access on both source and
-    # destination. This is defined in Creator.py:220 file, but is_allowed_read
-    # can not check conditions without the full instance
-    if resource['type'] == "Relationship" and _is_creator():
-      # Make a check for relationship objects that are a special case
-      can_read = True
-      for name in ('source', 'destination'):
-        inst = resource[name]
-        if not inst:
-          # If object was deleted but relationship still exists
-          continue
-        contexts = permissions.read_contexts_for(inst['type'])
-        if contexts is None:
-          # read_contexts_for returns None if the user has access to all the
-          # objects of this type. If the user doesn't have access to any object
-          # an empty list ([]) will be returned
-          continue
-        resources = permissions.read_resources_for(inst['type']) or []
-        if inst['context_id'] in contexts or inst['id'] in resources:
-          continue
-        can_read = False
-      if not can_read:
-        return None
-    elif resource['type'] == "Revision" and _is_creator():
-      # Make a check for revision objects that are a special case
-      res_model = getattr(ggrc.models.all_models, resource['resource_type'])
-      instance = res_model.query.get(resource['resource_id'])
-      if instance is None or\
-         not user_permissions.is_allowed_read_for(instance):
-        return None
-    else:
-      if not user_permissions.is_allowed_read(resource['type'],
-                                              resource['id'], context_id):
-        return None
-    # Then, filter any typed keys
-    for key, value in resource.items():
-      if key == 'context':
-        # Explicitly allow `context` objects to pass through
-        pass
+  @staticmethod
+  def _get_sub_resources(resource):
+    """Get keys of typed sub-resources that need to be filtered."""
+    # `context` objects are explicitly allowed to pass through
+    return [key for key, value in resource.items()
+            if key != 'context' and isinstance(value, dict) and
+            'type' in value]
+
+  def _get_type_permissions(self, resource_type):
+    """Get readable contexts and resources for a type as sets.
+
+    Returns:
+      None if all objects of the type are readable, otherwise a tuple of
+      readable context ids and readable object ids.
+    """
+    if resource_type not in self.type_permissions:
+      contexts = permissions.read_contexts_for(resource_type)
+      if contexts is None:
+        # read_contexts_for returns None if the user has access to all the
+        # objects of this type. If the user doesn't have access to any object
+        # an empty list ([]) will be returned
+        self.type_permissions[resource_type] = None
       else:
-        # Apply filtering to sub-resources
-        if isinstance(value, dict) and 'type' in value:
-          resource[key] = filter_resource(
-              value, depth=depth + 1, user_permissions=user_permissions)
+        resources = permissions.read_resources_for(resource_type) or []
+        self.type_permissions[resource_type] = (set(contexts), set(resources))
+    return self.type_permissions[resource_type]
+
+  def _can_read_relationship(self, resource):
+    """Check if a Creator can read both ends of a relationship.
+
+    In order to avoid loading full instances and using is_allowed_read_for,
+    we are making a special test for the Creator here. Creator can only see
+    relationship objects where he has read access on both source and
+    destination. This is defined in Creator.py:220 file, but is_allowed_read
+    can not check conditions without the full instance.
+    """
+    for name in ('source', 'destination'):
+      inst = resource[name]
+      if not inst:
+        # If object was deleted but relationship still exists
+        continue
+      type_permissions = self._get_type_permissions(inst['type'])
+      if type_permissions is None:
+        continue
+      contexts, resources = type_permissions
+      if inst['context_id'] in contexts or inst['id'] in resources:
+        continue
+      return False
+    return True
+
+  def collect(self, resource):
+    """Collect permission checks needed for the given representation."""
+    if isinstance(resource, (list, tuple)):
+      for sub_resource in resource:
+        self.collect(sub_resource)
+      return
+    assert isinstance(resource, dict) and 'type' in resource, \
+        "Non-object passed to filter_resource"
+    context_id = self._get_context_id(resource)
+    if resource['type'] == "Revision" and self.is_creator:
+      self.revision_resources[resource['resource_type']].add(
+          resource['resource_id'])
+    elif resource['type'] != "Relationship" or not self.is_creator:
+      self.read_checks.add((resource['type'], resource['id'], context_id))
+    for key in self._get_sub_resources(resource):
+      self.collect(resource[key])
+
+  def resolve(self):
+    """Run all collected permission checks."""
+    for check in self.read_checks:
+      self.allowed[check] = self.user_permissions.is_allowed_read(*check)
+    for resource_type, ids in self.revision_resources.iteritems():
+      # Make a check for revision objects that are a special case
+      res_model = getattr(ggrc.models.all_models, resource_type)
+      for id_chunk in utils.list_chunks(list(ids)):
+        for instance in res_model.query.filter(res_model.id.in_(id_chunk)):
+          if self.user_permissions.is_allowed_read_for(instance):
+            self.allowed_revision_resources.add((resource_type, instance.id))
+
+  def is_allowed(self, resource):
+    """Check if a collected resource is readable."""
+    if resource['type'] == "Relationship" and self.is_creator:
+      return self._can_read_relationship(resource)
+    if resource['type'] == "Revision" and self.is_creator:
+      return ((resource['resource_type'], resource['resource_id']) in
+              self.allowed_revision_resources)
+    return self.allowed[(resource['type'], resource['id'],
+                         self._get_context_id(resource))]
+
+  def prune(self, resource):
+    """Remove unreadable objects from a collected representation.
 
+    Returns:
+      The subset of resources which are readable.
+    """
+    if isinstance(resource, (list, tuple)):
+      filtered = []
+      for sub_resource in resource:
+        filtered_sub_resource = self.prune(sub_resource)
+        if filtered_sub_resource is not None:
+          filtered.append(filtered_sub_resource)
+      return filtered
+    if not self.is_allowed(resource):
+      return None
+    for key in self._get_sub_resources(resource):
+      resource[key] = self.prune(resource[key])
     return resource
-  else:
-    assert False, "Non-object passed to filter_resource"
+
+
+def filter_resource(resource, depth=0, user_permissions=None):
+  """
+  Returns:
+     The subset of resources which are readable based on user_permissions
+  """
+  # pylint: disable=unused-argument
+  if user_permissions is None:
+    user_permissions = permissions.permissions_for(get_current_user())
+  read_filter = ReadFilter(user_permissions)
+  read_filter.collect(resource)
+  read_filter.resolve()
+  return read_filter.prune(resource)
 
 
 def _is_creator():
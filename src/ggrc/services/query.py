@@ -16,6 +16,7 @@ from ggrc.login import login_required
 from ggrc.models.inflector import get_model
 from ggrc.services.common import etag
 from ggrc.utils import as_json
+from ggrc.utils import profiler
 
 
 def build_collection_representation(model, description):
@@ -46,9 +47,9 @@ def json_success_response(response_object, last_modified=None, status=200):
   if last_modified is not None:
     headers.append(('Last-Modified', http_timestamp(last_modified)))
 
-  return current_app.make_response(
-      (as_json(response_object), status, headers),
-  )
+  with profiler.timer("serialization"):
+    body = as_json(response_object)
+  return current_app.make_response((body, status, headers))
 
 
 def http_timestamp(timestamp):
@@ -66,7 +67,7 @@ def get_objects_by_query():
                         if result["last_modified"]]
   last_modified = max(last_modified_list) if last_modified_list else None
   collections = []
-  collection_fields = ["ids", "values", "count", "total"]
+  collection_fields = ["ids", "values", "count", "total", "next_cursor"]
 
   for result in results:
     if last_modified is None:
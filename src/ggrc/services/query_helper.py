@@ -3,6 +3,9 @@
 
 """This module contains special query helper class for query API."""
 
+import sqlalchemy as sa
+
+from ggrc import db
 from ggrc.builder import json
 from ggrc.converters.query_helper import QueryHelper
 from ggrc.utils import benchmark
@@ -30,7 +33,9 @@ class QueryAPIQueryHelper(QueryHelper):
       values: [ filtered objects in JSON ] (present if type is "values")
       ids: [ ids of filtered objects ] (present if type is "ids")
       count: the number of objects filtered, after "limit" is applied
+             ("count" queries are executed as SELECT COUNT(*) statements)
       total: the number of objects filtered, before "limit" is applied
+      next_cursor: cursor of the next page (present if "cursor" was given)
   """
   def get_results(self):
     """Filter the objects and get their information.
@@ -42,6 +47,7 @@ class QueryAPIQueryHelper(QueryHelper):
       list of dicts: same query as the input with requested results that match
                      the filter.
     """
+    count_queries = []
     for object_query in self.query:
       query_type = object_query.get("type", "values")
       if query_type not in {"values", "ids", "count"}:
@@ -60,15 +66,63 @@ class QueryAPIQueryHelper(QueryHelper):
               objects,
               object_query.get("fields"),
           )
-      else:
+      elif query_type == "ids":
         with benchmark("Get result set: get_results -> _get_ids"):
           ids = self._get_ids(object_query)
         object_query["count"] = len(ids)
         object_query["last_modified"] = None  # synonymous to now()
-        if query_type == "ids":
-          object_query["ids"] = ids
+        object_query["ids"] = ids
+      else:
+        with benchmark("Get count query: get_results -> _build_query"):
+          query = self._build_query(object_query)
+        self._clear_similar_objects_query()
+        object_query["last_modified"] = None  # synonymous to now()
+        if query is None:
+          object_query["count"] = 0
+        else:
+          count_queries.append((object_query, query))
+    if count_queries:
+      with benchmark("Get counts: get_results -> _set_counts"):
+        self._set_counts(count_queries)
     return self.query
 
+  def _set_counts(self, count_queries):
+    """Count objects of multiple object queries in a single statement.
+
+    The queries are turned into SELECT COUNT(*) statements without ordering
+    and joined with UNION ALL.
+
+    Args:
+      count_queries: list of (object query, query for object ids) tuples.
+    """
+    limits = [self._parse_limit(object_query["limit"])
+              if object_query.get("limit") else None
+              for object_query, _ in count_queries]
+    statements = []
+    for index, (_, query) in enumerate(count_queries):
+      statement = query.statement
+      count_statement = statement.with_only_columns([
+          sa.literal(index), sa.func.count(),
+      ])
+      # keep the FROM clause of queries without filters on object columns
+      for from_clause in statement.froms:
+        count_statement = count_statement.select_from(from_clause)
+      statements.append(count_statement)
+    if len(statements) > 1:
+      statement = sa.union_all(*statements)
+    else:
+      statement = statements[0]
+    totals = dict(db.session.execute(statement).fetchall())
+
+    for index, (object_query, _) in enumerate(count_queries):
+      total = totals.get(index, 0)
+      object_query["total"] = total
+      if limits[index]:
+        first, last = limits[index]
+        object_query["count"] = max(min(total, last) - first, 0)
+      else:
+        object_query["count"] = total
+
   @staticmethod
   def _transform_to_json(objects, fields=None):
     """Make a JSON representation of objects from the list."""
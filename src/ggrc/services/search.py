@@ -13,6 +13,20 @@ from ggrc.utils import GrcEncoder, url_for, benchmark
 from ggrc import db
 
 
+def _get_limit():
+  """Get positive integer "limit" query parameter or None."""
+  limit = request.args.get('limit')
+  if limit is None:
+    return None
+  try:
+    limit = int(limit)
+  except ValueError:
+    raise BadRequest('Query parameter "limit" must be an integer.')
+  if limit < 1:
+    raise BadRequest('Query parameter "limit" must be positive.')
+  return limit
+
+
 def search():
   terms = request.args.get('q')
   permission_type = request.args.get('__permission_type', 'read')
@@ -25,6 +39,8 @@ def search():
   should_group_by_type = should_group_by_type.lower() == 'true'
   should_just_count = request.args.get('counts_only', '')
   should_just_count = should_just_count.lower() == 'true'
+  should_include_counts = request.args.get('with_counts', '')
+  should_include_counts = should_include_counts.lower() == 'true'
 
   types = request.args.get('types', '')
   types = [t.strip() for t in types.split(',') if len(t.strip()) > 0]
@@ -59,6 +75,9 @@ def search():
     relevant_objects = [tuple(obj.split(':'))
                         for obj in relevant_objects.split(',')]
 
+  if should_include_counts:
+    return search_with_counts(terms, types, contact_id, extra_params,
+                              extra_columns, relevant_objects, _get_limit())
   if should_just_count:
     return do_counts(terms, types, contact_id, extra_params, extra_columns)
   if should_group_by_type:
@@ -97,6 +116,44 @@ def do_counts(terms, types=None, contact_id=None,
   ))
 
 
+def search_with_counts(terms, types=None, contact_id=None, extra_params=None,
+                       extra_columns=None, relevant_objects=None, limit=None):
+  """Get counts and the first entries of each type with a single query.
+
+  The response contains the same counts as a counts_only request and the
+  first `limit` entries of each type as a group_by_type search.
+  """
+  indexer = get_indexer()
+  kwargs = {} if limit is None else {"limit": limit}
+  with benchmark("Search with counts"):
+    results = indexer.search_counts(
+        terms, types=types, contact_id=contact_id,
+        extra_params=extra_params, extra_columns=extra_columns,
+        relevant_objects=relevant_objects, **kwargs)
+
+  counts = {}
+  entries = {}
+  for label, model_type, count, keys in results:
+    counts[label or model_type] = count
+    if not label:
+      entries[model_type] = [{
+          'id': key,
+          'type': model_type,
+          'href': url_for(model_type, id=key),
+      } for key in keys]
+  return current_app.make_response((
+      json.dumps({
+          'results': {
+              'selfLink': request.url,
+              'entries': entries,
+              'counts': counts,
+          }
+      }, cls=GrcEncoder),
+      200,
+      [('Content-Type', 'application/json')],
+  ))
+
+
 def _build_relevant_filter(types, relevant_objects):
   if relevant_objects is None:
     relevant_objects = []
@@ -70,6 +70,26 @@ SECRET_KEY = os.environ.get('GGRC_SECRET_KEY', 'Replace-with-something-secret')
 
 MEMCACHE_MECHANISM = True
 
+# Memcache client used by the memcache mechanism, see ggrc.cache.backends.
+# "appengine" uses the App Engine memcache service, "memcached" uses the
+# memcached servers in GGRC_MEMCACHE_SERVERS, a comma separated list of
+# host:port pairs. With a positive MEMCACHE_LOCAL_SIZE, up to that many values
+# are also kept in process memory for MEMCACHE_LOCAL_TTL seconds. Permission
+# and metadata version keys are never kept locally, so invalidations by other
+# processes apply right away. Other values, such as cached API resources, can
+# be stale in a process for up to MEMCACHE_LOCAL_TTL seconds after another
+# process changes them.
+MEMCACHE_BACKEND = os.environ.get("GGRC_MEMCACHE_BACKEND", "appengine")
+MEMCACHE_SERVERS = [
+    server for server in os.environ.get(
+        "GGRC_MEMCACHE_SERVERS", "127.0.0.1:11211").split(",")
+    if server
+]
+MEMCACHE_POOL_SIZE = int(os.environ.get("GGRC_MEMCACHE_POOL_SIZE", "10"))
+MEMCACHE_TIMEOUT = float(os.environ.get("GGRC_MEMCACHE_TIMEOUT", "1"))
+MEMCACHE_LOCAL_SIZE = int(os.environ.get("GGRC_MEMCACHE_LOCAL_SIZE", "0"))
+MEMCACHE_LOCAL_TTL = float(os.environ.get("GGRC_MEMCACHE_LOCAL_TTL", "5"))
+
 # AppEngine Email
 APPENGINE_EMAIL = os.environ.get('APPENGINE_EMAIL', '')
 
@@ -93,6 +113,59 @@ USE_APP_ENGINE_ASSETS_SUBDOMAIN = False
 
 BACKGROUND_COLLECTION_POST_SLEEP = 0
 
+# Outside of App Engine, background tasks run synchronously inside the
+# request that created them, unless LOCAL_TASK_QUEUE is enabled. Queued tasks
+# are stored in the task_queue table and run by the worker pool started with
+# `python -m ggrc.task_queue`. A task that stops without recording a result
+# is retried up to LOCAL_TASK_QUEUE_MAX_ATTEMPTS times. Tasks with a name in
+# LOCAL_TASK_QUEUE_CONCURRENCY are limited to that many concurrent runs.
+LOCAL_TASK_QUEUE = os.environ.get("GGRC_LOCAL_TASK_QUEUE", "") == "true"
+LOCAL_TASK_QUEUE_WORKERS = int(
+    os.environ.get("GGRC_LOCAL_TASK_QUEUE_WORKERS", "2"))
+LOCAL_TASK_QUEUE_POLL_INTERVAL = float(
+    os.environ.get("GGRC_LOCAL_TASK_QUEUE_POLL_INTERVAL", "2"))
+LOCAL_TASK_QUEUE_LEASE_SECONDS = int(
+    os.environ.get("GGRC_LOCAL_TASK_QUEUE_LEASE_SECONDS", "300"))
+LOCAL_TASK_QUEUE_MAX_ATTEMPTS = int(
+    os.environ.get("GGRC_LOCAL_TASK_QUEUE_MAX_ATTEMPTS", "3"))
+LOCAL_TASK_QUEUE_CONCURRENCY = {
+    "reindex": 1,
+    "refresh_revisions": 1,
+    "compact_revisions": 1,
+    "upsert_snapshots": 1,
+}
+
+# Stream CSV exports in chunks of rows instead of building the whole file in
+# memory. App Engine buffers responses, so this is only useful elsewhere.
+EXPORT_STREAMING = os.environ.get("GGRC_EXPORT_STREAMING", "") == "true"
+
+# Number of worker processes used for rebuilding the full text index. Worker
+# processes are not available on App Engine.
+FULLTEXT_REINDEX_WORKERS = int(
+    os.environ.get("GGRC_FULLTEXT_REINDEX_WORKERS", "1"))
+
+# Must match the innodb_ft_min_token_size setting of the MySQL server when
+# ggrc.fulltext.mysql.MysqlFulltextIndexer is used as FULLTEXT_INDEXER.
+FULLTEXT_MIN_TOKEN_SIZE = int(
+    os.environ.get("GGRC_FULLTEXT_MIN_TOKEN_SIZE", "3"))
+
+# Compacted revisions are stored as deltas against the previous revision of
+# the same object, with a full key revision after every
+# REVISION_KEYFRAME_INTERVAL revisions. Content values with a JSON encoding
+# of at least REVISION_BLOB_MIN_SIZE bytes are stored once in revision_blobs.
+REVISION_KEYFRAME_INTERVAL = int(
+    os.environ.get("GGRC_REVISION_KEYFRAME_INTERVAL", "20"))
+REVISION_BLOB_MIN_SIZE = int(
+    os.environ.get("GGRC_REVISION_BLOB_MIN_SIZE", "512"))
+
+# Snapshots are created and updated in chunks of SNAPSHOT_CHUNK_SIZE pairs,
+# each written in its own transactions. Snapshot scopes of more than
+# SNAPSHOT_BACKGROUND_THRESHOLD objects are processed by a background task
+# when tasks run outside of requests. 0 disables background processing.
+SNAPSHOT_CHUNK_SIZE = int(os.environ.get("GGRC_SNAPSHOT_CHUNK_SIZE", "1000"))
+SNAPSHOT_BACKGROUND_THRESHOLD = int(
+    os.environ.get("GGRC_SNAPSHOT_BACKGROUND_THRESHOLD", "0"))
+
 
 LOGGING_HANDLER = {
     "class": "logging.StreamHandler",
@@ -119,5 +192,16 @@ LOGGING_LOGGERS = {
 
 DEBUG_BENCHMARK = os.environ.get("GGRC_BENCHMARK")
 
+# Record SQL statements, database time and serialization time of every
+# request, see ggrc.utils.profiler. Statements repeated at least
+# REQUEST_PROFILER_REPEAT_THRESHOLD times in one request are reported as
+# possible N+1 queries. Stats of the last REQUEST_PROFILER_HISTORY requests
+# of every endpoint are kept for /admin/profile.
+REQUEST_PROFILER = os.environ.get("GGRC_REQUEST_PROFILER", "") == "true"
+REQUEST_PROFILER_REPEAT_THRESHOLD = int(
+    os.environ.get("GGRC_REQUEST_PROFILER_REPEAT_THRESHOLD", "10"))
+REQUEST_PROFILER_HISTORY = int(
+    os.environ.get("GGRC_REQUEST_PROFILER_HISTORY", "1000"))
+
 # GGRCQ integration
 GGRC_Q_INTEGRATION_URL = os.environ.get('GGRC_Q_INTEGRATION_URL', '')
@@ -8,15 +8,23 @@ snapshot object represent a join between parent object (Audit),
 child object (e.g. Control, Regulation, ...) and a particular revision.
 """
 
+import collections
 from logging import getLogger
 
+from flask import url_for
+from sqlalchemy import and_
+from sqlalchemy import or_
 from sqlalchemy.sql.expression import tuple_
 from sqlalchemy.sql.expression import bindparam
 
 from ggrc import db
 from ggrc import models
+from ggrc import settings
 from ggrc.login import get_current_user_id
+from ggrc.models.background_task import create_task
+from ggrc.models.background_task import use_task_queue
 from ggrc.utils import benchmark
+from ggrc.utils import list_chunks
 
 from ggrc.snapshotter.datastructures import Attr
 from ggrc.snapshotter.datastructures import Pair
@@ -39,7 +47,7 @@ logger = getLogger(__name__)  # pylint: disable=invalid-name
 class SnapshotGenerator(object):
   """Geneate snapshots per rules of all connected objects"""
 
-  def __init__(self, dry_run):
+  def __init__(self, dry_run, progress=None):
     self.rules = get_rules()
 
     self.parents = set()
@@ -47,6 +55,8 @@ class SnapshotGenerator(object):
     self.snapshots = dict()
     self.context_cache = dict()
     self.dry_run = dry_run
+    self.progress = progress
+    self.neighborhood_cache = dict()
 
   def add_parent(self, obj):
     """Add parent object and automatically scan neighborhood for snapshottable
@@ -62,6 +72,17 @@ class SnapshotGenerator(object):
           self.snapshots[key] = objs
       return self.parents
 
+  def add_parents(self, objs):
+    """Add many parent objects.
+
+    Parents that share the objects their scope is built from, e.g. audits of
+    the same program, have their neighborhood fetched once.
+    """
+    with benchmark("Snapshot.add_parents"):
+      for obj in objs:
+        self.add_parent(obj)
+      return self.parents
+
   def add_family(self, parent, children):
     """Directly add parent object and children that should be snapshotted."""
     _type, _id = parent
@@ -69,7 +90,7 @@ class SnapshotGenerator(object):
     parent_object = db.session.query(model).filter(model.id == _id).one()
     self.parents.add(parent)
     self.snapshots[parent] = children
-    self.children = children
+    self.children = self.children | children
     self.context_cache[parent] = parent_object.context_id
 
   def _fetch_neighborhood(self, parent_object, objects):
@@ -135,13 +156,18 @@ class SnapshotGenerator(object):
                          for obj in related_mappings | direct_mappings}
 
       with benchmark("Snapshot._get_snapshotable_objects.fetch neighborhood"):
-        return self._fetch_neighborhood(obj, related_objects)
+        key = (obj.type, frozenset(related_objects))
+        if key not in self.neighborhood_cache:
+          self.neighborhood_cache[key] = self._fetch_neighborhood(
+              obj, related_objects)
+        return self.neighborhood_cache[key]
 
   def update(self, event, revisions, _filter=None):
     """Update parent object's snapshots."""
     _, for_update = self.analyze()
-    result = self._update(for_update=for_update, event=event,
-                          revisions=revisions, _filter=_filter)
+    result = self._process_chunks(self._update, "update", for_update,
+                                  event=event, revisions=revisions,
+                                  _filter=_filter)
     updated = result.response
     if not self.dry_run:
       reindex_pairs(updated)
@@ -255,14 +281,14 @@ class SnapshotGenerator(object):
 
   def analyze(self):
     """Analyze which snapshots need to be updated and which created"""
+    if not self.parents:
+      return set(), set()
     query = set(db.session.query(
         models.Snapshot.parent_type,
         models.Snapshot.parent_id,
         models.Snapshot.child_type,
         models.Snapshot.child_id,
-    ).filter(tuple_(
-        models.Snapshot.parent_type, models.Snapshot.parent_id
-    ).in_(self.parents)))
+    ).filter(_parents_filter(self.parents)))
 
     existing_scope = {Pair.from_4tuple(fields) for fields in query}
 
@@ -294,13 +320,14 @@ class SnapshotGenerator(object):
     created, updated = set(), set()
 
     if for_update:
-      update = self._update(
-          for_update=for_update, event=event, revisions=revisions,
-          _filter=_filter)
+      update = self._process_chunks(self._update, "update", for_update,
+                                    event=event, revisions=revisions,
+                                    _filter=_filter)
       updated = update.response
     if for_create:
-      create = self._create(for_create=for_create, event=event,
-                            revisions=revisions, _filter=_filter)
+      create = self._process_chunks(self._create, "create", for_create,
+                                    event=event, revisions=revisions,
+                                    _filter=_filter)
       created = create.response
 
     to_reindex = updated | created
@@ -314,6 +341,40 @@ class SnapshotGenerator(object):
         "dry-run": self.dry_run
     })
 
+  def _report_progress(self, operation, done, total):
+    """Log progress of a chunked operation and pass it to the callback."""
+    message = "{} snapshots: {} of {} processed".format(
+        operation.capitalize(), done, total)
+    logger.info(message)
+    if self.progress:
+      self.progress(message)
+
+  def _process_chunks(self, method, operation, pairs, **kwargs):
+    """Run create or update on chunks of SNAPSHOT_CHUNK_SIZE pairs.
+
+    Every chunk is written in its own transactions, so statements and locks
+    are bounded by the chunk size instead of the size of the scope.
+
+    Args:
+      method: self._create or self._update.
+      operation: name of the operation used in the response.
+      pairs: set of pairs to process.
+      **kwargs: event, revisions and _filter arguments of the method.
+    Returns:
+      OperationResponse with responses of all chunks.
+    """
+    chunk_size = getattr(settings, "SNAPSHOT_CHUNK_SIZE", 1000)
+    pairs = sorted(pairs)
+    processed = set()
+    data = {}
+    for offset, chunk in enumerate(list_chunks(pairs, chunk_size)):
+      result = method(set(chunk), **kwargs)
+      processed |= result.response
+      _merge_data(data, result.data)
+      self._report_progress(operation, offset * chunk_size + len(chunk),
+                            len(pairs))
+    return OperationResponse(operation, True, processed, data)
+
   def _execute(self, operation, data):
     """Execute bulk operation on data if not in dry mode
 
@@ -326,16 +387,18 @@ class SnapshotGenerator(object):
     """
     if data and not self.dry_run:
       engine = db.engine
-      engine.execute(operation, data)
+      chunk_size = getattr(settings, "SNAPSHOT_CHUNK_SIZE", 1000)
+      for data_chunk in list_chunks(data, chunk_size):
+        engine.execute(operation, data_chunk)
       db.session.commit()
 
   def create(self, event, revisions, _filter=None):
     """Create snapshots of parent object's neighborhood per provided rules
     and split in chuncks if there are too many snapshottable objects."""
     for_create, _ = self.analyze()
-    result = self._create(
-        for_create=for_create, event=event,
-        revisions=revisions, _filter=_filter)
+    result = self._process_chunks(self._create, "create", for_create,
+                                  event=event, revisions=revisions,
+                                  _filter=_filter)
     created = result.response
     if not self.dry_run:
       reindex_pairs(created)
@@ -447,8 +510,25 @@ class SnapshotGenerator(object):
     Create relationships between individual snapshots if a relationship exists
     between a pair of object that was snapshotted. These relationships get
     created for all objects inside a single parent scope.
+
+    Parents are stored in a temporary table, so relationships of all parents
+    are copied by a single statement that joins snapshots and relationships
+    through their indexes.
     """
-    for parent in self.parents:
+    if not self.parents:
+      return
+    db.session.execute("""
+        CREATE TEMPORARY TABLE snapshot_parents (
+            parent_type VARCHAR(250) NOT NULL,
+            parent_id INT NOT NULL,
+            PRIMARY KEY (parent_type, parent_id)
+        )
+        """)
+    try:
+      db.session.execute(
+          "INSERT INTO snapshot_parents VALUES (:parent_type, :parent_id)",
+          [{"parent_type": parent.type, "parent_id": parent.id}
+           for parent in self.parents])
       query = """
           INSERT IGNORE INTO relationships (
               modified_by_id,
@@ -469,21 +549,104 @@ class SnapshotGenerator(object):
               snap_2.id,
               "Snapshot",
               snap_2.context_id
-          FROM relationships AS rel
+          FROM snapshot_parents AS parents
           INNER JOIN snapshots AS snap_1
-              ON (snap_1.child_type, snap_1.child_id) =
-                 (rel.source_type, rel.source_id)
+              ON snap_1.parent_type = parents.parent_type AND
+                 snap_1.parent_id = parents.parent_id
+          INNER JOIN relationships AS rel
+              ON rel.source_type = snap_1.child_type AND
+                 rel.source_id = snap_1.child_id
           INNER JOIN snapshots AS snap_2
-              ON (snap_2.child_type, snap_2.child_id) =
-                 (rel.destination_type, rel.destination_id)
-          WHERE
-              snap_1.parent_id = :parent_id AND
-              snap_2.parent_id = :parent_id
+              ON snap_2.parent_type = snap_1.parent_type AND
+                 snap_2.parent_id = snap_1.parent_id AND
+                 snap_2.child_type = rel.destination_type AND
+                 snap_2.child_id = rel.destination_id
           """
-      db.session.execute(query, {
-          "user_id": get_current_user_id(),
-          "parent_id": parent.id
-      })
+      with benchmark("Snapshot._copy_snapshot_relationships"):
+        db.session.execute(query, {"user_id": get_current_user_id()})
+    finally:
+      db.session.execute("DROP TEMPORARY TABLE IF EXISTS snapshot_parents")
+
+
+def _parents_filter(parents):
+  """Filter snapshots of parents by the parent index."""
+  ids_by_type = collections.defaultdict(set)
+  for parent in parents:
+    ids_by_type[parent.type].add(parent.id)
+  return or_(*[
+      and_(models.Snapshot.parent_type == type_,
+           models.Snapshot.parent_id.in_(ids))
+      for type_, ids in ids_by_type.iteritems()
+  ])
+
+
+def _merge_data(target, source):
+  """Merge response data of a chunk into response data of the operation."""
+  for key, value in source.iteritems():
+    if isinstance(value, dict):
+      _merge_data(target.setdefault(key, {}), value)
+    else:
+      target[key] = value
+
+
+def _stub_dict(stub):
+  return {"type": stub.type, "id": stub.id}
+
+
+def _run_in_background(generator, _filter, dry_run):
+  """Check if snapshots of the generator scope should be made by a task."""
+  threshold = getattr(settings, "SNAPSHOT_BACKGROUND_THRESHOLD", 0)
+  if not threshold or dry_run or _filter is not None or not use_task_queue():
+    return False
+  size = sum(len(children) for children in generator.snapshots.values())
+  return size > threshold
+
+
+def _schedule(operation, generator, event, revisions):
+  """Create a background task that makes snapshots of the generator scope.
+
+  The scope is stored in the task parameters, so the task snapshots the
+  objects that were mapped when it was scheduled.
+  """
+  parameters = {
+      "operation": operation,
+      "event_id": event.id,
+      "families": [{
+          "parent": _stub_dict(parent),
+          "children": [_stub_dict(child) for child in children],
+      } for parent, children in generator.snapshots.iteritems()],
+      "revisions": [{
+          "parent": _stub_dict(parent),
+          "child": _stub_dict(child),
+          "revision_id": revision_id,
+      } for (parent, child), revision_id in dict(revisions).iteritems()],
+  }
+  task = create_task("snapshots", url_for("run_snapshots"),
+                     parameters=parameters)
+  logger.info("Scheduled %s of snapshots for %s in task %s", operation,
+              generator.parents, task.id)
+  return OperationResponse(operation, True, set(), {"task_id": task.id})
+
+
+def run_snapshot_task(task):
+  """Make snapshots scheduled by create_snapshots or upsert_snapshots.
+
+  Progress of every chunk is reported as the task result.
+  """
+  parameters = task.parameters
+  generator = SnapshotGenerator(dry_run=False, progress=task.report_progress)
+  for family in parameters["families"]:
+    generator.add_family(
+        Stub.from_dict(family["parent"]),
+        {Stub.from_dict(child) for child in family["children"]})
+  revisions = {
+      Pair(Stub.from_dict(revision["parent"]),
+           Stub.from_dict(revision["child"])): revision["revision_id"]
+      for revision in parameters["revisions"]}
+  event = models.Event.query.get(parameters["event_id"])
+  if parameters["operation"] == "create":
+    return generator.create(event=event, revisions=revisions)
+  return generator.upsert(event=event, revisions=revisions, _filter=None)
 
 
 def create_snapshots(objs, event, revisions=None, _filter=None, dry_run=False):
@@ -501,6 +664,8 @@ def create_snapshots(objs, event, revisions=None, _filter=None, dry_run=False):
         db.session.add(obj)
         with benchmark("Snapshot.create_snapshots.add_parent_objects"):
           generator.add_parent(obj)
+    if _run_in_background(generator, _filter, dry_run):
+      return _schedule("create", generator, event, revisions)
     with benchmark("Snapshot.create_snapshots.create"):
       return generator.create(event=event,
                               revisions=revisions,
@@ -519,34 +684,74 @@ def upsert_snapshots(objs, event, revisions=None, _filter=None, dry_run=False):
       objs = {objs}
     for obj in objs:
       db.session.add(obj)
-      generator.add_parent(obj)
+    generator.add_parents(objs)
+    if _run_in_background(generator, _filter, dry_run):
+      return _schedule("upsert", generator, event, revisions)
     return generator.upsert(event=event, revisions=revisions, _filter=_filter)
 
 
-def clone_scope(base_parent, new_parent, event):
-  """Create exact copy of parent object scope.
+def bulk_upsert_snapshots(objs, event, progress=None):
+  """Update (and create if needed) snapshots of many parent objects at once.
+
+  Snapshots of all parents are analyzed with one query, latest revisions are
+  fetched once for all children and all changed snapshots are reindexed
+  together. Writes are split only by SNAPSHOT_CHUNK_SIZE.
 
   Args:
-    base_parent: Old parent object
-    new_parent: New parent object
+    objs: parent objects, e.g. all audits of a program.
+    event: Event that triggered the update.
+    progress: callback that receives progress messages.
+  """
+  with benchmark("Snapshot.bulk_upsert_snapshots"):
+    generator = SnapshotGenerator(dry_run=False, progress=progress)
+    generator.add_parents(objs)
+    return generator.upsert(event=event, revisions={}, _filter=None)
+
+
+def clone_scopes(parents, event):
+  """Create exact copies of scopes of many parent objects.
+
+  Args:
+    parents: list of (base_parent, new_parent) tuples.
     event: Event that triggered scope cloning
   """
+  with benchmark("clone_scope.clone audit scopes"):
+    new_parents = collections.defaultdict(list)
+    for base_parent, new_parent in parents:
+      new_parents[Stub.from_object(base_parent)].append(
+          Stub.from_object(new_parent))
+    if not new_parents:
+      return None
 
-  with benchmark("clone_scope.clone audit scope"):
     source_snapshots = db.session.query(
+        models.Snapshot.parent_type,
+        models.Snapshot.parent_id,
         models.Snapshot.child_type,
         models.Snapshot.child_id,
         models.Snapshot.revision_id
-    ).filter(
-        models.Snapshot.parent_type == base_parent.type,
-        models.Snapshot.parent_id == base_parent.id)
+    ).filter(_parents_filter(new_parents.keys()))
 
-    snapshot_revisions = {
-        Pair.from_4tuple((new_parent.type, new_parent.id, ctype, cid)): revid
-        for ctype, cid, revid in source_snapshots}
+    snapshot_revisions = {}
+    children = collections.defaultdict(set)
+    for ptype, pid, ctype, cid, revid in source_snapshots:
+      child = Stub(ctype, cid)
+      for parent in new_parents[Stub(ptype, pid)]:
+        snapshot_revisions[Pair(parent, child)] = revid
+        children[parent].add(child)
 
-    parent = Stub(new_parent.type, new_parent.id)
-    children = {pair.child for pair in snapshot_revisions}
     generator = SnapshotGenerator(dry_run=False)
-    generator.add_family(parent, children)
-    generator.create(event, snapshot_revisions)
+    for parent_list in new_parents.values():
+      for parent in parent_list:
+        generator.add_family(parent, children[parent])
+    return generator.create(event, snapshot_revisions)
+
+
+def clone_scope(base_parent, new_parent, event):
+  """Create exact copy of parent object scope.
+
+  Args:
+    base_parent: Old parent object
+    new_parent: New parent object
+    event: Event that triggered scope cloning
+  """
+  return clone_scopes([(base_parent, new_parent)], event)
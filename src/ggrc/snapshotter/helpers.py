@@ -6,16 +6,76 @@
 import collections
 from logging import getLogger
 
+from sqlalchemy import func
 from sqlalchemy.sql.expression import tuple_
 
 from ggrc import db
 from ggrc import models
 from ggrc.snapshotter.datastructures import Stub
-from ggrc.snapshotter.datastructures import Pair
 from ggrc.utils import benchmark
+from ggrc.utils import list_chunks
 
 logger = getLogger(__name__)  # pylint: disable=invalid-name
 
+LATEST_REVISIONS_CHUNK_SIZE = 1000
+
+
+def get_latest_revision_ids(stubs, filters=None):
+  """Get ids of the latest revisions of objects.
+
+  The latest revision of every object is selected by the database with a
+  grouped MAX(id) query, so only one row per object is returned. InnoDB
+  appends the primary key to the fk_revisions_resource index, which makes the
+  index covering for this query.
+
+  Args:
+    stubs: iterable of Stub objects.
+    filters: list of additional revision filters.
+
+  Returns:
+    dict({Stub: revision_id, ...}) for objects that have revisions.
+  """
+  ids_by_type = collections.defaultdict(list)
+  for stub in stubs:
+    ids_by_type[stub.type].append(stub.id)
+
+  result = {}
+  for type_, ids in ids_by_type.iteritems():
+    for ids_chunk in list_chunks(sorted(ids), LATEST_REVISIONS_CHUNK_SIZE):
+      query = db.session.query(
+          models.Revision.resource_id,
+          func.max(models.Revision.id),
+      ).filter(
+          models.Revision.resource_type == type_,
+          models.Revision.resource_id.in_(ids_chunk),
+      ).group_by(models.Revision.resource_id)
+      for _filter in filters or []:
+        query = query.filter(_filter)
+      result.update((Stub(type_, resid), revid) for resid, revid in query)
+  return result
+
+
+def _get_valid_revisions(revisions, filters=None):
+  """Get requested revisions that exist in object histories.
+
+  Args:
+    revisions: dict({(parent, child): revision_id, ...})
+    filters: list of additional revision filters.
+
+  Returns:
+    set([(child, revision_id), ...]) for the found revisions.
+  """
+  if not revisions:
+    return set()
+  query = db.session.query(
+      models.Revision.id,
+      models.Revision.resource_type,
+      models.Revision.resource_id,
+  ).filter(models.Revision.id.in_(set(revisions.values())))
+  for _filter in filters or []:
+    query = query.filter(_filter)
+  return {(Stub(restype, resid), revid) for revid, restype, resid in query}
+
 
 def get_revisions(pairs, revisions, filters=None):
   """Retrieve revision ids for pairs
@@ -32,42 +92,26 @@ def get_revisions(pairs, revisions, filters=None):
     revision_id_cache = dict()
 
     if pairs:
-      with benchmark("get_revisions.create caches"):
-        child_stubs = {pair.child for pair in pairs}
-
-        with benchmark("get_revisions.create child -> parents cache"):
-          parents_cache = collections.defaultdict(set)
-          for parent, child in pairs:
-            parents_cache[child].add(parent)
-
-      with benchmark("get_revisions.retrieve revisions"):
-        query = db.session.query(
-            models.Revision.id,
-            models.Revision.resource_type,
-            models.Revision.resource_id).filter(
-            tuple_(
-                models.Revision.resource_type,
-                models.Revision.resource_id).in_(child_stubs)
-        ).order_by(models.Revision.id.desc())
-        if filters:
-          for _filter in filters:
-            query = query.filter(_filter)
+      with benchmark("get_revisions.retrieve latest revisions"):
+        latest = get_latest_revision_ids(
+            {pair.child for pair in pairs if pair not in revisions}, filters)
+
+      with benchmark("get_revisions.validate requested revisions"):
+        requested = {pair: revisions[pair] for pair in pairs
+                     if pair in revisions}
+        valid = _get_valid_revisions(requested, filters)
 
       with benchmark("get_revisions.create revision_id cache"):
-        for revid, restype, resid in query:
-          child = Stub(restype, resid)
-          for parent in parents_cache[child]:
-            key = Pair(parent, child)
-            if key in revisions:
-              if revid == revisions[key]:
-                revision_id_cache[key] = revid
-              else:
-                logger.warning(
-                    "Specified revision for object %s but couldn't find the"
-                    "revision '%s' in object history", key, revisions[key])
+        for pair in pairs:
+          if pair in requested:
+            if (pair.child, requested[pair]) in valid:
+              revision_id_cache[pair] = requested[pair]
             else:
-              if key not in revision_id_cache:
-                revision_id_cache[key] = revid
+              logger.warning(
+                  "Specified revision for object %s but couldn't find the"
+                  "revision '%s' in object history", pair, requested[pair])
+          elif pair.child in latest:
+            revision_id_cache[pair] = latest[pair.child]
     return revision_id_cache
 
 
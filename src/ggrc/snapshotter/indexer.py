@@ -3,17 +3,24 @@
 
 """Manage indexing for snapshotter service"""
 
+import contextlib
+import itertools
 import logging
 
+import flask
+from sqlalchemy import event
 from sqlalchemy.sql.expression import tuple_
 
 from ggrc import db
 from ggrc import models
 from ggrc.models import all_models
+from ggrc.models import revision_storage
 from ggrc.fulltext.mysql import MysqlRecordProperty as Record
 from ggrc.fulltext.recordbuilder import RecordBuilder
 from ggrc.models.reflection import AttributeInfo
+from ggrc.utils import benchmark
 from ggrc.utils import generate_query_chunks
+from ggrc.utils import list_chunks
 
 from ggrc.snapshotter.rules import Types
 from ggrc.snapshotter.datastructures import Pair
@@ -21,6 +28,19 @@ from ggrc.snapshotter.datastructures import Pair
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+REINDEX_CHUNK_SIZE = 1000
+
+CAD_MAP_KEY = "snapshot_indexer_cad_map"
+
+SINGLE_PERSON_PROPERTIES = {"modified_by", "principal_assessor",
+                            "secondary_assessor", "contact",
+                            "secondary_contact"}
+
+MULTIPLE_PERSON_PROPERTIES = {"owners"}
+
+# Searchable attributes of snapshottable models, see _get_class_properties.
+_class_properties = {}
+
 
 def _get_tag(pair):
   return u"{parent_type}-{parent_id}-{child_type}".format(
@@ -59,67 +79,95 @@ def _get_columns():
   revision_columns = db.session.query(
       models.Revision.id,
       models.Revision.resource_type,
-      models.Revision.content
   )
   return snapshot_columns, revision_columns
 
 
-def _get_model_properties():
-  """Get indexable properties for all snapshottable objects
+def _get_class_properties():
+  """Get searchable attributes of all snapshottable models.
 
-  Args:
-    None
-  Returns:
-    tuple(class_properties dict, custom_attribute_definitions dict) - Tuple of
-        dictionaries, first one representing a list of searchable attributes
-        for every model and second one representing dictionary of custom
-        attribute definition attributes.
+  Attributes only depend on model definitions, so they are gathered once per
+  process.
+  """
+  if not _class_properties:
+    for klass_name in Types.all:
+      _class_properties[klass_name] = AttributeInfo.gather_attrs(
+          getattr(all_models, klass_name), '_fulltext_attrs')
+  return _class_properties
+
+
+def _get_cad_map():
+  """Get "CAD ID" -> "CAD title" for all snapshottable objects.
+
+  The map is cached for the duration of the request and dropped whenever a
+  custom attribute definition is flushed, so reindexing many chunks in one
+  request queries definitions only once. Outside of an app context the map
+  is not cached.
   """
   # pylint: disable=protected-access
-  class_properties = dict()
-  klass_names = Types.all
+  cached = flask.has_app_context()
+  if cached and hasattr(flask.g, CAD_MAP_KEY):
+    return getattr(flask.g, CAD_MAP_KEY)
 
   cadef_klass_names = {
       getattr(all_models, klass)._inflector.table_singular
-      for klass in klass_names
+      for klass in Types.all
   }
-
   cad_query = db.session.query(
       models.CustomAttributeDefinition.id,
       models.CustomAttributeDefinition.title,
   ).filter(
       models.CustomAttributeDefinition.definition_type.in_(cadef_klass_names)
   )
+  cad_map = dict(cad_query)
+  if cached:
+    setattr(flask.g, CAD_MAP_KEY, cad_map)
+  return cad_map
 
-  for klass_name in klass_names:
-    model_attributes = AttributeInfo.gather_attrs(
-        getattr(all_models, klass_name), '_fulltext_attrs')
-    class_properties[klass_name] = model_attributes
 
-  return class_properties, cad_query.all()
+@event.listens_for(db.session.__class__, "after_flush")
+def _invalidate_cad_map(session, _):
+  """Drop the cached CAD map if any custom attribute definition changed."""
+  if not flask.has_app_context() or not hasattr(flask.g, CAD_MAP_KEY):
+    return
+  cad_class = models.CustomAttributeDefinition
+  if any(isinstance(obj, cad_class) for obj in itertools.chain(
+          session.new, session.dirty, session.deleted)):
+    delattr(flask.g, CAD_MAP_KEY)
+
 
+def _get_model_properties():
+  """Get indexable properties for all snapshottable objects
 
-def get_searchable_attributes(attributes, cad_list, content):
+  Args:
+    None
+  Returns:
+    tuple(class_properties dict, custom_attribute_definitions dict) - Tuple of
+        dictionaries, first one representing a list of searchable attributes
+        for every model and second one representing dictionary of custom
+        attribute definition titles by their ids.
+  """
+  return _get_class_properties(), _get_cad_map()
+
+
+def get_searchable_attributes(attributes, cad_map, content):
   """Get all searchable attributes for a given object that should be indexed
 
   Args:
     attributes: Attributes that should be extracted from some model
-    cad_keys: IDs of custom attribute definitions
-    ca_definitions: Dictionary of "CAD ID" -> "CAD title"
+    cad_map: Dictionary of "CAD ID" -> "CAD title"
     content: dictionary (JSON) representation of an object
   Return:
     Dict of "key": "value" from objects revision
   """
   searchable_values = {attr: content.get(attr) for attr in attributes}
 
-  cad_map = {cad.id: cad for cad in cad_list}
-
   cav_list = content.get("custom_attributes", [])
 
   for cav in cav_list:
-    cad = cad_map.get(cav["custom_attribute_id"])
-    if cad:
-      searchable_values[cad.title] = cav["attribute_value"]
+    cad_title = cad_map.get(cav["custom_attribute_id"])
+    if cad_title:
+      searchable_values[cad_title] = cav["attribute_value"]
   return searchable_values
 
 
@@ -201,106 +249,181 @@ def get_person_sort_subprop(rec, people):
   return data
 
 
-def reindex_pairs(pairs):  # noqa  # pylint:disable=too-many-branches
+def _load_people_map(person_ids):
+  """Get id -> (name, email) map of the given people."""
+  people_map = {}
+  for ids_chunk in list_chunks(list(person_ids)):
+    people = db.session.query(
+        all_models.Person.id,
+        all_models.Person.name,
+        all_models.Person.email,
+    ).filter(all_models.Person.id.in_(ids_chunk))
+    people_map.update((id_, (name, email)) for id_, name, email in people)
+  return people_map
+
+
+@contextlib.contextmanager
+def _people_map_for(person_ids):
+  """Make data of the given people available to the record builder.
+
+  People are loaded with one query instead of one query per person. People
+  already present in an existing global people map are not loaded again.
+  """
+  previous = getattr(flask.g, "people_map", None)
+  if previous is None:
+    missing = person_ids
+  else:
+    missing = {id_ for id_ in person_ids if id_ not in previous}
+  if not missing:
+    yield
+    return
+  people_map = _load_people_map(missing)
+  if previous is not None:
+    people_map.update(previous)
+  flask.g.people_map = people_map
+  try:
+    yield
+  finally:
+    if previous is None:
+      delattr(flask.g, "people_map")
+    else:
+      flask.g.people_map = previous
+
+
+def _get_snapshot_properties(pair, revision_properties):
+  """Get indexable properties of a snapshot from its revision properties."""
+  properties = dict(revision_properties)
+  properties.update({
+      "parent": _get_parent_property(pair),
+      "child": _get_child_property(pair),
+      "child_type": pair.child.type,
+      "child_id": pair.child.id
+  })
+
+  assignees = properties.pop("assignees", None)
+  if assignees:
+    for person, roles in assignees:
+      if person:
+        for role in roles:
+          properties[role] = [person]
+  return properties
+
+
+def _get_person_ids(properties):
+  """Get ids of all people referenced by person properties."""
+  person_ids = set()
+  for prop in SINGLE_PERSON_PROPERTIES:
+    if properties.get(prop):
+      person_ids.add(properties[prop]["id"])
+  for prop in MULTIPLE_PERSON_PROPERTIES:
+    person_ids.update(person["id"] for person in properties.get(prop) or [])
+  return person_ids
+
+
+def _get_snapshot_records(snapshot_id, ctx_id, pair, properties):
+  """Get full text records for properties of a single snapshot."""
+  search_payload = []
+  for prop, val in properties.items():
+    if prop and val is not None:
+      # record stub
+      rec = {
+          "key": snapshot_id,
+          "type": "Snapshot",
+          "context_id": ctx_id,
+          "tags": _get_tag(pair),
+          "property": prop,
+          "subproperty": "",
+          "content": val,
+      }
+      if prop in SINGLE_PERSON_PROPERTIES:
+        if val:
+          search_payload += get_person_data(rec, val)
+          search_payload += get_person_sort_subprop(rec, [val])
+      elif prop in MULTIPLE_PERSON_PROPERTIES:
+        for person in val:
+          search_payload += get_person_data(rec, person)
+        search_payload += get_person_sort_subprop(rec, val)
+      elif isinstance(val, dict) and "title" in val:
+        rec["content"] = val["title"]
+        search_payload += [rec]
+      elif isinstance(val, (bool, int, long)):
+        rec["content"] = unicode(val)
+        search_payload += [rec]
+      else:
+        if isinstance(rec["content"], basestring):
+          search_payload += [rec]
+        else:
+          logger.warning(u"Unsupported value for %s #%s in %s %s: %r",
+                         rec["type"], rec["key"], rec["property"],
+                         rec["subproperty"], rec["content"])
+  return search_payload
+
+
+def _reindex_snapshot_rows(snapshot_rows, object_properties, cad_map):
+  """Replace full text records of one chunk of snapshots.
+
+  Args:
+    snapshot_rows: list of (id, context_id, parent_type, parent_id,
+      child_type, child_id, revision_id) tuples.
+    object_properties: dict of searchable attributes for every model.
+    cad_map: dict of "CAD ID" -> "CAD title".
+  """
+  _, revision_columns = _get_columns()
+  revision_ids = {row[6] for row in snapshot_rows}
+  contents = revision_storage.load_contents(revision_ids)
+  revision_query = revision_columns.filter(
+      models.Revision.id.in_(revision_ids)
+  )
+  revisions = {
+      _id: get_searchable_attributes(
+          object_properties[_type], cad_map, contents[_id])
+      for _id, _type in revision_query
+  }
+
+  snapshots = []
+  person_ids = set()
+  for _id, ctx_id, ptype, pid, ctype, cid, revid in snapshot_rows:
+    pair = Pair.from_4tuple((ptype, pid, ctype, cid))
+    properties = _get_snapshot_properties(pair, revisions[revid])
+    person_ids.update(_get_person_ids(properties))
+    snapshots.append((_id, ctx_id, pair, properties))
+
+  search_payload = []
+  with _people_map_for(person_ids):
+    for snapshot_id, ctx_id, pair, properties in snapshots:
+      search_payload += _get_snapshot_records(
+          snapshot_id, ctx_id, pair, properties)
+
+  delete_records({snapshot_id for snapshot_id, _, _, _ in snapshots})
+  if search_payload:
+    insert_records(search_payload)
+
+
+def reindex_pairs(pairs):
   """Reindex selected snapshots.
 
+  Snapshots are processed in chunks of REINDEX_CHUNK_SIZE, so revision
+  contents and full text records of only one chunk are kept in memory at a
+  time. People referenced in a chunk are loaded with a single query.
+
   Args:
     pairs: A list of parent-child pairs that uniquely represent snapshot
     object whose properties should be reindexed.
   """
+  if not pairs:
+    return
 
-  # pylint: disable=too-many-locals
-  snapshots = dict()
-  revisions = dict()
-  snap_to_sid_cache = dict()
-  search_payload = list()
-
-  object_properties, cad_list = _get_model_properties()
-
-  snapshot_columns, revision_columns = _get_columns()
-
-  snapshot_query = snapshot_columns
-  if pairs:  # pylint:disable=too-many-nested-blocks
-    pairs_filter = tuple_(
-        models.Snapshot.parent_type,
-        models.Snapshot.parent_id,
-        models.Snapshot.child_type,
-        models.Snapshot.child_id,
-    ).in_({pair.to_4tuple() for pair in pairs})
-    snapshot_query = snapshot_columns.filter(pairs_filter)
-
-    for _id, ctx_id, ptype, pid, ctype, cid, revid in snapshot_query:
-      pair = Pair.from_4tuple((ptype, pid, ctype, cid))
-      snapshots[pair] = [_id, ctx_id, revid]
-      snap_to_sid_cache[pair] = _id
-
-    revision_ids = {revid for _, _, revid in snapshots.values()}
-    revision_query = revision_columns.filter(
-        models.Revision.id.in_(revision_ids)
-    )
-    for _id, _type, content in revision_query:
-      revisions[_id] = get_searchable_attributes(
-          object_properties[_type], cad_list, content)
-
-    snapshot_ids = set()
-    for pair in snapshots:
-      snapshot_id, ctx_id, revision_id = snapshots[pair]
-      snapshot_ids.add(snapshot_id)
-
-      properties = revisions[revision_id]
-      properties.update({
-          "parent": _get_parent_property(pair),
-          "child": _get_child_property(pair),
-          "child_type": pair.child.type,
-          "child_id": pair.child.id
-      })
-
-      assignees = properties.pop("assignees", None)
-      if assignees:
-        for person, roles in assignees:
-          if person:
-            for role in roles:
-              properties[role] = [person]
-
-      single_person_properties = {"modified_by", "principal_assessor",
-                                  "secondary_assessor", "contact",
-                                  "secondary_contact"}
-
-      multiple_person_properties = {"owners"}
-
-      for prop, val in properties.items():
-        if prop and val is not None:
-          # record stub
-          rec = {
-              "key": snapshot_id,
-              "type": "Snapshot",
-              "context_id": ctx_id,
-              "tags": _get_tag(pair),
-              "property": prop,
-              "subproperty": "",
-              "content": val,
-          }
-          if prop in single_person_properties:
-            if val:
-              search_payload += get_person_data(rec, val)
-              search_payload += get_person_sort_subprop(rec, [val])
-          elif prop in multiple_person_properties:
-            for person in val:
-              search_payload += get_person_data(rec, person)
-            search_payload += get_person_sort_subprop(rec, val)
-          elif isinstance(val, dict) and "title" in val:
-            rec["content"] = val["title"]
-            search_payload += [rec]
-          elif isinstance(val, (bool, int, long)):
-            rec["content"] = unicode(val)
-            search_payload += [rec]
-          else:
-            if isinstance(rec["content"], basestring):
-              search_payload += [rec]
-            else:
-              logger.warning(u"Unsupported value for %s #%s in %s %s: %r",
-                             rec["type"], rec["key"], rec["property"],
-                             rec["subproperty"], rec["content"])
-
-    delete_records(snapshot_ids)
-    insert_records(search_payload)
+  object_properties, cad_map = _get_model_properties()
+  snapshot_columns, _ = _get_columns()
+
+  pairs_filter = tuple_(
+      models.Snapshot.parent_type,
+      models.Snapshot.parent_id,
+      models.Snapshot.child_type,
+      models.Snapshot.child_id,
+  ).in_({pair.to_4tuple() for pair in pairs})
+  snapshot_rows = snapshot_columns.filter(pairs_filter).all()
+
+  with benchmark("Snapshot.reindex_pairs"):
+    for rows_chunk in list_chunks(snapshot_rows, REINDEX_CHUNK_SIZE):
+      _reindex_snapshot_rows(rows_chunk, object_properties, cad_map)
@@ -0,0 +1,332 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Database backed background task queue for deployments without App Engine.
+
+When LOCAL_TASK_QUEUE is enabled, create_task stores the request that runs a
+task in the task_queue table instead of running it in the current request.
+A pool started with `python -m ggrc.task_queue` polls the table:
+
+  * the pool process leases runnable tasks while holding a MySQL named lock,
+    so concurrency limits per task name hold across multiple pools;
+  * each leased task runs in its own worker process, which replays the task
+    request through the app as the user that created the task, the same way
+    the App Engine task queue calls task URLs;
+  * the pool renews leases of running tasks on every poll, so tasks of a
+    pool that died become runnable again once their lease expires;
+  * a task that stops without recording a result is retried with an
+    increasing delay, until it runs out of attempts and is marked as failed.
+
+Progress is reported through the status and result of the BackgroundTask.
+"""
+
+import datetime
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+import flask_login
+import sqlalchemy as sa
+from werkzeug.datastructures import Headers
+
+from ggrc import db
+from ggrc import settings
+from ggrc.login import get_login_module
+from ggrc.models.background_task import BackgroundTask
+from ggrc.models.types import JsonType
+
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+LOCK_NAME = "ggrc_task_queue"
+LOCK_TIMEOUT = 10
+
+# Number of runnable tasks inspected when looking for tasks to lease.
+CANDIDATE_LIMIT = 100
+
+# Delay before the first retry of a task, doubled for every further attempt.
+RETRY_DELAY = 30
+
+# Request headers that are not replayed by worker processes.
+EXCLUDED_HEADERS = {"cookie", "authorization", "content-length", "host"}
+
+FINISHED_STATES = {"Success", "Failure"}
+
+task_queue = db.Table(
+    "task_queue",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("background_task_id", db.Integer,
+              db.ForeignKey("background_tasks.id", ondelete="CASCADE"),
+              nullable=False),
+    db.Column("name", db.String(250), nullable=False),
+    db.Column("method", db.String(16), nullable=False),
+    db.Column("url", db.Text, nullable=False),
+    db.Column("headers", JsonType, nullable=False),
+    db.Column("attempts", db.Integer, nullable=False, default=0),
+    db.Column("available_at", db.DateTime, nullable=False),
+    db.Column("leased_until", db.DateTime),
+    db.Column("leased_by", db.String(250)),
+    db.Column("created_at", db.DateTime, nullable=False),
+)
+
+
+def _get_max_attempts():
+  return getattr(settings, "LOCAL_TASK_QUEUE_MAX_ATTEMPTS", 3)
+
+
+def _get_lease():
+  return datetime.timedelta(
+      seconds=getattr(settings, "LOCAL_TASK_QUEUE_LEASE_SECONDS", 300))
+
+
+def _now():
+  return db.session.query(sa.func.now()).scalar()
+
+
+def enqueue(task, name, url, method, headers):
+  """Store the request that runs a background task.
+
+  Args:
+    task: BackgroundTask created for the request.
+    name: name of the task used for concurrency limits.
+    url: url of the request that runs the task.
+    method: HTTP method of the request.
+    headers: headers of the request that created the task.
+  """
+  now = _now()
+  db.session.execute(task_queue.insert().values(
+      background_task_id=task.id,
+      name=name,
+      method=method,
+      url=url,
+      headers=[(key, value) for key, value in Headers(headers).items()
+               if key.lower() not in EXCLUDED_HEADERS],
+      attempts=0,
+      available_at=now,
+      created_at=now,
+  ))
+  db.session.commit()
+
+
+def claim_tasks(limit, worker_id):
+  """Lease up to `limit` runnable tasks.
+
+  Returns:
+    tuple of a list of leased queue ids and a list of queue ids of tasks that
+    have no attempts left.
+  """
+  claimed = []
+  exhausted = []
+  limits = getattr(settings, "LOCAL_TASK_QUEUE_CONCURRENCY", {})
+  max_attempts = _get_max_attempts()
+  with db.engine.connect() as conn:
+    if not conn.execute(sa.select([
+            sa.func.get_lock(LOCK_NAME, LOCK_TIMEOUT)])).scalar():
+      return claimed, exhausted
+    try:
+      now = conn.execute(sa.select([sa.func.now()])).scalar()
+      running = dict(conn.execute(sa.select([
+          task_queue.c.name, sa.func.count(),
+      ]).where(
+          task_queue.c.leased_until >= now
+      ).group_by(task_queue.c.name)))
+      candidates = conn.execute(sa.select([
+          task_queue.c.id, task_queue.c.name, task_queue.c.attempts,
+      ]).where(sa.and_(
+          task_queue.c.available_at <= now,
+          sa.or_(task_queue.c.leased_until.is_(None),
+                 task_queue.c.leased_until < now),
+      )).order_by(task_queue.c.id).limit(CANDIDATE_LIMIT)).fetchall()
+      for queue_id, name, attempts in candidates:
+        if len(claimed) >= limit:
+          break
+        if attempts >= max_attempts:
+          exhausted.append(queue_id)
+          continue
+        if name in limits and running.get(name, 0) >= limits[name]:
+          continue
+        conn.execute(task_queue.update().where(
+            task_queue.c.id == queue_id
+        ).values(
+            leased_until=now + _get_lease(),
+            leased_by=worker_id,
+            attempts=task_queue.c.attempts + 1,
+        ))
+        running[name] = running.get(name, 0) + 1
+        claimed.append(queue_id)
+    finally:
+      conn.execute(sa.select([sa.func.release_lock(LOCK_NAME)]))
+  return claimed, exhausted
+
+
+def renew_leases(queue_ids, worker_id):
+  """Extend leases of tasks that are still running."""
+  if not queue_ids:
+    return
+  db.session.execute(task_queue.update().where(sa.and_(
+      task_queue.c.id.in_(queue_ids),
+      task_queue.c.leased_by == worker_id,
+  )).values(leased_until=_now() + _get_lease()))
+  db.session.commit()
+
+
+def _delete(queue_id):
+  db.session.execute(task_queue.delete().where(task_queue.c.id == queue_id))
+  db.session.commit()
+
+
+def fail_task(queue_id, message):
+  """Mark a task as failed and remove it from the queue."""
+  row = db.session.query(task_queue.c.background_task_id).filter(
+      task_queue.c.id == queue_id).first()
+  if row is None:
+    return
+  task = BackgroundTask.query.get(row.background_task_id)
+  if task is not None and task.status not in FINISHED_STATES:
+    task.finish("Failure", message)
+  _delete(queue_id)
+
+
+def finish_task(queue_id, exitcode):
+  """Remove a finished task from the queue or schedule a retry.
+
+  A task is finished once it has recorded its result, even if the result is
+  a failure. Tasks that stopped before that are retried.
+  """
+  row = db.session.query(
+      task_queue.c.background_task_id, task_queue.c.attempts,
+  ).filter(task_queue.c.id == queue_id).first()
+  if row is None:
+    return
+  task = BackgroundTask.query.get(row.background_task_id)
+  if task is None or task.status in FINISHED_STATES:
+    _delete(queue_id)
+    return
+
+  message = "Attempt {} of {} stopped with exit code {}".format(
+      row.attempts, _get_max_attempts(), exitcode)
+  logger.warning("Background task %s: %s", task.name, message)
+  if row.attempts >= _get_max_attempts():
+    fail_task(queue_id, message)
+    return
+
+  delay = datetime.timedelta(seconds=RETRY_DELAY * 2 ** (row.attempts - 1))
+  db.session.execute(task_queue.update().where(
+      task_queue.c.id == queue_id
+  ).values(
+      leased_until=None,
+      leased_by=None,
+      available_at=_now() + delay,
+  ))
+  db.session.commit()
+  task.status = "Pending"
+  task.report_progress("{}, retrying".format(message))
+
+
+def run_task(app, queue_id):
+  """Run a leased task by replaying its request through the app.
+
+  Returns:
+    response of the task request.
+  """
+  with app.app_context():
+    try:
+      row = db.session.query(task_queue).filter(
+          task_queue.c.id == queue_id).one()
+      task = BackgroundTask.query.get(row.background_task_id)
+      task.report_progress("Running attempt {} of {}".format(
+          row.attempts, _get_max_attempts()))
+      task_id, task_name, user_id = task.id, task.name, task.modified_by_id
+    finally:
+      db.session.remove()
+
+  headers = Headers(row.headers)
+  headers["x-task-id"] = str(task_id)
+  headers["X-Appengine-Taskname"] = "{}_{}".format(task_name, task_id)
+  url = "{}{}task_id={}".format(
+      row.url, "&" if "?" in row.url else "?", task_id)
+  with app.test_request_context(url, method=row.method, headers=headers):
+    try:
+      if user_id is not None and get_login_module():
+        from ggrc.login.common import find_user_by_id
+        flask_login.login_user(find_user_by_id(user_id), force=True)
+      return app.full_dispatch_request()
+    finally:
+      db.session.remove()
+
+
+def _run_in_process(queue_id):
+  """Run a leased task in a new worker process.
+
+  Database connections inherited from the pool process are discarded without
+  closing them, because closing would also close the sockets that the pool
+  process still uses.
+  """
+  from ggrc.app import app
+  db.session.registry.clear()
+  db.engine.pool = db.engine.pool.recreate()
+  run_task(app, queue_id)
+
+
+def _poll(running, workers, worker_id):
+  """Collect finished worker processes and start new ones.
+
+  Args:
+    running: dict of queue id -> worker process of running tasks.
+    workers: maximum number of worker processes.
+    worker_id: identifier of the pool used for leasing tasks.
+  """
+  for queue_id, process in running.items():
+    if not process.is_alive():
+      process.join()
+      del running[queue_id]
+      finish_task(queue_id, process.exitcode)
+
+  renew_leases(running.keys(), worker_id)
+
+  if len(running) >= workers:
+    return
+  claimed, exhausted = claim_tasks(workers - len(running), worker_id)
+  for queue_id in exhausted:
+    fail_task(queue_id, "Task stopped responding and has no attempts left")
+  for queue_id in claimed:
+    process = multiprocessing.Process(target=_run_in_process,
+                                      args=(queue_id,))
+    process.start()
+    running[queue_id] = process
+
+
+def run_workers(workers=None):
+  """Run queued background tasks until the process is stopped.
+
+  Args:
+    workers: maximum number of concurrently running tasks, defaults to the
+      LOCAL_TASK_QUEUE_WORKERS setting.
+  """
+  from ggrc.app import app
+  if workers is None:
+    workers = getattr(settings, "LOCAL_TASK_QUEUE_WORKERS", 2)
+  poll_interval = getattr(settings, "LOCAL_TASK_QUEUE_POLL_INTERVAL", 2)
+  worker_id = "{}:{}".format(socket.gethostname(), os.getpid())
+  running = {}
+  logger.info("Running background tasks with %s workers as %s",
+              workers, worker_id)
+  try:
+    while True:
+      with app.app_context():
+        try:
+          _poll(running, workers, worker_id)
+        except Exception:  # pylint: disable=broad-except
+          logger.exception("Failed to poll the background task queue")
+        finally:
+          db.session.remove()
+      time.sleep(poll_interval)
+  finally:
+    for process in running.values():
+      process.terminate()
+
+
+if __name__ == "__main__":
+  run_workers()
@@ -20,6 +20,7 @@ import time
 from collections import defaultdict
 
 from ggrc import settings
+from ggrc.utils import profiler
 
 
 logger = logging.getLogger(__name__)
@@ -47,6 +48,23 @@ class BenchmarkContextManager(object):
     logger.debug("%.4f %s", end - self.start, self.message)
 
 
+class ProfilingBenchmark(BenchmarkContextManager):
+  """Benchmark context manager used when the request profiler is enabled.
+
+  Open benchmark blocks are tracked by the request profiler, so repeated
+  statements can be reported together with the block that issued them.
+  """
+  # pylint: disable=too-few-public-methods
+
+  def __enter__(self):
+    profiler.push_block(self.message)
+    super(ProfilingBenchmark, self).__enter__()
+
+  def __exit__(self, exc_type, exc_value, exc_trace):
+    super(ProfilingBenchmark, self).__exit__(exc_type, exc_value, exc_trace)
+    profiler.pop_block()
+
+
 class WithNop(object):
   """Nop benchmark context manager.
 
@@ -221,5 +239,7 @@ def get_benchmark():
   if settings.DEBUG_BENCHMARK:
     DebugBenchmark.set_summary(settings.DEBUG_BENCHMARK)
     return DebugBenchmark
+  elif profiler.is_enabled():
+    return ProfilingBenchmark
   else:
     return BenchmarkContextManager
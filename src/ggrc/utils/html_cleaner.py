@@ -1,12 +1,25 @@
 # Copyright (C) 2017 Google Inc.
 # Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
 
-"""Provides an HTML cleaner function with sqalchemy compatible API"""
+"""Provides an HTML cleaner function with sqalchemy compatible API
 
+Cleaning a value with bleach is expensive, so values that bleach would return
+unchanged are detected with a single regular expression search, and results
+for other values are kept in a bounded LRU cache. Code that assigns many
+values at once, such as import, can clean all distinct values up front with
+the `precleaned` context manager.
+"""
+
+import contextlib
+import hashlib
+import re
+import threading
 from HTMLParser import HTMLParser
 
 import bleach
 
+from ggrc.utils.structures import LRUCache
+
 
 # Set up custom tags/attributes for bleach
 BLEACH_TAGS = [
@@ -27,6 +40,105 @@ ATTRS = [
 for tag in BLEACH_TAGS:
   BLEACH_ATTRS[tag] = ATTRS
 
+# Characters that bleach can change: markup, entities, and characters that
+# the HTML parser normalizes (carriage returns, NUL and lone surrogates).
+# Strings without any of them are returned by bleach unchanged.
+UNSAFE_CHARS = re.compile(u"[<&\r\x00\ud800-\udfff]")
+
+CACHE_SIZE = 4096
+
+# Longer values are cleaned without caching their results.
+MAX_CACHED_LENGTH = 65536
+
+
+_cache = LRUCache(CACHE_SIZE)
+
+_bulk = threading.local()
+
+
+def _get_key(value):
+  return hashlib.sha1(value.encode("utf-8")).digest()
+
+
+def _clean(value):
+  """Run bleach and unescape until the value reaches a fix point."""
+  parser = HTMLParser()
+  while True:
+    lastvalue = value
+    value = parser.unescape(
+        bleach.clean(value, BLEACH_TAGS, BLEACH_ATTRS, strip=True)
+    )
+    if value == lastvalue:
+      break
+  return value
+
+
+def clean(value):
+  """Clean out unsafe HTML tags from a string.
+
+  Args:
+    value: html (string) to be cleaned
+  Returns:
+    Html (unicode) without unsafe tags.
+  """
+  value = unicode(value)
+  if not UNSAFE_CHARS.search(value):
+    return value
+
+  precleaned_values = getattr(_bulk, "values", None)
+  if precleaned_values is not None and value in precleaned_values:
+    return precleaned_values[value]
+
+  if len(value) > MAX_CACHED_LENGTH:
+    return _clean(value)
+
+  key = _get_key(value)
+  cleaned = _cache.get(key)
+  if cleaned is None:
+    cleaned = _clean(value)
+    _cache.set(key, cleaned)
+    if cleaned != value:
+      # Cleaned values are a fix point, so assigning them again is a hit.
+      _cache.set(_get_key(cleaned), cleaned)
+  return cleaned
+
+
+def clean_values(values):
+  """Clean many values at once.
+
+  Args:
+    values: iterable of values, non-string values are ignored.
+  Returns:
+    dict of every distinct original and cleaned string value -> cleaned
+    value.
+  """
+  cleaned_values = {}
+  for value in set(values):
+    if isinstance(value, basestring) and value not in cleaned_values:
+      cleaned = clean(value)
+      cleaned_values[value] = cleaned
+      cleaned_values[cleaned] = cleaned
+  return cleaned_values
+
+
+@contextlib.contextmanager
+def precleaned(values):
+  """Serve cleaned values for the given values from a precomputed map.
+
+  Values cleaned inside the block are looked up in a map built with
+  clean_values, so they are cleaned only once even if there are more of them
+  than fit into the LRU cache.
+  """
+  previous = getattr(_bulk, "values", None)
+  cleaned_values = clean_values(values)
+  if previous:
+    cleaned_values.update(previous)
+  _bulk.values = cleaned_values
+  try:
+    yield cleaned_values
+  finally:
+    _bulk.values = previous
+
 
 def cleaner(dummy, value, *_):
   """Cleans out unsafe HTML tags.
@@ -45,14 +157,4 @@ def cleaner(dummy, value, *_):
   if not isinstance(value, basestring):
     # no point in sanitizing non-strings
     return value
-
-  parser = HTMLParser()
-  value = unicode(value)
-  while True:
-    lastvalue = value
-    value = parser.unescape(
-        bleach.clean(value, BLEACH_TAGS, BLEACH_ATTRS, strip=True)
-    )
-    if value == lastvalue:
-      break
-  return value
+  return clean(value)
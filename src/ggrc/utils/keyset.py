@@ -0,0 +1,117 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Helpers for keyset (cursor) pagination.
+
+Instead of skipping `offset` rows, a keyset page starts right after the last
+row of the previous page. The position is described by the values of the
+ordering columns of that row, the last of which must be unique (usually the
+id), so every page costs the same regardless of how deep it is.
+
+Cursors are opaque url safe strings that hold the ordering values and the
+total number of rows counted for the first page, so following pages do not
+need to count the rows again.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+
+import sqlalchemy as sa
+
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def _encode_value(value):
+  """Convert values that are not supported by json."""
+  if isinstance(value, datetime.datetime):
+    return {"__datetime__": value.strftime(DATETIME_FORMAT)}
+  if isinstance(value, datetime.date):
+    return {"__date__": value.strftime(DATE_FORMAT)}
+  if isinstance(value, decimal.Decimal):
+    return {"__decimal__": str(value)}
+  raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def _decode_value(obj):
+  """Restore values converted by _encode_value."""
+  if "__datetime__" in obj:
+    return datetime.datetime.strptime(obj["__datetime__"], DATETIME_FORMAT)
+  if "__date__" in obj:
+    return datetime.datetime.strptime(obj["__date__"], DATE_FORMAT).date()
+  if "__decimal__" in obj:
+    return decimal.Decimal(obj["__decimal__"])
+  return obj
+
+
+def encode_cursor(values, total=None):
+  """Make a cursor pointing right after a row with given ordering values."""
+  data = json.dumps({"values": list(values), "total": total},
+                    default=_encode_value, separators=(",", ":"))
+  return base64.urlsafe_b64encode(data).rstrip("=")
+
+
+def decode_cursor(cursor, size):
+  """Get ordering values and total from a cursor.
+
+  Args:
+    cursor: cursor made by encode_cursor.
+    size: number of ordering values expected in the cursor.
+
+  Returns:
+    tuple of a list of ordering values and the total number of rows.
+
+  Raises:
+    ValueError if the cursor is not valid.
+  """
+  try:
+    padding = "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(str(cursor) + padding),
+                      object_hook=_decode_value)
+    values, total = data["values"], data["total"]
+  except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+    raise ValueError("Invalid cursor.")
+  if not isinstance(values, list) or len(values) != size:
+    raise ValueError("Invalid cursor.")
+  return values, total
+
+
+def _after_value(column, value, desc):
+  """Get a filter for rows that come after value in a single column.
+
+  MySQL puts NULL values first in ascending and last in descending order.
+  """
+  if value is None:
+    return sa.false() if desc else column.isnot(None)
+  if desc:
+    return sa.or_(column < value, column.is_(None))
+  return column > value
+
+
+def _equal_value(column, value):
+  if value is None:
+    return column.is_(None)
+  return column == value
+
+
+def after(order, values):
+  """Get a filter for rows that come after the row with given values.
+
+  Args:
+    order: list of (column, desc) tuples the query is ordered by.
+    values: values of the ordering columns of the last row of a page.
+
+  Returns:
+    filter expression for rows of the next page.
+  """
+  (column, desc), value = order[-1], values[-1]
+  expression = _after_value(column, value, desc)
+  for (column, desc), value in reversed(zip(order[:-1], values[:-1])):
+    expression = sa.or_(
+        _after_value(column, value, desc),
+        sa.and_(_equal_value(column, value), expression),
+    )
+  return expression
@@ -0,0 +1,281 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Request level SQL and serialization profiler.
+
+To enable the profiler set the GGRC_REQUEST_PROFILER env var to "true". For
+every request the profiler then records:
+
+  * the number of executed SQL statements and the total database time,
+  * statements repeated at least REQUEST_PROFILER_REPEAT_THRESHOLD times,
+    grouped by a fingerprint that ignores parameter values and IN list
+    lengths, together with the benchmark blocks they were issued from,
+  * the time spent serializing responses.
+
+Totals are sent in X-GGRC-Profile-* response headers and aggregated per
+endpoint in the current process, see get_stats and /admin/profile. When the
+profiler is disabled no listeners are registered and `timer` returns a no-op
+context manager.
+"""
+
+import collections
+import logging
+import re
+import threading
+import time
+
+import flask
+import sqlalchemy
+
+from ggrc import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY = "request_profile"
+
+# Number of repeated statements listed per endpoint in the aggregated stats.
+TOP_REPEATED = 10
+
+_IN_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_samples = collections.defaultdict(lambda: collections.deque(
+    maxlen=getattr(settings, "REQUEST_PROFILER_HISTORY", 1000)))
+_repeated = collections.defaultdict(dict)
+
+
+def is_enabled():
+  return getattr(settings, "REQUEST_PROFILER", False)
+
+
+def get_fingerprint(statement):
+  """Get statement text without parameter list lengths and extra spaces."""
+  return _IN_LIST.sub("(%s...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class RequestProfile(object):
+  """Statistics of the current request."""
+
+  def __init__(self):
+    self.start = time.time()
+    self.statements = 0
+    self.db_time = 0.0
+    self.timers = collections.defaultdict(float)
+    self.running_timers = set()
+    self.fingerprints = {}
+    self.stack = []
+
+  def add_statement(self, statement, duration):
+    """Record an executed statement."""
+    self.statements += 1
+    self.db_time += duration
+    fingerprint = get_fingerprint(statement)
+    entry = self.fingerprints.get(fingerprint)
+    if entry is None:
+      entry = self.fingerprints[fingerprint] = {
+          "count": 0,
+          "time": 0.0,
+          "stacks": collections.Counter(),
+      }
+    entry["count"] += 1
+    entry["time"] += duration
+    entry["stacks"][" > ".join(self.stack)] += 1
+
+  def get_repeated(self):
+    """Get statements repeated at least REQUEST_PROFILER_REPEAT_THRESHOLD
+    times, most repeated first."""
+    threshold = getattr(settings, "REQUEST_PROFILER_REPEAT_THRESHOLD", 10)
+    repeated = [
+        {
+            "fingerprint": fingerprint,
+            "count": entry["count"],
+            "time": entry["time"],
+            "stack": entry["stacks"].most_common(1)[0][0],
+        }
+        for fingerprint, entry in self.fingerprints.iteritems()
+        if entry["count"] >= threshold
+    ]
+    return sorted(repeated, key=lambda item: item["count"], reverse=True)
+
+
+def get_profile():
+  """Get profile of the current request or None if it is not profiled."""
+  if not flask.has_app_context():
+    return None
+  return getattr(flask.g, PROFILE_KEY, None)
+
+
+class _Timer(object):
+  """Context manager adding its duration to a timer of the request profile.
+
+  Nested timers with the same name are not counted twice.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.profile = None
+    self.start = 0
+
+  def __enter__(self):
+    profile = get_profile()
+    if profile is not None and self.name not in profile.running_timers:
+      profile.running_timers.add(self.name)
+      self.profile = profile
+      self.start = time.time()
+
+  def __exit__(self, exc_type, exc_value, exc_trace):
+    if self.profile is not None:
+      self.profile.timers[self.name] += time.time() - self.start
+      self.profile.running_timers.discard(self.name)
+
+
+class _NopTimer(object):
+
+  def __enter__(self):
+    pass
+
+  def __exit__(self, exc_type, exc_value, exc_trace):
+    pass
+
+
+_nop_timer = _NopTimer()
+
+
+def timer(name):
+  """Get a context manager that measures a part of the request."""
+  if is_enabled():
+    return _Timer(name)
+  return _nop_timer
+
+
+def push_block(message):
+  """Mark the start of a benchmark block for statements of the request."""
+  profile = get_profile()
+  if profile is not None:
+    profile.stack.append(message)
+
+
+def pop_block():
+  profile = get_profile()
+  if profile is not None and profile.stack:
+    profile.stack.pop()
+
+
+def _before_cursor_execute(conn, *_):
+  conn.info["profiler_start"] = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, *_):
+  # pylint: disable=unused-argument
+  start = conn.info.pop("profiler_start", None)
+  profile = get_profile()
+  if profile is not None and start is not None:
+    profile.add_statement(statement, time.time() - start)
+
+
+def _start_request():
+  setattr(flask.g, PROFILE_KEY, RequestProfile())
+
+
+def _percentile(values, percent):
+  """Get a nearest rank percentile of a sorted list."""
+  index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+  return values[index]
+
+
+def _record(endpoint, profile, total_time, repeated):
+  """Add a request to the aggregated stats of its endpoint."""
+  with _lock:
+    _samples[endpoint].append((
+        total_time,
+        profile.db_time,
+        profile.statements,
+        profile.timers["serialization"],
+    ))
+    endpoint_repeated = _repeated[endpoint]
+    for item in repeated:
+      entry = endpoint_repeated.setdefault(item["fingerprint"], {
+          "fingerprint": item["fingerprint"],
+          "requests": 0,
+          "max_count": 0,
+      })
+      entry["requests"] += 1
+      entry["max_count"] = max(entry["max_count"], item["count"])
+      entry["stack"] = item["stack"]
+
+
+def _finish_request(response):
+  """Add profile headers to the response and record the request."""
+  profile = getattr(flask.g, PROFILE_KEY, None)
+  if profile is None:
+    return response
+  delattr(flask.g, PROFILE_KEY)
+  total_time = time.time() - profile.start
+  repeated = profile.get_repeated()
+  response.headers["X-GGRC-Profile-Statements"] = str(profile.statements)
+  response.headers["X-GGRC-Profile-DB-Time"] = "{:.4f}".format(
+      profile.db_time)
+  response.headers["X-GGRC-Profile-Serialization-Time"] = "{:.4f}".format(
+      profile.timers["serialization"])
+  response.headers["X-GGRC-Profile-Total-Time"] = "{:.4f}".format(total_time)
+  response.headers["X-GGRC-Profile-Repeated"] = str(len(repeated))
+
+  rule = flask.request.url_rule
+  if rule is None:
+    return response
+  endpoint = "{} {}".format(flask.request.method, rule.rule)
+  for item in repeated:
+    logger.warning("%s repeated %s times in %s [%s]: %s", endpoint,
+                   item["count"], item["stack"] or "request",
+                   "{:.4f}s".format(item["time"]), item["fingerprint"])
+  _record(endpoint, profile, total_time, repeated)
+  return response
+
+
+def get_stats():
+  """Get p50 and p95 of profiled values for every endpoint."""
+  with _lock:
+    samples = {endpoint: list(values)
+               for endpoint, values in _samples.iteritems()}
+    repeated = {endpoint: [dict(entry) for entry in entries.itervalues()]
+                for endpoint, entries in _repeated.iteritems()}
+  stats = {}
+  for endpoint, values in samples.iteritems():
+    if not values:
+      continue
+    columns = zip(*values)
+    endpoint_stats = {"requests": len(values)}
+    for name, column in zip(("total_time", "db_time", "statements",
+                             "serialization_time"), columns):
+      column = sorted(column)
+      endpoint_stats[name] = {
+          "p50": _percentile(column, 50),
+          "p95": _percentile(column, 95),
+      }
+    endpoint_stats["repeated"] = sorted(
+        repeated.get(endpoint, []),
+        key=lambda entry: (entry["requests"], entry["max_count"]),
+        reverse=True,
+    )[:TOP_REPEATED]
+    stats[endpoint] = endpoint_stats
+  return stats
+
+
+def reset_stats():
+  with _lock:
+    _samples.clear()
+    _repeated.clear()
+
+
+def init_app(app):
+  """Register profiler hooks if the profiler is enabled."""
+  if not is_enabled():
+    return
+  sqlalchemy.event.listen(sqlalchemy.engine.Engine, "before_cursor_execute",
+                          _before_cursor_execute)
+  sqlalchemy.event.listen(sqlalchemy.engine.Engine, "after_cursor_execute",
+                          _after_cursor_execute)
+  app.before_request(_start_request)
+  app.after_request(_finish_request)
@@ -11,6 +11,7 @@ from sqlalchemy import union
 from sqlalchemy import alias
 from sqlalchemy.orm import aliased
 from ggrc import db
+from ggrc.cache import metadata
 from ggrc.models import all_models
 from ggrc.models.object_person import ObjectPerson
 from ggrc.models.object_owner import ObjectOwner
@@ -266,7 +267,20 @@ def get_myobjects_query(types=None, contact_id=None, is_creator=False):  # noqa
 
 def get_context_resource(model_name, permission_type='read',
                          permission_model=None):
-  """Get allowed contexts and resources."""
+  """Get allowed contexts and resources.
+
+  The result depends on permissions of the current user, so it is only reused
+  within a request.
+  """
+  return metadata.get_for_request(
+      "context_resource", (model_name, permission_type, permission_model),
+      lambda: _get_context_resource(model_name, permission_type,
+                                    permission_model),
+  )
+
+
+def _get_context_resource(model_name, permission_type, permission_model):
+  """Compute allowed contexts and resources."""
   permissions_map = {
       "create": (pr.create_contexts_for, pr.create_resources_for),
       "read": (pr.read_contexts_for, pr.read_resources_for),
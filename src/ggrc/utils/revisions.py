@@ -3,14 +3,20 @@
 
 """Utility class for handling revisions."""
 
+from collections import defaultdict
 from logging import getLogger
 
+from sqlalchemy.sql import bindparam
 from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import tuple_
 from sqlalchemy import func
 from sqlalchemy import literal
 
 from ggrc import db
+from ggrc import settings
+from ggrc.models import revision_storage
 from ggrc.utils import benchmark
+from ggrc.utils import list_chunks
 from ggrc.login import get_current_user_id
 from ggrc.models import all_models
 from ggrc.snapshotter.rules import Types
@@ -27,21 +33,14 @@ def _get_revisions_by_type(type_):
   Returns:
     dict with object_id as key and revision_id of the latest revision as value.
   """
+  revisions = db.session.query(
+      all_models.Revision.resource_id,
+      func.max(all_models.Revision.id),
+  ).filter(
+      all_models.Revision.resource_type == type_,
+  ).group_by(all_models.Revision.resource_id)
 
-  revisions = db.session.execute(
-      """
-      SELECT * FROM (
-          SELECT id, resource_id
-          FROM revisions
-          WHERE resource_type = :type
-          ORDER BY resource_id, id DESC
-      ) AS revs
-      GROUP BY resource_id
-      """,
-      [{"type": type_}]
-  )
-
-  return {row.resource_id: row.id for row in revisions}
+  return dict(revisions)
 
 
 def _fix_type_revisions(event, type_, obj_rev_map):
@@ -172,24 +171,132 @@ def _recover_create_revisions(revisions_table, event, object_type,
 def set_resource_slugs():
   with benchmark("set revision resource_slug content"):
     revisions_table = all_models.Revision.__table__
-    rows = db.session.execute(select([
+    revision_ids = [id_ for id_, in db.session.execute(select([
         revisions_table.c.id,
-        revisions_table.c.content,
     ]).where(
         revisions_table.c.resource_type.in_(Types.all)
     ).where(
         revisions_table.c.resource_slug.is_(None)
-    ))
-    for row in rows:
-      if row.content.get("slug"):
-        db.session.execute(
-            revisions_table.update()
-            .where(revisions_table.c.id == row.id)
-            .values(resource_slug=row.content.get("slug"))
-        )
+    ))]
+    for ids_chunk in list_chunks(revision_ids):
+      contents = revision_storage.load_contents(ids_chunk)
+      for revision_id, content in contents.iteritems():
+        if content.get("slug"):
+          db.session.execute(
+              revisions_table.update()
+              .where(revisions_table.c.id == revision_id)
+              .values(resource_slug=content.get("slug"))
+          )
     db.session.commit()
 
 
+def _get_compactable_resources():
+  """Get (type, id) of objects with more than one full revision."""
+  revisions_table = all_models.Revision.__table__
+  return db.session.query(
+      revisions_table.c.resource_type,
+      revisions_table.c.resource_id,
+  ).filter(
+      revisions_table.c.content.isnot(None)
+  ).group_by(
+      revisions_table.c.resource_type,
+      revisions_table.c.resource_id,
+  ).having(func.count() > 1).all()
+
+
+def _compact_resources(resources):
+  """Compact all but the latest revision of the given objects.
+
+  Returns:
+    number of compacted revisions.
+  """
+  revisions_table = all_models.Revision.__table__
+  rows = db.session.query(
+      revisions_table.c.resource_type,
+      revisions_table.c.resource_id,
+      revisions_table.c.id,
+      revisions_table.c.content.isnot(None),
+  ).filter(
+      tuple_(revisions_table.c.resource_type,
+             revisions_table.c.resource_id).in_(resources)
+  ).order_by(revisions_table.c.id).all()
+  chains = defaultdict(list)
+  for resource_type, resource_id, revision_id, is_full in rows:
+    chains[resource_type, resource_id].append((revision_id, is_full))
+  contents = revision_storage.load_contents(
+      [revision_id for _, _, revision_id, _ in rows])
+
+  interval = getattr(settings, "REVISION_KEYFRAME_INTERVAL", 20)
+  updates = []
+  blobs = {}
+  for chain in chains.itervalues():
+    # the latest revision is kept in full for fast snapshot creation
+    for position, (revision_id, is_full) in enumerate(chain[:-1]):
+      if not is_full:
+        continue
+      if position % interval == 0:
+        base_id = None
+      else:
+        base_id = chain[position - 1][0]
+      compact, revision_blobs = revision_storage.encode(
+          contents[revision_id], contents.get(base_id), base_id)
+      blobs.update(revision_blobs)
+      updates.append({"revision_id": revision_id, "compact": compact})
+
+  revision_storage.store_blobs(blobs)
+  if updates:
+    db.session.execute(
+        revisions_table.update().where(
+            revisions_table.c.id == bindparam("revision_id")
+        ).values(content=None, compact_content=bindparam("compact")),
+        updates,
+    )
+  return len(updates)
+
+
+def compact_revisions(chunk_size=100):
+  """Store older revisions as compressed deltas in batches of objects.
+
+  Returns:
+    number of compacted revisions.
+  """
+  count = 0
+  with benchmark("Compact revisions"):
+    resources = _get_compactable_resources()
+    for resources_chunk in list_chunks(resources, chunk_size):
+      count += _compact_resources(resources_chunk)
+      db.session.commit()
+  logger.info("Compacted %s revisions", count)
+  return count
+
+
+def expand_revisions(chunk_size=1000):
+  """Store all compacted revisions with their full content again.
+
+  Returns:
+    number of expanded revisions.
+  """
+  revisions_table = all_models.Revision.__table__
+  count = 0
+  with benchmark("Expand revisions"):
+    revision_ids = [id_ for id_, in db.session.query(
+        revisions_table.c.id
+    ).filter(revisions_table.c.content.is_(None))]
+    for ids_chunk in list_chunks(revision_ids, chunk_size):
+      contents = revision_storage.load_contents(ids_chunk)
+      db.session.execute(
+          revisions_table.update().where(
+              revisions_table.c.id == bindparam("revision_id")
+          ).values(content=bindparam("full_content"), compact_content=None),
+          [{"revision_id": revision_id, "full_content": content}
+           for revision_id, content in contents.iteritems()],
+      )
+      db.session.commit()
+      count += len(contents)
+  logger.info("Expanded %s revisions", count)
+  return count
+
+
 def do_refresh_revisions():
   """Update last revisions of models with fixed data."""
   set_resource_slugs()
@@ -4,6 +4,7 @@
 """Collection if ggrc specific structures."""
 
 import collections
+import threading
 
 
 class CaseInsensitiveDict(collections.MutableMapping):
@@ -102,3 +103,37 @@ class CaseInsensitiveDefaultDict(CaseInsensitiveDict):
 
   def copy(self):
     return CaseInsensitiveDefaultDict(self._default, data=self._store.values())
+
+
+class LRUCache(object):
+  """Thread safe dict-like cache that drops least recently used entries."""
+
+  def __init__(self, size):
+    self.size = size
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      value = self._entries.pop(key, None)
+      if value is not None:
+        self._entries[key] = value
+      return value
+
+  def set(self, key, value):
+    with self._lock:
+      self._entries.pop(key, None)
+      self._entries[key] = value
+      while len(self._entries) > self.size:
+        self._entries.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def __len__(self):
+    return len(self._entries)
@@ -12,33 +12,34 @@ import logging
 from flask import flash
 from flask import g
 from flask import render_template
+from flask import request
 from flask import url_for
+from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import Forbidden
 
+from ggrc import db
 from ggrc import models
 from ggrc import settings
+from ggrc import snapshotter
 from ggrc.app import app
-from ggrc.app import db
 from ggrc.builder.json import publish
 from ggrc.builder.json import publish_representation
+from ggrc.cache import metadata
 from ggrc.converters import get_importables, get_exportables
 from ggrc.extensions import get_extension_modules
-from ggrc.fulltext import get_indexer, get_indexed_model_names
-from ggrc.fulltext.recordbuilder import fts_record_for
+from ggrc.fulltext import reindex as fulltext_reindex
 from ggrc.login import get_current_user
 from ggrc.login import login_required
 from ggrc.models import all_models
 from ggrc.models.background_task import create_task
 from ggrc.models.background_task import make_task_response
 from ggrc.models.background_task import queued_task
-from ggrc.models.inflector import get_model
 from ggrc.models.reflection import AttributeInfo
 from ggrc.rbac import permissions
 from ggrc.services.common import as_json
 from ggrc.services.common import inclusion_filter
 from ggrc.services import query as services_query
 from ggrc.snapshotter import rules
-from ggrc.snapshotter.indexer import reindex as reindex_snapshots
 from ggrc.views import converters
 from ggrc.views import cron
 from ggrc.views import filters
@@ -47,7 +48,7 @@ from ggrc.views import notifications
 from ggrc.views.common import RedirectedPolymorphView
 from ggrc.views.registry import object_view
 from ggrc.utils import benchmark
-from ggrc.utils import generate_query_chunks
+from ggrc.utils import profiler
 from ggrc.utils import revisions
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -62,44 +63,85 @@ def refresh_revisions(_):
   return app.make_response(("success", 200, [("Content-Type", "text/html")]))
 
 
-@app.route("/_background_tasks/reindex", methods=["POST"])
+@app.route("/_background_tasks/compact_revisions", methods=["POST"])
 @queued_task
-def reindex(_):
-  """Web hook to update the full text search index."""
-  do_reindex()
+def compact_revisions(task):
+  """Web hook to convert revisions between full and compact storage."""
+  parameters = task.parameters or {}
+  if parameters.get("expand", False):
+    revisions.expand_revisions()
+  else:
+    revisions.compact_revisions()
+  return app.make_response(("success", 200, [("Content-Type", "text/html")]))
+
+
+@app.route("/_background_tasks/snapshots", methods=["POST", "PUT"])
+@queued_task
+def run_snapshots(task):
+  """Web hook to create or update snapshots of large scopes."""
+  snapshotter.run_snapshot_task(task)
   return app.make_response(("success", 200, [("Content-Type", "text/html")]))
 
 
-def do_reindex():
-  """Update the full text search index."""
+@app.route("/_background_tasks/upsert_snapshots", methods=["POST"])
+@queued_task
+def upsert_snapshots(task):
+  """Web hook to update snapshots of many audits to latest revisions."""
+  parameters = task.parameters or {}
+  do_upsert_snapshots(audit_ids=parameters.get("audit_ids"),
+                      program_id=parameters.get("program_id"),
+                      all_audits=parameters.get("all", False),
+                      progress=task.report_progress)
+  return app.make_response(("success", 200, [("Content-Type", "text/html")]))
 
-  indexer = get_indexer()
-  with benchmark('Delete all records'):
-    indexer.delete_all_records(False)
 
-  indexed_models = get_indexed_model_names()
+def do_upsert_snapshots(audit_ids=None, program_id=None, all_audits=False,
+                        progress=None):
+  """Update snapshots of the selected audits in one bulk operation.
 
-  people = db.session.query(all_models.Person.id, all_models.Person.name,
-                            all_models.Person.email)
-  g.people_map = {p.id: (p.name, p.email) for p in people}
+  Args:
+    audit_ids: ids of audits to update.
+    program_id: update all audits of this program.
+    all_audits: update all audits when neither audit_ids nor program_id is
+      given. Without any of them, nothing is updated.
+    progress: callback that receives progress messages.
+  """
+  if not (audit_ids or program_id or all_audits):
+    return
+  with benchmark("Upsert audit snapshots"):
+    audits = all_models.Audit.query
+    if audit_ids:
+      audits = audits.filter(all_models.Audit.id.in_(audit_ids))
+    if program_id:
+      audits = audits.filter(all_models.Audit.program_id == program_id)
+    audits = audits.all()
+    if not audits:
+      return
+    event = all_models.Event(action="BULK", resource_type="Audit")
+    db.session.add(event)
+    db.session.flush([event])
+    snapshotter.bulk_upsert_snapshots(audits, event, progress=progress)
+    db.session.commit()
+
+
+@app.route("/_background_tasks/reindex", methods=["POST"])
+@queued_task
+def reindex(task):
+  """Web hook to update the full text search index."""
+  parameters = task.parameters or {}
+  do_reindex(incremental=parameters.get("incremental", False))
+  return app.make_response(("success", 200, [("Content-Type", "text/html")]))
 
-  for model in sorted(indexed_models):
-    # pylint: disable=protected-access
-    logger.info("Updating index for: %s", model)
-    with benchmark("Create records for %s" % model):
-      model = get_model(model)
-      mapper_class = model._sa_class_manager.mapper.base_mapper.class_
-      query = model.query.options(
-          db.undefer_group(mapper_class.__name__ + '_complete'),
-      )
-      for query_chunk in generate_query_chunks(query):
-        for instance in query_chunk:
-          indexer.create_record(fts_record_for(instance), False)
-        db.session.commit()
 
-  reindex_snapshots()
+def do_reindex(incremental=False):
+  """Update the full text search index.
 
-  delattr(g, "people_map")
+  Args:
+    incremental: only reindex objects modified since the last reindex,
+      instead of rebuilding the whole index.
+  """
+  with benchmark("Reindex fulltext records"):
+    fulltext_reindex.reindex(incremental=incremental)
 
 
 def get_permissions_json():
@@ -140,26 +182,35 @@ def get_full_user_json():
     current_user = get_current_user()
     person = Person.eager_query().filter_by(id=current_user.id).one()
     result = publish_representation(publish(person, (), inclusion_filter))
-    return as_json(result)
+    with profiler.timer("serialization"):
+      return as_json(result)
 
 
 def get_current_user_json():
   """Get current user"""
   with benchmark("Get current user JSON"):
     person = get_current_user()
-    return as_json({
-        "id": person.id,
-        "company": person.company,
-        "email": person.email,
-        "language": person.language,
-        "name": person.name,
-        "system_wide_role": person.system_wide_role,
-    })
+    with profiler.timer("serialization"):
+      return as_json({
+          "id": person.id,
+          "company": person.company,
+          "email": person.email,
+          "language": person.language,
+          "name": person.name,
+          "system_wide_role": person.system_wide_role,
+      })
 
 
 def get_attributes_json():
   """Get a list of all custom attribute definitions"""
   with benchmark("Get attributes JSON"):
+    return metadata.get("attributes_json", None, ("custom_attributes",),
+                        _get_attributes_json, copy_value=False)
+
+
+def _get_attributes_json():
+  """Publish all global custom attribute definitions."""
+  with benchmark("Publish attributes JSON"):
     attrs = models.CustomAttributeDefinition.eager_query().filter(
         models.CustomAttributeDefinition.definition_id.is_(None)
     )
@@ -167,7 +218,8 @@ def get_attributes_json():
     for attr in attrs:
       published.append(publish(attr))
     published = publish_representation(published)
-    return as_json(published)
+    with profiler.timer("serialization"):
+      return as_json(published)
 
 
 def get_import_types(export_only=False):
@@ -179,6 +231,13 @@ def get_import_types(export_only=False):
   Returns:
     A list of models with model_singular and title_plural as keys.
   """
+  return metadata.get("import_types", export_only, (),
+                      lambda: _get_import_types(export_only),
+                      copy_value=False)
+
+
+def _get_import_types(export_only):
+  """Build the JSON list of importable or exportable types."""
   # pylint: disable=protected-access
   types = get_exportables if export_only else get_importables
   data = []
@@ -209,6 +268,16 @@ def get_all_attributes_json(load_custom_attributes=False):
   attributes and mapping attributes, that are used in csv import and export.
   """
   with benchmark('Loading all attributes JSON'):
+    regions = ("custom_attributes",) if load_custom_attributes else ()
+    return metadata.get(
+        "all_attributes_json", load_custom_attributes, regions,
+        lambda: _get_all_attributes_json(load_custom_attributes),
+        copy_value=False)
+
+
+def _get_all_attributes_json(load_custom_attributes):
+  """Publish attribute definitions of all models."""
+  with benchmark('Publish all attributes JSON'):
     published = {}
     ca_cache = collections.defaultdict(list)
     if load_custom_attributes:
@@ -220,7 +289,8 @@ def get_all_attributes_json(load_custom_attributes=False):
     for model in all_models.all_models:
       published[model.__name__] = \
           AttributeInfo.get_attr_definitions_array(model, ca_cache=ca_cache)
-    return as_json(published)
+    with profiler.timer("serialization"):
+      return as_json(published)
 
 
 @app.context_processor
@@ -287,7 +357,39 @@ def admin_reindex():
   """
   if not permissions.is_allowed_read("/admin", None, 1):
     raise Forbidden()
-  task_queue = create_task("reindex", url_for(reindex.__name__), reindex)
+  parameters = {"incremental": request.values.get("incremental") == "true"}
+  task_queue = create_task("reindex", url_for(reindex.__name__), reindex,
+                           parameters)
+  return task_queue.make_response(
+      app.make_response(("scheduled %s" % task_queue.name, 200,
+                         [('Content-Type', 'text/html')])))
+
+
+@app.route("/admin/upsert_snapshots", methods=["POST"])
+@login_required
+def admin_upsert_snapshots():
+  """Calls a webhook that updates snapshots of audits to latest revisions.
+
+  Audits are selected with comma separated audit_ids or with program_id.
+  Snapshots of all audits are updated only with all=true.
+  """
+  if not permissions.is_allowed_read("/admin", None, 1):
+    raise Forbidden()
+  audit_ids = request.values.get("audit_ids")
+  program_id = request.values.get("program_id")
+  try:
+    parameters = {
+        "audit_ids": ([int(id_) for id_ in audit_ids.split(",")]
+                      if audit_ids else None),
+        "program_id": int(program_id) if program_id else None,
+    }
+  except ValueError:
+    raise BadRequest("audit_ids and program_id must be integers")
+  parameters["all"] = request.values.get("all") == "true"
+  if not any(parameters.values()):
+    raise BadRequest("audit_ids, program_id or all=true must be given")
+  task_queue = create_task("upsert_snapshots", url_for(
+      upsert_snapshots.__name__), upsert_snapshots, parameters)
   return task_queue.make_response(
       app.make_response(("scheduled %s" % task_queue.name, 200,
                          [('Content-Type', 'text/html')])))
@@ -308,6 +410,59 @@ def admin_refresh_revisions():
                          [('Content-Type', 'text/html')])))
 
 
+@app.route("/admin/compact_revisions", methods=["POST"])
+@login_required
+def admin_compact_revisions():
+  """Calls a webhook that compacts revisions, or expands them back if the
+  expand parameter is set.
+  """
+  admins = getattr(settings, "BOOTSTRAP_ADMIN_USERS", [])
+  if get_current_user().email not in admins:
+    raise Forbidden()
+
+  parameters = {"expand": request.values.get("expand") == "true"}
+  task_queue = create_task("compact_revisions", url_for(
+      compact_revisions.__name__), compact_revisions, parameters)
+  return task_queue.make_response(
+      app.make_response(("scheduled %s" % task_queue.name, 200,
+                         [('Content-Type', 'text/html')])))
+
+
+@app.route("/admin/profile", methods=["GET", "DELETE"])
+@login_required
+def admin_profile():
+  """Get request profiler stats of this process aggregated per endpoint.
+
+  DELETE clears the collected stats.
+  """
+  if not permissions.is_allowed_read("/admin", None, 1):
+    raise Forbidden()
+  if request.method == "DELETE":
+    profiler.reset_stats()
+  return app.make_response((
+      as_json({"enabled": profiler.is_enabled(),
+               "endpoints": profiler.get_stats()}),
+      200,
+      [("Content-Type", "application/json")]))
+
+
+@app.route("/admin/metadata_cache", methods=["GET", "DELETE"])
+@login_required
+def admin_metadata_cache():
+  """Get hit and miss counters of the metadata cache of this process.
+
+  DELETE clears the counters.
+  """
+  if not permissions.is_allowed_read("/admin", None, 1):
+    raise Forbidden()
+  if request.method == "DELETE":
+    metadata.reset_stats()
+  return app.make_response((
+      as_json(metadata.get_stats()),
+      200,
+      [("Content-Type", "application/json")]))
+
+
 @app.route("/admin")
 @login_required
 def admin():
@@ -8,6 +8,7 @@ from ggrc.rbac import permissions
 from ggrc.services.common import \
     ModelView, as_json, inclusion_filter, filter_resource
 from ggrc.utils import view_url_for, benchmark
+from ggrc.utils import profiler
 from werkzeug.exceptions import Forbidden
 
 
@@ -53,12 +54,11 @@ class BaseObjectView(ModelView):
   def get_object_json(self, obj):
     """Returns object json"""
     with benchmark("Get object JSON"):
-      return as_json({
-          self.model._inflector.table_singular:
-          filter_resource(
-              ggrc.builder.json.publish_representation(
-                  ggrc.builder.json.publish(obj, (), inclusion_filter)))
-      })
+      published = filter_resource(
+          ggrc.builder.json.publish_representation(
+              ggrc.builder.json.publish(obj, (), inclusion_filter)))
+      with profiler.timer("serialization"):
+        return as_json({self.model._inflector.table_singular: published})
 
   def get_model_template_paths_for_object(self, obj):
     # Generate lookup paths for templates based on inheritance
@@ -13,8 +13,10 @@ from flask import current_app
 from flask import request
 from flask import json
 from flask import render_template
+from flask import stream_with_context
 from werkzeug.exceptions import BadRequest
 
+from ggrc import settings
 from ggrc.app import app
 from ggrc.converters.base import Converter
 from ggrc.converters.import_helper import generate_csv_string
@@ -52,25 +54,58 @@ def parse_export_request():
   return request.json
 
 
+def get_export_headers(converter):
+  """Get response headers for the csv file created by the given converter."""
+  object_names = "_".join(converter.get_object_names())
+  filename = "{}.csv".format(object_names)
+  return [
+      ("Content-Type", "text/csv"),
+      ("Content-Disposition",
+       "attachment; filename='{}'".format(filename)),
+  ]
+
+
+def log_stream_errors(csv_chunks):
+  """Log errors raised while the export response is already being sent."""
+  try:
+    for csv_chunk in csv_chunks:
+      yield csv_chunk
+  except:  # pylint: disable=bare-except
+    logger.exception("Export failed")
+    raise
+
+
+def make_streamed_export_response(ids_by_type):
+  """Make a chunked response that generates the csv file on the fly.
+
+  The first bytes are sent as soon as the first chunk of the first block is
+  converted and only a single chunk of objects is held in memory at a time.
+  """
+  converter = Converter(ids_by_type=ids_by_type)
+  csv_chunks = converter.to_csv_chunks()
+  headers = get_export_headers(converter)
+  return current_app.response_class(
+      stream_with_context(log_stream_errors(csv_chunks)),
+      status=200,
+      headers=headers,
+  )
+
+
 def handle_export_request():
   try:
     with benchmark("handle export request"):
       data = parse_export_request()
       query_helper = QueryHelper(data)
       ids_by_type = query_helper.get_ids()
+    if getattr(settings, "EXPORT_STREAMING", False):
+      return make_streamed_export_response(ids_by_type)
     with benchmark("Generate CSV array"):
       converter = Converter(ids_by_type=ids_by_type)
       csv_data = converter.to_array()
     with benchmark("Generate CSV string"):
       csv_string = generate_csv_string(csv_data)
     with benchmark("Make response."):
-      object_names = "_".join(converter.get_object_names())
-      filename = "{}.csv".format(object_names)
-      headers = [
-          ("Content-Type", "text/csv"),
-          ("Content-Disposition",
-           "attachment; filename='{}'".format(filename)),
-      ]
+      headers = get_export_headers(converter)
       return current_app.make_response((csv_string, 200, headers))
   except BadQueryException as exception:
     raise BadRequest(exception.message)
@@ -25,11 +25,11 @@ from ggrc.models.program import Program
 from ggrc.models.object_owner import ObjectOwner
 from ggrc.rbac import permissions as rbac_permissions
 from ggrc.rbac.permissions_provider import DefaultUserPermissions
-from ggrc.services.common import _get_cache_manager
 from ggrc.services.common import Resource
 from ggrc.services.registry import service
 from ggrc.utils import benchmark
 from ggrc_basic_permissions import basic_roles
+from ggrc_basic_permissions import permissions_cache
 from ggrc_basic_permissions.contributed_roles import lookup_role_implications
 from ggrc_basic_permissions.contributed_roles import BasicRoleDeclarations
 from ggrc_basic_permissions.contributed_roles import BasicRoleImplications
@@ -48,8 +48,6 @@ blueprint = Blueprint(
     static_url_path='/static/ggrc_basic_permissions',
 )
 
-PERMISSION_CACHE_TIMEOUT = 3600  # 60 minutes
-
 
 def get_public_config(_):
   """Expose additional permissions-dependent config to client.
@@ -243,37 +241,6 @@ def collect_permissions(src_permissions, context_id, permissions):
             })
 
 
-def query_memcache(key):
-  """Check if cached permissions are available
-
-  Args:
-      key (string): key of the stored permissions
-  Returns:
-      cache (memcache_client): memcache client or None if caching
-                               is not available
-      permissions_cache (dict): dict with all permissions or None if there
-                                was a cache miss
-  """
-  if not getattr(settings, 'MEMCACHE_MECHANISM', False):
-    return None, None
-
-  cache = _get_cache_manager().cache_object.memcache_client
-  cached_keys_set = cache.get('permissions:list') or set()
-  if key not in cached_keys_set:
-    # We set the permissions:list variable so that we are able to batch
-    # remove all permissions related keys from memcache
-    cached_keys_set.add(key)
-    cache.set('permissions:list', cached_keys_set, PERMISSION_CACHE_TIMEOUT)
-    return cache, None
-
-  permissions_cache = cache.get(key)
-  if permissions_cache:
-    # If the key is both in permissions:list and in memcache itself
-    # it is safe to return the cached permissions
-    return cache, permissions_cache
-  return cache, None
-
-
 def load_default_permissions(permissions):
   """Load default permissions for all users
 
@@ -610,28 +577,6 @@ def load_backlog_workflows(permissions):
             .append(wf_context_id)
 
 
-def store_results_into_memcache(permissions, cache, key):
-  """Load personal context for user
-
-  Args:
-      permissions (dict): dict where the permissions will be stored
-      cache (cache_manager): Cache manager that should be used for storing
-                             permissions
-      key (string): key of under which permissions should be stored
-  Returns:
-      None
-  """
-  if cache is None:
-    return
-
-  cached_keys_set = cache.get('permissions:list') or set()
-  if key in cached_keys_set:
-    # We only add the permissions to the cache if the
-    # key still exists in the permissions:list after
-    # the query has executed.
-    cache.set(key, permissions, PERMISSION_CACHE_TIMEOUT)
-
-
 def load_permissions_for(user):
   """Permissions is dictionary that can be exported to json to share with
   clients. Structure is:
@@ -651,12 +596,14 @@ def load_permissions_for(user):
   'terms' are the arguments to the 'condition'.
   """
   permissions = {}
-  key = 'permissions:{}'.format(user.id)
+  cache = permissions_cache.get_memcache_client()
 
-  with benchmark("load_permissions > query memcache"):
-    cache, result = query_memcache(key)
-    if result:
-      return result
+  if cache is not None:
+    with benchmark("load_permissions > query memcache"):
+      result, versions = permissions_cache.get_cached_permissions(
+          cache, user.id)
+      if result:
+        return result
 
   with benchmark("load_permissions > load default permissions"):
     load_default_permissions(permissions)
@@ -715,8 +662,10 @@ def load_permissions_for(user):
       set(permissions["delete"]["Relationship"]["resources"])
   )
 
-  with benchmark("load_permissions > store results into memcache"):
-    store_results_into_memcache(permissions, cache, key)
+  if cache is not None:
+    with benchmark("load_permissions > store results into memcache"):
+      permissions_cache.store_permissions(
+          cache, user.id, permissions, versions)
 
   return permissions
 
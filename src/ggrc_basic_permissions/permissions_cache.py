@@ -0,0 +1,260 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Memcache storage of user permissions with versioned invalidation.
+
+Cached permissions of a user are stored together with the versions of the
+global and the user specific version keys that were current before the
+permissions were loaded from the database. A cached entry is only valid while
+both versions are unchanged.
+
+Flushed objects that permissions depend on are collected in the session and
+after a successful commit only the version keys of the affected users are
+incremented. Changes that can affect any user, such as role definitions or
+context implications, increment the global version key.
+"""
+
+import time
+from logging import getLogger
+
+import sqlalchemy as sa
+from sqlalchemy import and_
+from sqlalchemy import event
+from sqlalchemy import or_
+
+from ggrc import db
+from ggrc import settings
+from ggrc.cache.backends import add_shared_prefix
+from ggrc.models import all_models
+from ggrc.services.common import _get_cache_manager
+from ggrc_basic_permissions.models import ContextImplication
+from ggrc_basic_permissions.models import UserRole
+
+
+logger = getLogger(__name__)  # pylint: disable=invalid-name
+
+PERMISSION_CACHE_TIMEOUT = 3600  # 60 minutes
+
+# Version keys are incremented by other processes, so they are never kept in
+# the local memcache tier.
+GLOBAL_VERSION_KEY = "permissions:version:global"
+add_shared_prefix("permissions:version:")
+
+SESSION_INFO_KEY = "permissions_version_keys"
+
+# Changes of these models can affect permissions of any user.
+GLOBAL_MODELS = {"Role", "ContextImplication"}
+
+
+def get_permissions_key(user_id):
+  return "permissions:{}".format(user_id)
+
+
+def get_user_version_key(user_id):
+  return "permissions:version:user:{}".format(user_id)
+
+
+def get_memcache_client():
+  """Get memcache client or None if caching is not enabled."""
+  if not getattr(settings, "MEMCACHE_MECHANISM", False):
+    return None
+  return _get_cache_manager().cache_object.memcache_client
+
+
+def _initial_version():
+  """Get a version for a missing version key.
+
+  Versions start at the current time, so a version key that was evicted from
+  memcache never gets a version that a stored permissions entry already has.
+  """
+  return int(time.time() * 1000000)
+
+
+def get_versions(cache, keys):
+  """Get current versions of version keys, creating missing keys."""
+  versions = cache.get_multi(keys)
+  missing = {key: _initial_version() for key in keys if key not in versions}
+  if missing:
+    cache.add_multi(missing, PERMISSION_CACHE_TIMEOUT)
+    versions.update(cache.get_multi(missing.keys()))
+  return versions
+
+
+def get_cached_permissions(cache, user_id):
+  """Get cached permissions and the versions to store new permissions with.
+
+  Returns:
+    tuple of cached permissions or None if there was a cache miss, and dict
+    of current versions that must be passed to store_permissions.
+  """
+  keys = [GLOBAL_VERSION_KEY, get_user_version_key(user_id)]
+  versions = get_versions(cache, keys)
+  entry = cache.get(get_permissions_key(user_id))
+  if entry and entry.get("versions") == versions:
+    return entry["permissions"], versions
+  return None, versions
+
+
+def store_permissions(cache, user_id, permissions, versions):
+  """Store permissions loaded after reading the given versions."""
+  cache.set(get_permissions_key(user_id), {
+      "versions": versions,
+      "permissions": permissions,
+  }, PERMISSION_CACHE_TIMEOUT)
+
+
+def increment_versions(keys):
+  """Invalidate cached permissions depending on the given version keys."""
+  cache = get_memcache_client()
+  if cache is None or not keys:
+    return
+  cache.offset_multi({key: 1 for key in keys},
+                     initial_value=_initial_version())
+
+
+def clear_permission_cache():
+  """Invalidate cached permissions of all users."""
+  increment_versions([GLOBAL_VERSION_KEY])
+
+
+def _get_relationship_ends(obj):
+  """Get (type, id) pairs of objects mapped by a relationship."""
+  if isinstance(obj, all_models.RelationshipAttr):
+    obj = all_models.Relationship.query.get(obj.relationship_id)
+    if obj is None:
+      return []
+  return [(obj.source_type, obj.source_id),
+          (obj.destination_type, obj.destination_id)]
+
+
+def _get_context_users(context_ids):
+  """Get ids of users that get permissions in the given contexts.
+
+  Returns:
+    set of person ids, or None if permissions for the contexts are implied
+    for all users.
+  """
+  implications = db.session.query(
+      ContextImplication.source_context_id
+  ).filter(ContextImplication.context_id.in_(context_ids)).all()
+  source_context_ids = set(context_ids)
+  for source_context_id, in implications:
+    if source_context_id is None:
+      return None
+    source_context_ids.add(source_context_id)
+  return {person_id for person_id, in db.session.query(
+      UserRole.person_id
+  ).filter(UserRole.context_id.in_(source_context_ids))}
+
+
+def _get_assignees(ends):
+  """Get ids of people assigned to any of the given objects."""
+  relationship = all_models.Relationship
+  attrs = all_models.RelationshipAttr
+  query = db.session.query(
+      sa.case([(relationship.destination_type == "Person",
+                relationship.destination_id)],
+              else_=relationship.source_id)
+  ).join(
+      attrs, and_(attrs.relationship_id == relationship.id,
+                  attrs.attr_name == "AssigneeType")
+  ).filter(or_(
+      sa.tuple_(relationship.source_type, relationship.source_id).in_(ends),
+      sa.tuple_(relationship.destination_type,
+                relationship.destination_id).in_(ends),
+  ))
+  return {person_id for person_id, in query}
+
+
+def _get_values(obj, attr_name):
+  """Get current and previous values of an attribute of a flushed object."""
+  history = sa.inspect(obj).attrs[attr_name].history
+  return set(history.sum()) | set(history.deleted)
+
+
+def _classify_objects(objects):
+  """Get objects that the permissions of users depend on.
+
+  Returns:
+    tuple of a flag for changes affecting all users, set of user ids, set of
+    context ids and set of (type, id) pairs mapped by relationships.
+  """
+  global_change = False
+  user_ids = set()
+  context_ids = set()
+  relationship_ends = set()
+  for obj in objects:
+    model_name = obj.__class__.__name__
+    if model_name in GLOBAL_MODELS:
+      global_change = True
+    elif model_name in ("UserRole", "ObjectOwner"):
+      user_ids.update(_get_values(obj, "person_id"))
+    elif model_name == "Person":
+      user_ids.add(obj.id)
+    elif model_name == "Context":
+      context_ids.add(obj.id)
+    elif model_name == "Workflow":
+      global_change |= "Backlog" in _get_values(obj, "kind")
+    elif model_name in ("Relationship", "RelationshipAttr"):
+      ends = _get_relationship_ends(obj)
+      if ("Assessment", "Document") == tuple(type_ for type_, _ in ends):
+        global_change = True
+      relationship_ends.update(ends)
+  return global_change, user_ids, context_ids, relationship_ends
+
+
+def get_version_keys(objects):
+  """Get version keys of users whose permissions depend on the objects."""
+  global_change, user_ids, context_ids, relationship_ends = \
+      _classify_objects(objects)
+  if global_change:
+    return {GLOBAL_VERSION_KEY}
+
+  if relationship_ends:
+    user_ids.update(id_ for type_, id_ in relationship_ends
+                    if type_ == "Person")
+    user_ids.update(_get_assignees(list(relationship_ends)))
+    context_ids.update(id_ for id_, in db.session.query(
+        all_models.Context.id
+    ).filter(sa.tuple_(
+        all_models.Context.related_object_type,
+        all_models.Context.related_object_id,
+    ).in_(list(relationship_ends))))
+
+  if context_ids:
+    context_users = _get_context_users(context_ids)
+    if context_users is None:
+      return {GLOBAL_VERSION_KEY}
+    user_ids.update(context_users)
+
+  return {get_user_version_key(user_id) for user_id in user_ids
+          if user_id is not None}
+
+
+@event.listens_for(db.session.__class__, "after_flush")
+def collect_version_keys(session, _):
+  """Collect version keys invalidated by flushed objects."""
+  if get_memcache_client() is None:
+    return
+  objects = list(session.new) + list(session.dirty) + list(session.deleted)
+  if not objects:
+    return
+  with session.no_autoflush:
+    keys = get_version_keys(objects)
+  session.info.setdefault(SESSION_INFO_KEY, set()).update(keys)
+
+
+@event.listens_for(db.session.__class__, "after_commit")
+def invalidate_permissions(session):
+  """Increment version keys collected in the committed transaction."""
+  keys = session.info.pop(SESSION_INFO_KEY, None)
+  if keys:
+    try:
+      increment_versions(keys)
+    except Exception:  # pylint: disable=broad-except
+      logger.exception("Failed to invalidate cached permissions")
+
+
+@event.listens_for(db.session.__class__, "after_rollback")
+def discard_version_keys(session):
+  session.info.pop(SESSION_INFO_KEY, None)
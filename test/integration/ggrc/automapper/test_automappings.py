@@ -3,8 +3,11 @@
 
 import itertools
 
+import mock
+
 import ggrc
 from ggrc import models
+from ggrc.services.common import Resource
 from integration.ggrc import TestCase
 from integration.ggrc import generator
 
@@ -304,3 +307,53 @@ class TestAutomappings(TestCase):
                  (section, regulation),
                  (control, section)],
     )
+
+  def test_bulk_mapping_batch(self):
+    """Relationships posted together are automapped in one batch."""
+    program = self.create_object(models.Program, {
+        'title': make_name('Program')
+    })
+    regulation = self.create_object(models.Regulation, {
+        'title': make_name('Regulation')
+    })
+    sections = [self.create_object(models.Section, {
+        'title': make_name('Section')
+    }) for _ in range(3)]
+    self.create_mapping(program, regulation)
+
+    response = self.api.post(models.Relationship, [{
+        'relationship': {
+            'source': {'id': regulation.id, 'type': regulation.type},
+            'destination': {'id': section.id, 'type': section.type},
+            'context': None,
+        },
+    } for section in sections])
+    self.assert200(response)
+
+    for section in sections:
+      self.assert_mapping(program, section)
+
+  def test_bulk_mapping_skips_none(self):
+    """None entries of a posted collection do not stop automapping."""
+    program = self.create_object(models.Program, {
+        'title': make_name('Program')
+    })
+    regulation = self.create_object(models.Regulation, {
+        'title': make_name('Regulation')
+    })
+    section = self.create_object(models.Section, {
+        'title': make_name('Section')
+    })
+    self.create_mapping(program, regulation)
+    relationship = models.Relationship(source=regulation, destination=section)
+    ggrc.db.session.add(relationship)
+    ggrc.db.session.flush()
+
+    with mock.patch.object(ggrc.automapper.logger, "warning") as warning:
+      Resource.collection_posted.send(
+          models.Relationship, objects=[None, relationship, None],
+          sources=[{}, {}, {}])
+    ggrc.db.session.commit()
+
+    self.assertEqual(warning.call_count, 1)
+    self.assert_mapping(program, section)
@@ -0,0 +1,68 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Benchmark JSON serialization of objects
+
+The script loads up to `limit` objects of each given model and measures the
+serialization cost per object of the /api/<collection> path (publish of every
+object followed by publish_representation) and of the /query "values" path.
+
+Run it against a populated development database:
+
+  python benchmark_publish.py 1000 Control Regulation Assessment
+"""
+
+import sys
+import time
+
+from ggrc.app import app
+from ggrc.builder import json
+from ggrc.models import get_model
+from ggrc.services.query_helper import QueryAPIQueryHelper
+
+REPEAT = 3
+
+
+def time_collection(objects):
+  """Get average publish and publish_representation time per object."""
+  publish_time = representation_time = 0
+  for _ in range(REPEAT):
+    start = time.time()
+    resources = [json.publish(obj, ()) for obj in objects]
+    publish_time += time.time() - start
+    start = time.time()
+    json.publish_representation(resources)
+    representation_time += time.time() - start
+  count = REPEAT * len(objects)
+  return publish_time / count, representation_time / count
+
+
+def time_values(objects):
+  """Get average time per object of serializing /query values."""
+  # pylint: disable=protected-access
+  start = time.time()
+  for _ in range(REPEAT):
+    QueryAPIQueryHelper._transform_to_json(objects)
+  return (time.time() - start) / (REPEAT * len(objects))
+
+
+def main(limit, model_names):
+  """Print serialization costs of the given models."""
+  with app.test_request_context():
+    for model_name in model_names:
+      model = get_model(model_name)
+      objects = model.eager_query().limit(limit).all()
+      if not objects:
+        print "{:<16} no objects".format(model_name)
+        continue
+      publish_time, representation_time = time_collection(objects)
+      values_time = time_values(objects)
+      print ("{:<16} {:>6} objects  collection: publish {:>8.3f}ms "
+             "representation {:>8.3f}ms  values: {:>8.3f}ms").format(
+          model_name, len(objects), publish_time * 1000,
+          representation_time * 1000, values_time * 1000)
+
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+       sys.argv[2:] or ["Control", "Regulation", "Assessment"])
@@ -0,0 +1,58 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Integration tests for resolving stubs in published representations."""
+
+from ggrc import db
+from ggrc.builder.json import LazyStubRepresentation
+from ggrc.builder.json import publish_representation
+from ggrc.models import all_models
+from ggrc.utils import QueryCounter
+from integration.ggrc import TestCase
+from integration.ggrc.models import factories
+
+
+class TestStubResolver(TestCase):
+  """Tests for StubResolver."""
+
+  def setUp(self):
+    super(TestStubResolver, self).setUp()
+    self.market_ids = [factories.MarketFactory().id for _ in range(3)]
+    db.session.commit()
+    db.session.expunge_all()
+
+  def test_single_query(self):
+    """Stubs of all types are resolved with one query."""
+    person_id = factories.PersonFactory().id
+    db.session.expunge_all()
+    resource = {
+        "markets": [LazyStubRepresentation("Market", id_)
+                    for id_ in self.market_ids],
+        "person": LazyStubRepresentation("Person", person_id),
+        "missing": LazyStubRepresentation("Market", max(self.market_ids) + 1),
+    }
+    with QueryCounter() as counter:
+      publish_representation(resource)
+      self.assertEqual(counter.get, 1)
+    self.assertEqual([stub["id"] for stub in resource["markets"]],
+                     self.market_ids)
+    self.assertEqual(resource["markets"][0]["type"], "Market")
+    self.assertEqual(resource["person"]["id"], person_id)
+    self.assertIsNone(resource["missing"])
+
+  def test_loaded_instances(self):
+    """Stubs of loaded instances and resolved stubs need no queries."""
+    market = all_models.Market.query.get(self.market_ids[0])
+    with QueryCounter() as counter:
+      stub = LazyStubRepresentation("Market", market.id)
+      publish_representation([stub])
+      self.assertEqual(counter.get, 0)
+    self.assertEqual(stub["context_id"], market.context_id)
+
+    publish_representation([LazyStubRepresentation("Market",
+                                                   self.market_ids[1])])
+    with QueryCounter() as counter:
+      stub = LazyStubRepresentation("Market", self.market_ids[1])
+      publish_representation([stub])
+      self.assertEqual(counter.get, 0)
+    self.assertEqual(stub["id"], self.market_ids[1])
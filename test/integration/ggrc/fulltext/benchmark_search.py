@@ -0,0 +1,111 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Benchmark full text lookups of MysqlIndexer and MysqlFulltextIndexer
+
+The script fills fulltext_record_properties with generated records up to each
+of the given sizes and measures the time of the filter used by search() and
+counts() for both indexers. Generated records are removed at the end.
+
+Run it against a migrated development database (MySQL 5.6 or newer):
+
+  python benchmark_search.py 100000 1000000
+"""
+
+import random
+import sys
+import time
+
+from sqlalchemy import distinct
+from sqlalchemy import func
+
+from ggrc import db
+from ggrc import settings
+from ggrc.app import app
+from ggrc.fulltext import mysql
+
+Record = mysql.MysqlRecordProperty
+
+RECORD_TYPE = "BenchmarkRecord"
+PROPERTIES = ("title", "description", "notes")
+WORDS_PER_RECORD = 8
+VOCABULARY_SIZE = 20000
+INSERT_CHUNK_SIZE = 5000
+REPEAT = 5
+
+rand = random.Random(42)
+vocabulary = [
+    u"".join(rand.choice(u"abcdefghijklmnopqrstuvwxyz")
+             for _ in range(rand.randint(4, 10)))
+    for _ in range(VOCABULARY_SIZE)
+]
+
+search_terms = [
+    vocabulary[0],
+    vocabulary[1][:3],
+    u" ".join(vocabulary[2:4]),
+    u"no such word",
+]
+
+
+def insert_records(id_from, id_to):
+  """Insert generated records for keys in the given range."""
+  rows = []
+  for key in xrange(id_from, id_to):
+    for prop in PROPERTIES:
+      rows.append({
+          "key": key,
+          "type": RECORD_TYPE,
+          "context_id": None,
+          "tags": "",
+          "property": prop,
+          "subproperty": "",
+          "content": u" ".join(rand.choice(vocabulary)
+                               for _ in range(WORDS_PER_RECORD)),
+      })
+    if len(rows) >= INSERT_CHUNK_SIZE:
+      db.session.execute(Record.__table__.insert(), rows)
+      db.session.commit()
+      rows = []
+  if rows:
+    db.session.execute(Record.__table__.insert(), rows)
+    db.session.commit()
+
+
+def time_lookup(indexer, terms):
+  """Get average time of counting matching objects for terms."""
+  query = db.session.query(func.count(distinct(Record.key))).filter(
+      indexer._get_filter_query(terms))  # pylint: disable=protected-access
+  start = time.time()
+  for _ in range(REPEAT):
+    count = query.scalar()
+  return (time.time() - start) / REPEAT, count
+
+
+def main(sizes):
+  """Run lookups for both indexers at each of the given record counts."""
+  indexers = (
+      ("LIKE", mysql.MysqlIndexer(settings)),
+      ("FULLTEXT", mysql.MysqlFulltextIndexer(settings)),
+  )
+  with app.app_context():
+    db.session.query(Record).filter(Record.type == RECORD_TYPE).delete()
+    db.session.commit()
+    inserted = 0
+    try:
+      for size in sorted(sizes):
+        insert_records(inserted, size)
+        inserted = size
+        print "{} objects, {} records".format(size, size * len(PROPERTIES))
+        for terms in search_terms:
+          for name, indexer in indexers:
+            duration, count = time_lookup(indexer, terms)
+            print "  {:<8} {:<24} {:>8} found {:>9.4f}s".format(
+                name, repr(terms), count, duration)
+    finally:
+      db.session.query(Record).filter(Record.type == RECORD_TYPE).delete()
+      db.session.commit()
+
+
+if __name__ == "__main__":
+  main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000])
@@ -0,0 +1,90 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Integration tests for full and incremental full text reindex."""
+
+import datetime
+
+from ggrc import db
+from ggrc.fulltext import mysql
+from ggrc.fulltext import reindex
+from integration.ggrc import TestCase
+from integration.ggrc.models import factories
+
+Record = mysql.MysqlRecordProperty
+
+
+class TestReindex(TestCase):
+  """Tests for the reindex engine."""
+
+  @staticmethod
+  def _get_title_record(obj):
+    return Record.query.filter(
+        Record.type == obj.type,
+        Record.key == obj.id,
+        Record.property == "title",
+    ).one()
+
+  def test_full_reindex(self):
+    """Full reindex swaps in a table containing all objects."""
+    markets = [factories.MarketFactory() for _ in range(3)]
+    db.session.query(Record).delete()
+    db.session.commit()
+
+    reindex.reindex()
+
+    for market in markets:
+      self.assertEqual(self._get_title_record(market).content, market.title)
+    self.assertIsNotNone(reindex.get_watermark())
+
+  def test_incremental_reindex(self):
+    """Incremental reindex only touches objects modified after watermark."""
+    old_market = factories.MarketFactory(title="old title")
+    new_market = factories.MarketFactory(title="new title")
+    reindex.reindex()
+
+    db.session.query(Record).delete()
+    db.session.commit()
+    reindex.set_watermark(datetime.datetime(2000, 1, 1))
+    old_market = db.session.merge(old_market)
+    old_market.updated_at = datetime.datetime(1999, 1, 1)
+    db.session.commit()
+
+    reindex.reindex(incremental=True)
+
+    self.assertEqual(self._get_title_record(new_market).content, "new title")
+    self.assertEqual(Record.query.filter(
+        Record.type == old_market.type,
+        Record.key == old_market.id,
+    ).count(), 0)
+
+  def test_incremental_reindex_deleted_object(self):
+    """Incremental reindex removes records of deleted objects."""
+    markets = [factories.MarketFactory() for _ in range(2)]
+    reindex.reindex()
+    market_id = markets[0].id
+    table = markets[0].__table__
+    db.session.execute(table.delete().where(table.c.id == market_id))
+    db.session.commit()
+
+    reindex.reindex(incremental=True)
+
+    self.assertEqual(Record.query.filter(
+        Record.type == "Market",
+        Record.key == market_id,
+    ).count(), 0)
+    self.assertEqual(
+        self._get_title_record(markets[1]).content, markets[1].title)
+
+  def test_full_reindex_deleted_snapshot(self):
+    """Full reindex drops copied records of snapshots that do not exist."""
+    db.session.add(Record(key=0, type="Snapshot", property="title",
+                          subproperty="", content="removed snapshot"))
+    db.session.commit()
+
+    reindex.reindex()
+
+    self.assertEqual(Record.query.filter(
+        Record.type == "Snapshot",
+        Record.key == 0,
+    ).count(), 0)
@@ -0,0 +1,63 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Integration tests for batched full text index writes."""
+
+from ggrc import db
+from ggrc.fulltext import get_indexer
+from ggrc.fulltext import mysql
+from ggrc.fulltext.recordbuilder import fts_record_for
+from integration.ggrc import TestCase
+from integration.ggrc.models import factories
+
+Record = mysql.MysqlRecordProperty
+
+
+class TestBatchedIndexer(TestCase):
+  """Tests for create_records, update_records and delete_records."""
+
+  def setUp(self):
+    super(TestBatchedIndexer, self).setUp()
+    self.indexer = get_indexer()
+    self.markets = [factories.MarketFactory() for _ in range(3)]
+    db.session.query(Record).delete()
+    db.session.commit()
+
+  @staticmethod
+  def _count(obj):
+    return Record.query.filter(
+        Record.type == obj.type,
+        Record.key == obj.id,
+    ).count()
+
+  def test_update_records(self):
+    """update_records replaces existing records of all given objects."""
+    self.indexer.create_records(
+        [fts_record_for(market) for market in self.markets])
+    for market in self.markets:
+      market.title = "updated {}".format(market.id)
+    db.session.commit()
+
+    self.indexer.update_records(
+        [fts_record_for(market) for market in self.markets])
+
+    for market in self.markets:
+      title = Record.query.filter(
+          Record.type == market.type,
+          Record.key == market.id,
+          Record.property == "title",
+      ).one()
+      self.assertEqual(title.content, "updated {}".format(market.id))
+
+  def test_delete_records(self):
+    """delete_records removes records of the given objects only."""
+    self.indexer.create_records(
+        [fts_record_for(market) for market in self.markets])
+    kept = self.markets[0]
+
+    self.indexer.delete_records(
+        [(market.type, market.id) for market in self.markets[1:]])
+
+    self.assertNotEqual(self._count(kept), 0)
+    for market in self.markets[1:]:
+      self.assertEqual(self._count(market), 0)
@@ -0,0 +1,69 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Benchmark the HTML cleaner used by sanitized model attributes
+
+The script cleans generated descriptions with the uncached bleach fix point
+loop and with the cached cleaner, and prints the average cost per field for
+plain text, simple rich text and unsafe markup. Each set of values is cleaned
+twice with the cached cleaner, to show the cost of repeated submissions of
+unchanged values.
+
+  python benchmark_html_cleaner.py 1000
+"""
+
+import random
+import sys
+import time
+
+from ggrc.utils import html_cleaner
+
+WORDS = (u"control objective process audit evidence policy review owner "
+         u"quarterly access system vendor risk contract data").split()
+
+rand = random.Random(42)
+
+
+def _sentence():
+  return u" ".join(rand.choice(WORDS) for _ in range(rand.randint(8, 20)))
+
+
+def plain_text():
+  return u"\n".join(_sentence() for _ in range(rand.randint(1, 5)))
+
+
+def rich_text():
+  return u"".join(u"<p>{} <b>{}</b> &amp; {}</p>".format(
+      _sentence(), rand.choice(WORDS), _sentence())
+      for _ in range(rand.randint(1, 5)))
+
+
+def unsafe_text():
+  return u"{}<script>alert('{}')</script><a href='#' onclick='x()'>{}</a>" \
+      .format(rich_text(), rand.choice(WORDS), _sentence())
+
+
+def time_per_field(clean, values):
+  start = time.time()
+  for value in values:
+    clean(value)
+  return (time.time() - start) / len(values)
+
+
+def main(count):
+  """Print per field cleaning times for each kind of description."""
+  # pylint: disable=protected-access
+  for name, generate in (("plain", plain_text),
+                         ("rich", rich_text),
+                         ("unsafe", unsafe_text)):
+    values = [generate() for _ in range(count)]
+    html_cleaner._cache.clear()
+    uncached = time_per_field(html_cleaner._clean, values)
+    first = time_per_field(html_cleaner.clean, values)
+    repeated = time_per_field(html_cleaner.clean, values)
+    print "{:<7} uncached {:>8.1f}us  first {:>8.1f}us  repeated {:>8.1f}us" \
+        .format(name, uncached * 1e6, first * 1e6, repeated * 1e6)
+
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,178 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Benchmark compact revision storage
+
+The script prints the size of the revisions tables and measures loading
+revision contents and reindexing snapshots, then compacts all revisions and
+repeats the measurements. Revisions are expanded back at the end unless
+--keep is given.
+
+Run it against a copy of a populated database:
+
+  python benchmark_revision_storage.py [--keep] [sample size]
+
+With --synthetic, no database is used. Generated revision histories are
+encoded the way compact_revisions stores them, and the script prints stored
+sizes and the cost of decoding contents of full and compact rows.
+
+  python benchmark_revision_storage.py --synthetic [objects]
+"""
+
+import json
+import random
+import sys
+import time
+import zlib
+
+from ggrc import db
+from ggrc.models import revision_storage
+
+REVISIONS_PER_OBJECT = 20
+KEYFRAME_INTERVAL = 20
+
+
+def print_table_sizes():
+  """Print data and index sizes of the revision tables."""
+  for table in ("revisions", "revision_blobs"):
+    db.session.execute("ANALYZE TABLE {}".format(table))
+    data_length, index_length = db.session.execute(
+        "SELECT data_length, index_length FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = :table",
+        {"table": table}).first()
+    print "  {:<16} data {:>8.1f}MB index {:>8.1f}MB".format(
+        table, data_length / 1e6, index_length / 1e6)
+
+
+def measure(revision_ids):
+  """Print table sizes and times of loading contents and reindexing."""
+  print_table_sizes()
+  start = time.time()
+  revision_storage.load_contents(revision_ids)
+  duration = time.time() - start
+  print "  load {} revisions: {:.3f}s ({:.3f}ms per revision)".format(
+      len(revision_ids), duration, duration * 1000 / len(revision_ids))
+  start = time.time()
+  from ggrc.snapshotter import indexer
+  indexer.reindex()
+  db.session.commit()
+  print "  reindex snapshots: {:.3f}s".format(time.time() - start)
+
+
+def make_history(object_id, rand):
+  """Make contents of revisions of a Control with custom attributes."""
+  definitions = [{
+      "id": i,
+      "title": "Custom attribute {}".format(i),
+      "attribute_type": "Text",
+      "helptext": "Help text of custom attribute {} ".format(i) * 3,
+      "mandatory": False,
+      "definition_type": "control",
+  } for i in range(20)]
+  content = {
+      "id": object_id,
+      "type": "Control",
+      "slug": "CONTROL-{}".format(object_id),
+      "title": "Control {}".format(object_id),
+      "description": "Description of the control. " * 20,
+      "status": "Draft",
+      "custom_attribute_definitions": definitions,
+      "custom_attribute_values": [{
+          "custom_attribute_id": i,
+          "attribute_value": "value {}".format(i),
+      } for i in range(20)],
+      "owners": [{"id": 1, "type": "Person"}],
+      "display_name": "Control {}".format(object_id),
+  }
+  history = []
+  for revision in range(REVISIONS_PER_OBJECT):
+    content = dict(content)
+    content["updated_at"] = "2017-03-{:02d}T10:00:00".format(revision + 1)
+    if revision:
+      key = rand.choice(["title", "description", "status"])
+      content[key] = u"{} v{}".format(content[key], revision)
+    history.append(content)
+  return history
+
+
+def synthetic(object_count):
+  """Measure sizes and decoding of generated revision histories."""
+  rand = random.Random(42)
+  full_rows, compact_rows, blobs = [], [], {}
+  for object_id in range(object_count):
+    history = make_history(object_id, rand)
+    full_rows.extend(json.dumps(content) for content in history)
+    for position, content in enumerate(history[:-1]):
+      base = None
+      if position % KEYFRAME_INTERVAL:
+        base = history[position - 1]
+      compact, revision_blobs = revision_storage.encode(
+          content, base, position - 1 if base else None)
+      blobs.update(revision_blobs)
+      compact_rows.append(zlib.compress(json.dumps(compact)))
+    compact_rows.append(None)
+  blob_size = sum(len(zlib.compress(json.dumps(value)))
+                  for value in blobs.itervalues())
+  full_size = sum(len(row) for row in full_rows)
+  compact_size = blob_size + sum(
+      len(row) if row else len(full_rows[i])
+      for i, row in enumerate(compact_rows))
+  print "{} revisions of {} objects".format(len(full_rows), object_count)
+  print "  full    {:>8.1f}MB".format(full_size / 1e6)
+  print "  compact {:>8.1f}MB (blobs {:.3f}MB)".format(
+      compact_size / 1e6, blob_size / 1e6)
+
+  start = time.time()
+  for row in full_rows:
+    json.loads(row)
+  full_time = time.time() - start
+  start = time.time()
+  decoded_blobs = dict(blobs)
+  for offset in range(0, len(compact_rows), REVISIONS_PER_OBJECT):
+    base = None
+    rows = compact_rows[offset:offset + REVISIONS_PER_OBJECT]
+    for position, row in enumerate(rows):
+      if row is None:
+        base = json.loads(full_rows[offset + position])
+      else:
+        base = revision_storage.decode(
+            json.loads(zlib.decompress(row)),
+            None if position % KEYFRAME_INTERVAL == 0 else base,
+            decoded_blobs)
+  compact_time = time.time() - start
+  print "  decode full    {:.3f}ms per revision".format(
+      full_time * 1000 / len(full_rows))
+  print "  decode compact {:.3f}ms per revision".format(
+      compact_time * 1000 / len(full_rows))
+
+
+def main(sample_size, keep):
+  """Measure revision storage before and after compacting."""
+  from ggrc.app import app
+  from ggrc.models import all_models
+  from ggrc.utils import revisions
+  with app.app_context():
+    ids = [id_ for id_, in db.session.query(all_models.Revision.id)]
+    if not ids:
+      print "No revisions"
+      return
+    revision_ids = random.Random(42).sample(ids, min(sample_size, len(ids)))
+    print "Full revisions"
+    measure(revision_ids)
+    start = time.time()
+    count = revisions.compact_revisions()
+    print "Compacted {} revisions in {:.3f}s".format(
+        count, time.time() - start)
+    db.session.execute("OPTIMIZE TABLE revisions")
+    print "Compact revisions"
+    measure(revision_ids)
+    if not keep:
+      revisions.expand_revisions()
+
+
+if __name__ == "__main__":
+  args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+  if "--synthetic" in sys.argv[1:]:
+    synthetic(int(args[0]) if args else 1000)
+  else:
+    main(int(args[0]) if args else 10000, "--keep" in sys.argv[1:])
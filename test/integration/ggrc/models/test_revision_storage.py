@@ -0,0 +1,73 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Tests for compact revision storage."""
+
+import mock
+
+import ggrc.models
+import integration.ggrc.generator
+from ggrc import db
+from ggrc.models import revision_storage
+from ggrc.utils import revisions
+from integration.ggrc import TestCase
+
+
+class TestRevisionStorage(TestCase):
+  """Tests for compacting and expanding revisions."""
+
+  def setUp(self):
+    super(TestRevisionStorage, self).setUp()
+    self.gen = integration.ggrc.generator.ObjectGenerator()
+    cls = ggrc.models.DataAsset
+    name = cls._inflector.table_singular  # pylint: disable=protected-access
+    _, self.obj = self.gen.generate(cls, name, {name: {
+        "title": "revisioned v0",
+        "context": None,
+    }})
+    for version in range(1, 6):
+      _, self.obj = self.gen.modify(self.obj, name, {name: {
+          "slug": self.obj.slug,
+          "title": "revisioned v{}".format(version),
+          "context": None,
+      }})
+
+  def _get_revisions(self):
+    db.session.expunge_all()
+    return ggrc.models.Revision.query.filter_by(
+        resource_type=self.obj.type,
+        resource_id=self.obj.id,
+    ).order_by(ggrc.models.Revision.id).all()
+
+  def test_compact_and_expand(self):
+    """Compacted revisions keep their content."""
+    # pylint: disable=protected-access
+    expected = [rev.content for rev in self._get_revisions()]
+
+    with mock.patch.object(revisions.settings, "REVISION_KEYFRAME_INTERVAL",
+                           3, create=True):
+      self.assertEqual(revisions.compact_revisions(), 5)
+    compacted = self._get_revisions()
+    self.assertEqual([rev.content for rev in compacted], expected)
+    self.assertEqual([rev._content is None for rev in compacted],
+                     [True] * 5 + [False])
+    self.assertEqual(
+        [rev.compact_content["base_id"] for rev in compacted[:5]],
+        [None, compacted[0].id, compacted[1].id,
+         None, compacted[3].id])
+    self.assertEqual(revisions.compact_revisions(), 0)
+
+    self.assertEqual(revisions.expand_revisions(), 5)
+    expanded = self._get_revisions()
+    self.assertEqual([rev._content for rev in expanded], expected)
+
+  def test_collection_contents_loaded_once(self):
+    """Contents of all loaded compacted revisions are expanded together."""
+    expected = [rev.content for rev in self._get_revisions()]
+    revisions.compact_revisions()
+    compacted = self._get_revisions()
+
+    with mock.patch.object(revision_storage, "load_contents",
+                           wraps=revision_storage.load_contents) as load:
+      self.assertEqual([rev.content for rev in compacted], expected)
+    self.assertEqual(load.call_count, 1)
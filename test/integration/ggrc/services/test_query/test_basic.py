@@ -14,6 +14,7 @@ from flask import json
 from ggrc import app
 from ggrc import db
 from ggrc.models import CustomAttributeDefinition as CAD
+from ggrc.utils import QueryCounter
 
 from integration.ggrc import TestCase
 from integration.ggrc.models import factories
@@ -320,6 +321,87 @@ class TestAdvancedQueryAPI(BaseQueryAPITestCase):
     self.assertDictEqual(programs_10_21_str, programs_10_21)
     self.assertDictEqual(programs_10_str_21, programs_10_21)
 
+  def test_query_limit_full_page(self):
+    """The total of a full page is counted in the database."""
+    total = self._get_first_result_set(
+        self._make_query_dict("Program", type_="ids"),
+        "Program", "total",
+    )
+    self.assertGreater(total, 2)
+
+    for type_ in ("ids", "values"):
+      programs = self._get_first_result_set(
+          self._make_query_dict("Program", type_=type_, limit=[1, 3]),
+          "Program",
+      )
+      self.assertEqual(programs["count"], 2)
+      self.assertEqual(programs["total"], total)
+
+  def test_query_cursor(self):
+    """Cursor pages contain all objects in order without duplicates."""
+    def make_query_dict(cursor):
+      """A shortcut for making queries for a page after the cursor."""
+      query = self._make_query_dict("Program",
+                                    order_by=[{"name": "title"}],
+                                    limit=[0, 5])
+      query["cursor"] = cursor
+      return query
+
+    programs_no_limit = self._get_first_result_set(
+        self._make_query_dict("Program", order_by=[{"name": "title"}]),
+        "Program",
+    )
+
+    values = []
+    cursor = None
+    while True:
+      programs = self._get_first_result_set(make_query_dict(cursor),
+                                            "Program")
+      self.assertEqual(programs["total"], programs_no_limit["total"])
+      values.extend(programs["values"])
+      cursor = programs.get("next_cursor")
+      if cursor is None:
+        break
+      self.assertEqual(programs["count"], 5)
+
+    self.assertEqual([program["title"] for program in values],
+                     [program["title"]
+                      for program in programs_no_limit["values"]])
+    self.assertItemsEqual([program["id"] for program in values],
+                          [program["id"]
+                           for program in programs_no_limit["values"]])
+
+    self.assert400(self._post(make_query_dict("invalid")))
+
+  def test_query_count_batched(self):
+    """Count queries match ids queries and run in a single statement."""
+    expressions = [None, ["title", "~", "1"], ["title", "=", "missing"]]
+    ids_queries = [self._make_query_dict("Program", expression, type_="ids")
+                   for expression in expressions]
+    count_queries = [self._make_query_dict("Program", expression,
+                                           type_="count")
+                     for expression in expressions]
+    count_queries.append(self._make_query_dict("Program", type_="count",
+                                               limit=[3, 5]))
+
+    response = self._post(ids_queries)
+    self.assert200(response)
+    expected = [len(result["Program"]["ids"])
+                for result in json.loads(response.data)]
+
+    with QueryCounter() as counter:
+      response = self._post(count_queries)
+      self.assert200(response)
+    counts = [result["Program"]["count"]
+              for result in json.loads(response.data)]
+    totals = [result["Program"]["total"]
+              for result in json.loads(response.data)]
+
+    self.assertEqual(counts, expected + [2])
+    self.assertEqual(totals, expected + [expected[0]])
+    self.assertEqual(len([query for query in counter.queries
+                          if "UNION ALL" in query]), 1)
+
   def test_query_invalid_limit(self):
     """Invalid limit parameters are handled properly."""
 
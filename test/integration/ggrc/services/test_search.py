@@ -78,3 +78,46 @@ class TestResource(TestCase):
     self.assert400(response)
     self.assertEqual(response.json['message'], 'Query parameter "q" '
                      'specifying search terms must be provided.')
+
+  def search_with_counts(self, **params):
+    """Run search with counts and return the results."""
+    params.setdefault("q", "")
+    query = "/search?types=Control&with_counts=true&" + "&".join(
+        "{}={}".format(key, value) for key, value in params.items())
+    response = self.api.tc.get(query)
+    self.assert200(response)
+    return response.json["results"]
+
+  def test_search_with_counts(self):
+    """Test counts and entries are returned together."""
+    results = self.search_with_counts()
+    self.assertEqual(results["counts"], {"Control": 5})
+    self.assertEqual({entry["id"] for entry in results["entries"]["Control"]},
+                     {obj.id for obj in self.objects})
+
+  def test_search_with_counts_limit(self):
+    """Test limit only applies to entries and not to counts."""
+    results = self.search_with_counts(limit=2)
+    self.assertEqual(results["counts"], {"Control": 5})
+    self.assertEqual(len(results["entries"]["Control"]), 2)
+
+  def test_search_with_counts_relevant(self):
+    """Test search with counts for objects relevant to another object."""
+    relevant_objects = "Control:{}".format(self.objects[0].id)
+    results = self.search_with_counts(relevant_objects=relevant_objects)
+    self.assertEqual(results["counts"], {"Control": 2})
+    self.assertEqual({entry["id"] for entry in results["entries"]["Control"]},
+                     {self.objects[i].id for i in [1, 2]})
+
+  def test_search_with_counts_bad_limit(self):
+    """Test search with counts fails for invalid limit."""
+    response = self.api.tc.get(
+        "/search?q=&types=Control&with_counts=true&limit=x")
+    self.assert400(response)
+
+  def test_search_ignores_unused_limit(self):
+    """Test limit is not validated by searches that do not use it."""
+    for mode in ["", "&counts_only=true", "&group_by_type=true"]:
+      response = self.api.tc.get(
+          "/search?q=&types=Control&limit=x" + mode)
+      self.assert200(response)
@@ -0,0 +1,98 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Benchmark latest revision lookup for snapshot generation
+
+The script inserts `objects` x `revisions` Control revisions for object ids
+that do not exist yet and compares loading all their revisions, as snapshot
+generation used to do, with the grouped latest revision query. The inserted
+revisions are deleted at the end.
+
+Run it against a development database:
+
+  python benchmark_latest_revisions.py [objects] [revisions]
+"""
+
+import sys
+import time
+
+from sqlalchemy import func
+from sqlalchemy.sql.expression import tuple_
+
+from ggrc import db
+from ggrc.app import app
+from ggrc.models import all_models
+from ggrc.snapshotter.datastructures import Stub
+from ggrc.snapshotter.helpers import get_latest_revision_ids
+from ggrc.utils import list_chunks
+
+REPEAT = 3
+
+
+def insert_revisions(object_count, revision_count):
+  """Insert revisions for new Control ids and return their stubs."""
+  revisions = all_models.Revision.__table__
+  first_id = (db.session.query(func.max(revisions.c.resource_id)).filter(
+      revisions.c.resource_type == "Control").scalar() or 0) + 1
+  event = all_models.Event(action="BULK", resource_type="Control")
+  db.session.add(event)
+  db.session.flush([event])
+  rows = [{
+      "resource_type": "Control",
+      "resource_id": resource_id,
+      "event_id": event.id,
+      "action": "created" if i == 0 else "modified",
+      "content": {"id": resource_id, "revision": i},
+  } for i in range(revision_count)
+      for resource_id in range(first_id, first_id + object_count)]
+  for rows_chunk in list_chunks(rows, 10000):
+    db.session.execute(revisions.insert(), rows_chunk)
+  db.session.commit()
+  return event, [Stub("Control", resource_id) for resource_id in
+                 range(first_id, first_id + object_count)]
+
+
+def all_revisions(stubs):
+  """Load all revisions of the objects and keep the latest one."""
+  query = db.session.query(
+      all_models.Revision.id,
+      all_models.Revision.resource_type,
+      all_models.Revision.resource_id,
+  ).filter(tuple_(
+      all_models.Revision.resource_type,
+      all_models.Revision.resource_id,
+  ).in_(stubs)).order_by(all_models.Revision.id.desc())
+  result = {}
+  for revid, restype, resid in query:
+    result.setdefault(Stub(restype, resid), revid)
+  return result
+
+
+def measure(name, function, stubs):
+  """Print the average time of function and return its result."""
+  start = time.time()
+  for _ in range(REPEAT):
+    result = function(stubs)
+  print "  {:<24} {:.3f}s".format(name, (time.time() - start) / REPEAT)
+  return result
+
+
+def main(object_count=5000, revision_count=50):
+  """Compare latest revision lookups."""
+  with app.app_context():
+    print "Inserting {} revisions".format(object_count * revision_count)
+    event, stubs = insert_revisions(object_count, revision_count)
+    try:
+      expected = measure("all revisions", all_revisions, stubs)
+      latest = measure("latest revisions", get_latest_revision_ids, stubs)
+      assert latest == expected
+    finally:
+      revisions = all_models.Revision.__table__
+      db.session.execute(revisions.delete().where(
+          revisions.c.event_id == event.id))
+      db.session.delete(event)
+      db.session.commit()
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:3]])
@@ -9,7 +9,9 @@ from ggrc import db
 from ggrc import models
 from ggrc.views import do_reindex
 from ggrc.fulltext.mysql import MysqlRecordProperty as Record
+from ggrc.snapshotter import indexer
 from ggrc.snapshotter.indexer import delete_records
+from ggrc.utils import QueryCounter
 
 from integration.ggrc.snapshotter import SnapshotterBaseTestCase
 from integration.ggrc.models import factories
@@ -339,3 +341,38 @@ class TestSnapshotIndexing(SnapshotterBaseTestCase):
     records = get_records(audit, snapshots)
 
     self.assertEqual(records.count(), 57)
+
+  def test_reindex_loads_people_once(self):
+    """Test that reindexing snapshots loads all people with one query"""
+    self._import_file("snapshotter_create.csv")
+
+    program = db.session.query(models.Program).filter(
+        models.Program.slug == "Prog-13211"
+    ).one()
+    self.create_audit(program)
+    audit = db.session.query(models.Audit).filter(
+        models.Audit.title.like("%Snapshotable audit%")).first()
+    snapshots = db.session.query(models.Snapshot).all()
+    delete_records({s.id for s in snapshots})
+
+    with QueryCounter() as counter:
+      indexer.reindex_snapshots([s.id for s in snapshots])
+
+    people_queries = [query for query in counter.queries
+                      if "FROM people" in query]
+    self.assertLessEqual(len(people_queries), 1)
+    self.assertEqual(get_records(audit, snapshots).count(), 57)
+
+  def test_cad_map_invalidation(self):
+    """Test that cached CAD titles are dropped when a CAD is flushed"""
+    # pylint: disable=protected-access
+    cad_map = indexer._get_cad_map()
+    self.assertIs(indexer._get_cad_map(), cad_map)
+
+    cad = factories.CustomAttributeDefinitionFactory(
+        definition_type="control",
+        title="new control text field",
+    )
+
+    cad_map = indexer._get_cad_map()
+    self.assertEqual(cad_map.get(cad.id), "new control text field")
@@ -5,10 +5,16 @@
 
 import collections
 
+import mock
 import sqlalchemy as sa
 
 from ggrc import db
+from ggrc import snapshotter
+from ggrc import settings
+from ggrc import views
 import ggrc.models as models
+from ggrc.snapshotter.datastructures import Stub
+from ggrc.snapshotter.helpers import get_latest_revision_ids
 from ggrc.snapshotter.rules import Types
 
 from integration.ggrc.models import factories
@@ -790,3 +796,228 @@ class TestSnapshoting(SnapshotterBaseTestCase):
 
     self.assertIsNotNone(models.Relationship.find_related(program, objective))
     self.assertIsNotNone(models.Relationship.find_related(program, control))
+
+  def test_latest_revision_ids(self):
+    """Test latest revision lookup of multiple objects"""
+    controls = [
+        self.create_object(models.Control, {"title": title})
+        for title in ("Test Control Latest 1", "Test Control Latest 2")
+    ]
+    self.api.modify_object(self.refresh_object(controls[0]), {
+        "title": "Test Control Latest 1 EDIT"
+    })
+    stubs = [Stub("Control", control.id) for control in controls]
+    expected = {
+        stub: db.session.query(sa.func.max(models.Revision.id)).filter(
+            models.Revision.resource_type == stub.type,
+            models.Revision.resource_id == stub.id).scalar()
+        for stub in stubs
+    }
+
+    self.assertEqual(get_latest_revision_ids(stubs + [Stub("Control", 0)]),
+                     expected)
+    self.assertEqual(
+        get_latest_revision_ids(
+            stubs, [models.Revision.action == "created"])[stubs[0]],
+        min(rev.id for rev in models.Revision.query.filter_by(
+            resource_type="Control", resource_id=stubs[0].id)))
+
+  def test_snapshot_create_in_chunks(self):
+    """Test snapshot creation split into chunks of pairs"""
+    program = self.create_object(models.Program, {
+        "title": "Test Program Snapshot Chunks"
+    })
+    objective = self.create_object(models.Objective, {
+        "title": "Test Objective Snapshot Chunks"
+    })
+    self.create_mapping(program, objective)
+    for i in range(3):
+      control = self.create_object(models.Control, {
+          "title": "Test Control Snapshot Chunks {}".format(i)
+      })
+      self.create_mapping(program, control)
+      self.create_mapping(control, objective)
+
+    with mock.patch.object(settings, "SNAPSHOT_CHUNK_SIZE", 1, create=True):
+      self.create_audit(program)
+
+    audit = db.session.query(models.Audit).filter(
+        models.Audit.title.like("%Snapshotable audit%")).one()
+    snapshots = db.session.query(models.Snapshot).filter(
+        models.Snapshot.parent_type == "Audit",
+        models.Snapshot.parent_id == audit.id)
+    self.assertEqual(snapshots.count(), 4)
+
+    snapshot_mappings = db.session.query(models.Relationship).filter(
+        models.Relationship.source_type == "Snapshot",
+        models.Relationship.destination_type == "Snapshot",
+        models.Relationship.source_id.in_(
+            [snapshot.id for snapshot in snapshots]))
+    self.assertEqual(snapshot_mappings.count(), 3)
+
+  def test_bulk_upsert_of_program_audits(self):
+    """Test updating snapshots of all program audits at once"""
+    program = self.create_object(models.Program, {
+        "title": "Test Program Snapshot Bulk"
+    })
+    control = self.create_object(models.Control, {
+        "title": "Test Control Snapshot Bulk"
+    })
+    self.create_mapping(program, control)
+    self.create_audit(program, "Snapshotable audit 1")
+    self.create_audit(program, "Snapshotable audit 2")
+
+    control = self.refresh_object(control)
+    self.api.modify_object(control, {
+        "title": "Test Control Snapshot Bulk EDIT"
+    })
+
+    views.do_upsert_snapshots(program_id=program.id)
+
+    snapshots = db.session.query(models.Snapshot).filter(
+        models.Snapshot.child_type == "Control",
+        models.Snapshot.child_id == control.id).all()
+    self.assertEqual(len(snapshots), 2)
+    for snapshot in snapshots:
+      self.assertEqual(snapshot.revision.content["title"],
+                       "Test Control Snapshot Bulk EDIT")
+
+  def test_admin_upsert_requires_selector(self):
+    """Test bulk snapshot update is not run for all audits by default"""
+    response = self.api.tc.post("/admin/upsert_snapshots")
+    self.assert400(response)
+
+  def test_clone_scopes_of_many_audits(self):
+    """Test cloning scopes of many base and new audit pairs at once"""
+    program = self.create_object(models.Program, {
+        "title": "Test Program Snapshot Clone"
+    })
+    objective = self.create_object(models.Objective, {
+        "title": "Test Objective Snapshot Clone"
+    })
+    control = self.create_object(models.Control, {
+        "title": "Test Control Snapshot Clone"
+    })
+    self.create_mapping(program, objective)
+    self.create_mapping(program, control)
+    self.create_mapping(control, objective)
+    self.create_audit(program, "Snapshotable audit 1")
+    self.api.modify_object(self.refresh_object(control), {
+        "title": "Test Control Snapshot Clone EDIT"
+    })
+    self.create_audit(program, "Snapshotable audit 2")
+    base_audits = [
+        db.session.query(models.Audit).filter_by(title=title).one()
+        for title in ("Snapshotable audit 1", "Snapshotable audit 2")]
+    new_audits = [factories.AuditFactory(program=base_audits[0].program)
+                  for _ in range(3)]
+    pairs = zip(base_audits + base_audits[:1], new_audits)
+
+    event = models.Event(action="BULK", resource_type="Audit")
+    db.session.add(event)
+    db.session.flush([event])
+    snapshotter.clone_scopes(pairs, event)
+    db.session.commit()
+
+    def get_snapshots(audit):
+      return db.session.query(models.Snapshot).filter(
+          models.Snapshot.parent_type == "Audit",
+          models.Snapshot.parent_id == audit.id).all()
+
+    for base_audit, new_audit in pairs:
+      base_snapshots = get_snapshots(base_audit)
+      new_snapshots = get_snapshots(new_audit)
+      self.assertEqual(len(base_snapshots), 2)
+      self.assertEqual(
+          {(s.child_type, s.child_id, s.revision_id) for s in new_snapshots},
+          {(s.child_type, s.child_id, s.revision_id) for s in base_snapshots})
+      snapshot_ids = [snapshot.id for snapshot in new_snapshots]
+      snapshot_mappings = db.session.query(models.Relationship).filter(
+          models.Relationship.source_type == "Snapshot",
+          models.Relationship.destination_type == "Snapshot",
+          models.Relationship.source_id.in_(snapshot_ids),
+          models.Relationship.destination_id.in_(snapshot_ids))
+      self.assertEqual(snapshot_mappings.count(), 1)
+
+  def _run_snapshot_task(self):
+    """Run the latest scheduled snapshot task and return it."""
+    task = models.BackgroundTask.query.filter(
+        models.BackgroundTask.name.like("snapshots%")
+    ).order_by(models.BackgroundTask.id.desc()).first()
+    report_progress = models.BackgroundTask.report_progress
+    with mock.patch.object(models.BackgroundTask, "report_progress",
+                           autospec=True,
+                           side_effect=report_progress) as progress:
+      views.run_snapshots(task)
+    self.assertTrue(progress.called)
+    return self.refresh_object(task)
+
+  def test_snapshots_in_background(self):
+    """Test snapshots of large scopes are made by a background task"""
+    program = self.create_object(models.Program, {
+        "title": "Test Program Snapshot Background"
+    })
+    control = self.create_object(models.Control, {
+        "title": "Test Control Snapshot Background"
+    })
+    objective = self.create_object(models.Objective, {
+        "title": "Test Objective Snapshot Background"
+    })
+    self.create_mapping(program, control)
+    self.create_mapping(program, objective)
+    control = self.refresh_object(control)
+    self.api.modify_object(control, {
+        "title": "Test Control Snapshot Background EDIT"
+    })
+    revision_id = db.session.query(sa.func.min(models.Revision.id)).filter(
+        models.Revision.resource_type == "Control",
+        models.Revision.resource_id == control.id).scalar()
+
+    threshold = mock.patch.object(settings, "SNAPSHOT_BACKGROUND_THRESHOLD",
+                                  1, create=True)
+    task_queue = mock.patch("ggrc.snapshotter.use_task_queue",
+                            return_value=True)
+    with threshold, task_queue:
+      self.create_audit(program)
+      audit = db.session.query(models.Audit).filter(
+          models.Audit.title.like("%Snapshotable audit%")).one()
+      snapshots = db.session.query(models.Snapshot).filter(
+          models.Snapshot.parent_type == "Audit",
+          models.Snapshot.parent_id == audit.id)
+      self.assertEqual(snapshots.count(), 0)
+
+      task = self._run_snapshot_task()
+      self.assertEqual(task.parameters["families"], [{
+          "parent": {"type": "Audit", "id": audit.id},
+          "children": mock.ANY,
+      }])
+      self.assertEqual(
+          {(child["type"], child["id"])
+           for child in task.parameters["families"][0]["children"]},
+          {("Control", control.id), ("Objective", objective.id)})
+      self.assertEqual(task.status, "Success")
+      self.assertEqual(task.result["status_code"], 200)
+      self.assertEqual({(s.child_type, s.child_id) for s in snapshots},
+                       {("Control", control.id), ("Objective", objective.id)})
+
+      self.api.modify_object(self.refresh_object(audit), {
+          "snapshots": {
+              "operation": "upsert",
+              "revisions": [{
+                  "parent": self.objgen.create_stub(audit),
+                  "child": self.objgen.create_stub(control),
+                  "revision_id": revision_id,
+              }]
+          }
+      })
+      task = self._run_snapshot_task()
+      self.assertEqual(task.parameters["revisions"], [{
+          "parent": {"type": "Audit", "id": audit.id},
+          "child": {"type": "Control", "id": control.id},
+          "revision_id": revision_id,
+      }])
+      self.assertEqual(task.status, "Success")
+
+    control_snapshot = snapshots.filter(
+        models.Snapshot.child_type == "Control").one()
+    self.assertEqual(control_snapshot.revision_id, revision_id)
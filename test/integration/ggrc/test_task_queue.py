@@ -0,0 +1,70 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Tests for the database backed background task queue."""
+
+import mock
+
+from ggrc import db
+from ggrc import task_queue
+from ggrc.app import app
+from ggrc.models import all_models
+from integration.ggrc import TestCase
+
+queue = task_queue.task_queue
+
+
+class TestTaskQueue(TestCase):
+  """Tests for leasing, running and retrying queued tasks."""
+
+  @staticmethod
+  def _enqueue(name, url="/_background_tasks/compact_revisions"):
+    task = all_models.BackgroundTask(name=name, parameters={})
+    db.session.add(task)
+    db.session.commit()
+    task_queue.enqueue(task, name, url, "POST", {"X-Requested-By": "GGRC"})
+    return db.session.query(queue.c.id).filter(
+        queue.c.background_task_id == task.id).scalar(), task.id
+
+  def test_concurrency_limit(self):
+    """Tasks with a concurrency limit are not leased concurrently."""
+    reindex_ids = [self._enqueue("reindex")[0] for _ in range(2)]
+    other_id, _ = self._enqueue("other")
+
+    claimed, exhausted = task_queue.claim_tasks(5, "worker")
+
+    self.assertEqual(claimed, [reindex_ids[0], other_id])
+    self.assertEqual(exhausted, [])
+    self.assertEqual(task_queue.claim_tasks(5, "worker"), ([], []))
+
+  def test_run_task(self):
+    """Leased tasks run their request and leave the queue on success."""
+    queue_id, task_id = self._enqueue("compact_revisions")
+    task_queue.claim_tasks(1, "worker")
+
+    response = task_queue.run_task(app, queue_id)
+    task_queue.finish_task(queue_id, 0)
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(
+        all_models.BackgroundTask.query.get(task_id).status, "Success")
+    self.assertEqual(db.session.query(queue).count(), 0)
+
+  def test_retry(self):
+    """Tasks that stop without a result are retried until out of attempts."""
+    queue_id, task_id = self._enqueue("compact_revisions")
+    with mock.patch.object(task_queue, "RETRY_DELAY", 0):
+      for _ in range(2):
+        self.assertEqual(task_queue.claim_tasks(1, "worker")[0], [queue_id])
+        task_queue.finish_task(queue_id, 1)
+        task = all_models.BackgroundTask.query.get(task_id)
+        self.assertEqual(task.status, "Pending")
+        self.assertEqual(task.result["status_code"], 202)
+
+      self.assertEqual(task_queue.claim_tasks(1, "worker")[0], [queue_id])
+      task_queue.finish_task(queue_id, 1)
+
+    db.session.expire_all()
+    task = all_models.BackgroundTask.query.get(task_id)
+    self.assertEqual(task.status, "Failure")
+    self.assertEqual(db.session.query(queue).count(), 0)
@@ -0,0 +1,102 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Tests for versioned invalidation of cached permissions."""
+
+import mock
+
+from ggrc import db
+from ggrc_basic_permissions import permissions_cache
+from ggrc_basic_permissions.models import Role
+from integration.ggrc import TestCase
+from integration.ggrc.models import factories
+
+
+class FakeMemcache(object):
+  """Dict based replacement for the memcache client."""
+
+  def __init__(self):
+    self.data = {}
+
+  def get(self, key):
+    return self.data.get(key)
+
+  def set(self, key, value, _=0):
+    self.data[key] = value
+
+  def get_multi(self, keys):
+    return {key: self.data[key] for key in keys if key in self.data}
+
+  def add_multi(self, mapping, _=0):
+    for key, value in mapping.items():
+      self.data.setdefault(key, value)
+
+  def offset_multi(self, mapping, initial_value=0):
+    for key, delta in mapping.items():
+      self.data[key] = self.data.get(key, initial_value) + delta
+
+
+class TestPermissionsCache(TestCase):
+  """Tests for storing and invalidating cached permissions."""
+
+  def setUp(self):
+    super(TestPermissionsCache, self).setUp()
+    self.cache = FakeMemcache()
+    patcher = mock.patch.object(permissions_cache, "get_memcache_client",
+                                return_value=self.cache)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_cached_permissions(self):
+    """Cached permissions are valid until a version is incremented."""
+    result, versions = permissions_cache.get_cached_permissions(self.cache, 1)
+    self.assertIsNone(result)
+    permissions_cache.store_permissions(self.cache, 1, {"read": {}}, versions)
+
+    result, _ = permissions_cache.get_cached_permissions(self.cache, 1)
+    self.assertEqual(result, {"read": {}})
+
+    permissions_cache.increment_versions(
+        [permissions_cache.get_user_version_key(2)])
+    result, _ = permissions_cache.get_cached_permissions(self.cache, 1)
+    self.assertEqual(result, {"read": {}})
+
+    permissions_cache.increment_versions(
+        [permissions_cache.get_user_version_key(1)])
+    result, _ = permissions_cache.get_cached_permissions(self.cache, 1)
+    self.assertIsNone(result)
+
+  def test_clear_permission_cache(self):
+    """Clearing the cache invalidates permissions of all users."""
+    _, versions = permissions_cache.get_cached_permissions(self.cache, 1)
+    permissions_cache.store_permissions(self.cache, 1, {}, versions)
+    permissions_cache.clear_permission_cache()
+    result, _ = permissions_cache.get_cached_permissions(self.cache, 1)
+    self.assertIsNone(result)
+
+  def test_person_relationship(self):
+    """Mapping a person invalidates only that person's permissions."""
+    person = factories.PersonFactory()
+    market = factories.MarketFactory()
+    relationship = factories.RelationshipFactory(source=market,
+                                                 destination=person)
+    self.assertEqual(
+        permissions_cache.get_version_keys([relationship]),
+        {permissions_cache.get_user_version_key(person.id)})
+
+  def test_role_change(self):
+    """Changing a role invalidates permissions of all users."""
+    role = Role(name="Test role", permissions_json="{}")
+    db.session.add(role)
+    db.session.flush()
+    self.assertEqual(permissions_cache.get_version_keys([role]),
+                     {permissions_cache.GLOBAL_VERSION_KEY})
+
+  def test_commit_increments_versions(self):
+    """Committed changes increment version keys of affected users."""
+    person = factories.PersonFactory()
+    key = permissions_cache.get_user_version_key(person.id)
+    version = self.cache.get(key)
+    person.name = "new name"
+    db.session.commit()
+    self.assertNotEqual(self.cache.get(key), version)
@@ -0,0 +1,64 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for compiled publish plans of the JSON builder."""
+
+import unittest
+
+import flask
+
+from ggrc.builder.json import Builder
+from ggrc.builder.json import LazyStubRepresentation
+
+
+class Model(object):
+  """Plain model with attributes of different kinds."""
+  # pylint: disable=too-few-public-methods
+
+  _publish_attrs = ["title", "loud_title", "owner"]
+  title = None
+  loud_title = None
+  _custom_publish = {
+      "loud_title": lambda obj: obj.title.upper(),
+  }
+
+  def __init__(self, title, owner_id=None):
+    self.title = title
+    self.owner_id = owner_id
+    self.owner_type = "Person"
+
+  @property
+  def owner(self):
+    return None
+
+
+class TestPublishPlan(unittest.TestCase):
+  """Tests for Builder publish plans."""
+
+  def setUp(self):
+    self.builder = Builder(Model)
+    self.app_context = flask.Flask(__name__).app_context()
+    self.app_context.push()
+
+  def tearDown(self):
+    self.app_context.pop()
+
+  def test_publish_attrs(self):
+    """Attributes of all kinds are published through the plan."""
+    json_obj = self.builder.publish_contribution(Model("title", 3), (), None)
+    self.assertEqual(json_obj["title"], "title")
+    self.assertEqual(json_obj["loud_title"], "TITLE")
+    self.assertIsInstance(json_obj["owner"], LazyStubRepresentation)
+    self.assertEqual((json_obj["owner"].type, json_obj["owner"].id),
+                     ("Person", 3))
+    self.assertIsNone(
+        self.builder.publish_contribution(Model("title"), (), None)["owner"])
+
+  def test_plan_reuse(self):
+    """Plans are compiled once per class and inclusions."""
+    for title in ("a", "b"):
+      self.builder.publish_contribution(Model(title), (), None)
+      self.builder.publish_contribution(Model(title), [("owner",)], None)
+    # pylint: disable=protected-access
+    self.assertEqual(len(self.builder._publish_plans), 2)
+    self.assertEqual(len(self.builder._attr_publishers), 3)
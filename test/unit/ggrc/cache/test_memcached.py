@@ -0,0 +1,270 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Tests for the memcached client and the process local cache tier."""
+
+import SocketServer
+import threading
+import unittest
+
+import mock
+
+from ggrc.cache import backends
+from ggrc.cache import memcached
+from ggrc.utils.structures import LRUCache
+
+
+# Quiet commands that only respond on errors, quiet GETs respond on hits.
+QUIET_OPCODES = {memcached.OP_SETQ, memcached.OP_ADDQ, memcached.OP_DELETEQ}
+
+
+class StandInHandler(SocketServer.BaseRequestHandler):
+  """Binary protocol handler for the subset of commands used by the client.
+  """
+
+  def _respond(self, opaque, opcode, status=memcached.STATUS_OK, extras="",
+               key="", value="", cas=0):
+    self.request.sendall("".join((
+        memcached.HEADER.pack(memcached.RESPONSE_MAGIC, opcode, len(key),
+                              len(extras), 0, status,
+                              len(extras) + len(key) + len(value), opaque,
+                              cas),
+        extras, key, value,
+    )))
+
+  def _read(self, size):
+    data = ""
+    while len(data) < size:
+      chunk = self.request.recv(size - len(data))
+      if not chunk:
+        raise EOFError()
+      data += chunk
+    return data
+
+  def handle(self):
+    try:
+      while True:
+        self._handle_request()
+    except EOFError:
+      pass
+
+  def _handle_request(self):
+    (_, opcode, key_length, extras_length, _, _, body_length, opaque,
+     cas) = memcached.HEADER.unpack(self._read(memcached.HEADER.size))
+    body = self._read(body_length)
+    extras = body[:extras_length]
+    key = body[extras_length:extras_length + key_length]
+    value = body[extras_length + key_length:]
+    with self.server.lock:
+      self.server.requests.append(opcode)
+      if opcode == memcached.OP_GETKQ:
+        status, response = self._get(key)
+      elif opcode in (memcached.OP_SETQ, memcached.OP_ADDQ):
+        status, response = self._store(opcode, key, extras, value, cas)
+      elif opcode in (memcached.OP_DELETE, memcached.OP_DELETEQ):
+        status, response = self._delete(key)
+      elif opcode in (memcached.OP_INCREMENT, memcached.OP_DECREMENT):
+        status, response = self._offset(opcode, key, extras)
+      else:
+        if opcode == memcached.OP_FLUSH:
+          self.server.store.clear()
+        status, response = memcached.STATUS_OK, {}
+    if status is None or (opcode in QUIET_OPCODES and
+                          status == memcached.STATUS_OK):
+      return
+    self._respond(opaque, opcode, status, **response)
+
+  def _get(self, key):
+    if key not in self.server.store:
+      return None, {}
+    flags, value, cas = self.server.store[key]
+    return memcached.STATUS_OK, {"extras": memcached.FLAGS.pack(flags),
+                                 "key": key, "value": value, "cas": cas}
+
+  def _store(self, opcode, key, extras, value, cas):
+    # pylint: disable=too-many-arguments
+    store = self.server.store
+    flags, _ = memcached.STORE_EXTRAS.unpack(extras)
+    if opcode == memcached.OP_ADDQ and key in store:
+      return 0x02, {}
+    if cas and key not in store:
+      return memcached.STATUS_KEY_NOT_FOUND, {}
+    if cas and store[key][2] != cas:
+      return 0x02, {}
+    self.server.cas += 1
+    store[key] = (flags, value, self.server.cas)
+    return memcached.STATUS_OK, {}
+
+  def _delete(self, key):
+    if self.server.store.pop(key, None) is None:
+      return memcached.STATUS_KEY_NOT_FOUND, {}
+    return memcached.STATUS_OK, {}
+
+  def _offset(self, opcode, key, extras):
+    store = self.server.store
+    delta, initial, expiration = memcached.COUNTER_EXTRAS.unpack(extras)
+    if key in store:
+      flags, value, cas = store[key]
+      if opcode == memcached.OP_INCREMENT:
+        value = int(value) + delta
+      else:
+        value = max(int(value) - delta, 0)
+    elif expiration == memcached.NO_INITIAL_VALUE:
+      return memcached.STATUS_KEY_NOT_FOUND, {}
+    else:
+      flags, value, cas = 0, initial, 0
+    store[key] = (flags, str(value), cas)
+    return memcached.STATUS_OK, {"value": memcached.COUNTER.pack(value)}
+
+
+class StandInServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+  """In memory server that speaks the memcached binary protocol."""
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self):
+    SocketServer.TCPServer.__init__(self, ("127.0.0.1", 0), StandInHandler)
+    self.store = {}
+    self.cas = 0
+    self.requests = []
+    self.lock = threading.Lock()
+
+  @property
+  def address(self):
+    return "{}:{}".format(*self.server_address)
+
+
+class TestMemcachedClient(unittest.TestCase):
+  """Tests for the memcached client API."""
+
+  def setUp(self):
+    self.server = StandInServer()
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    self.client = memcached.Client([self.server.address])
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    memcached._pools.clear()  # pylint: disable=protected-access
+
+  def test_multi(self):
+    """Multi key operations need one round trip for all keys."""
+    values = {"key{}".format(i): {"id": i} for i in range(250)}
+    self.assertEqual(self.client.add_multi(values), [])
+    self.assertEqual(self.client.add_multi({"key1": 1, "new": u"\u043a"}),
+                     ["key1"])
+    self.assertEqual(self.server.requests.count(memcached.OP_NOOP), 4)
+
+    result = self.client.get_multi(values.keys() + ["missing", "new"])
+
+    self.assertEqual(len(result), 251)
+    self.assertEqual(result["key5"], {"id": 5})
+    self.assertEqual(result["new"], u"\u043a")
+    self.assertNotIn("missing", result)
+    self.assertTrue(self.client.delete_multi(["key1", "missing"]))
+    self.assertIsNone(self.client.get("key1"))
+
+  def test_values(self):
+    """Strings, integers, long keys and prefixes are supported."""
+    long_key = "k" * 300
+    self.assertTrue(self.client.set(long_key, "value"))
+    self.assertTrue(self.client.set("number", 42))
+    self.assertEqual(self.client.set_multi({"a": 1}, key_prefix="p:"), [])
+    self.assertEqual(self.client.get(long_key), "value")
+    self.assertEqual(self.client.get("number"), 42)
+    self.assertEqual(self.client.get_multi(["a"], key_prefix="p:"), {"a": 1})
+    self.assertEqual(self.client.delete("number"),
+                     memcached.DELETE_SUCCESSFUL)
+    self.assertEqual(self.client.delete("number"),
+                     memcached.DELETE_ITEM_MISSING)
+
+  def test_cas(self):
+    """cas only succeeds for values that were not changed since gets."""
+    self.client.set("key", 1)
+    self.assertEqual(self.client.gets("key"), 1)
+    self.client.set("key", 2)
+    self.assertFalse(self.client.cas("key", 3))
+    self.assertEqual(self.client.gets("key"), 2)
+    self.assertTrue(self.client.cas("key", 3))
+    self.assertEqual(self.client.get("key"), 3)
+    self.assertEqual(self.client.cas_multi({"unread": 1}), ["unread"])
+
+  def test_offset_multi(self):
+    """Counters are created with initial values and incremented."""
+    self.client.add("a", 5)
+    self.assertEqual(
+        self.client.offset_multi({"a": 1, "b": 1, "c": -1},
+                                 initial_value=10),
+        {"a": 6, "b": 11, "c": 9},
+    )
+    self.assertEqual(self.client.offset_multi({"missing": 1}),
+                     {"missing": None})
+    self.assertEqual(self.client.get("a"), 6)
+    self.assertTrue(self.client.flush_all())
+    self.assertIsNone(self.client.get("a"))
+
+  def test_network_failure(self):
+    """Unavailable servers are reported as misses and failed writes."""
+    self.server.shutdown()
+    self.server.server_close()
+    memcached._pools.clear()  # pylint: disable=protected-access
+    client = memcached.Client([self.server.address])
+
+    self.assertEqual(client.get_multi(["a"]), {})
+    self.assertEqual(client.add_multi({"a": 1}), ["a"])
+    self.assertFalse(client.delete_multi(["a"]))
+    self.assertEqual(client.delete("a"), memcached.DELETE_NETWORK_FAILURE)
+
+
+class TestTieredClient(unittest.TestCase):
+  """Tests for the process local cache tier."""
+
+  def setUp(self):
+    self.shared = mock.Mock()
+    self.shared.get_multi.return_value = {"a": {"id": 1}}
+    self.shared.add_multi.return_value = ["b"]
+    self.client = backends.TieredClient(self.shared, LRUCache(10), 5)
+
+  def test_local_hits(self):
+    """Local values are used until they expire."""
+    with mock.patch.object(backends.time, "time", return_value=100):
+      self.assertEqual(self.client.get_multi(["a"]), {"a": {"id": 1}})
+      self.client.get("a")["id"] = 2
+      self.assertEqual(self.client.get("a"), {"id": 1})
+    self.assertEqual(self.shared.get_multi.call_count, 1)
+
+    with mock.patch.object(backends.time, "time", return_value=106):
+      self.client.get("a")
+    self.assertEqual(self.shared.get_multi.call_count, 2)
+
+  def test_writes(self):
+    """Writes update local values and invalidate failed keys."""
+    self.assertEqual(self.client.add_multi({"a": 1, "b": 2}), ["b"])
+    self.shared.get_multi.return_value = {}
+    self.assertEqual(self.client.get_multi(["a", "b"]), {"a": 1})
+
+    self.client.offset_multi({"a": 1})
+    self.assertEqual(self.client.get_multi(["a"]), {})
+
+  def test_shared_keys(self):
+    """Keys with a shared prefix are not kept locally."""
+    self.shared.get_multi.return_value = {"version:a": 1}
+    with mock.patch.object(backends, "_shared_prefixes", {"version:"}):
+      self.client.add_multi({"version:a": 1})
+      self.client.get_multi(["version:a"])
+      self.client.get_multi(["version:a"])
+    self.assertEqual(self.shared.get_multi.call_count, 2)
+    self.assertEqual(len(self.client.cache), 0)
+
+  def test_get_client(self):
+    """The local tier is added when it is enabled."""
+    with mock.patch.multiple(backends.settings, create=True,
+                             MEMCACHE_BACKEND="memcached",
+                             MEMCACHE_SERVERS=["127.0.0.1:1"],
+                             MEMCACHE_LOCAL_SIZE=10):
+      client = backends.get_client()
+    self.assertIsInstance(client, backends.TieredClient)
+    self.assertIsInstance(client.client, memcached.Client)
@@ -0,0 +1,103 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Tests for the versioned metadata cache."""
+
+import unittest
+
+import flask
+import mock
+
+from ggrc.cache import metadata
+
+
+class TestMetadataCache(unittest.TestCase):
+  """Tests for cached metadata values and their invalidation."""
+
+  def setUp(self):
+    self.app = flask.Flask(__name__)
+    self.session = mock.Mock(info={})
+    self.shared = {}
+    client = mock.Mock()
+    client.get_multi.side_effect = lambda keys: {
+        key: self.shared[key] for key in keys if key in self.shared}
+    client.add_multi.side_effect = self._add_multi
+    client.offset_multi.side_effect = self._offset_multi
+    patches = [
+        mock.patch.object(metadata, "db", mock.Mock(session=self.session)),
+        mock.patch.object(metadata, "get_client", return_value=client),
+        mock.patch.object(metadata.settings, "MEMCACHE_MECHANISM", True,
+                          create=True),
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+    metadata.clear()
+    metadata.reset_stats()
+
+  def _add_multi(self, mapping):
+    for key, value in mapping.iteritems():
+      self.shared.setdefault(key, value)
+    return []
+
+  def _offset_multi(self, mapping, initial_value=None):
+    for key, delta in mapping.iteritems():
+      self.shared[key] = self.shared.get(key, initial_value) + delta
+
+  def _get(self, value):
+    with self.app.app_context():
+      return metadata.get("definitions", "Control", ("custom_attributes",),
+                          lambda: {"value": value})
+
+  def _commit(self, obj):
+    self.session.new = [obj]
+    self.session.dirty = self.session.deleted = []
+    # pylint: disable=protected-access
+    metadata._collect_regions(self.session, None)
+    pending = metadata._has_pending_changes(("custom_attributes",))
+    with self.app.app_context():
+      metadata._after_commit(self.session)
+    return pending
+
+  def test_hits(self):
+    """Values are reused across requests and returned as copies."""
+    self._get(1)["value"] = 5
+    self.assertEqual(self._get(2), {"value": 1})
+    self.assertEqual(metadata.get_stats(),
+                     {"definitions": {"hits": 1, "misses": 1}})
+
+  def test_invalidation(self):
+    """Commits of metadata models invalidate dependent values."""
+    # pylint: disable=invalid-name
+    CustomAttributeDefinition = type("CustomAttributeDefinition", (), {})
+    Control = type("Control", (), {})
+    self._get(1)
+
+    self.assertFalse(self._commit(Control()))
+    self.assertEqual(self._get(2), {"value": 1})
+
+    self.assertTrue(self._commit(CustomAttributeDefinition()))
+    self.assertEqual(self._get(3), {"value": 3})
+
+  def test_without_memcache(self):
+    """Values are reused only within a request without shared versions."""
+    with mock.patch.object(metadata.settings, "MEMCACHE_MECHANISM", False):
+      with self.app.app_context():
+        self.assertEqual(
+            metadata.get("a", None, ("roles",), lambda: 1), 1)
+        self.assertEqual(
+            metadata.get("a", None, ("roles",), lambda: 2), 1)
+      with self.app.app_context():
+        self.assertEqual(
+            metadata.get("a", None, ("roles",), lambda: 3), 3)
+
+  def test_request_values(self):
+    """Request values are computed once and dropped on commit."""
+    with self.app.app_context():
+      compute = mock.Mock(return_value=({1}, []))
+      metadata.get_for_request("context_resource", ("Control",), compute)
+      metadata.get_for_request("context_resource", ("Control",), compute)
+      self.assertEqual(compute.call_count, 1)
+      metadata._after_commit(self.session)  # pylint: disable=protected-access
+      metadata.get_for_request("context_resource", ("Control",), compute)
+      self.assertEqual(compute.call_count, 2)
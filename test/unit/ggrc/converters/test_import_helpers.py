@@ -113,6 +113,22 @@ class TestSplitArry(unittest.TestCase):
     self.assertEqual(offests[2], 9)
 
 
+class TestGenerateCsvChunks(unittest.TestCase):
+  """Tests for the chunked csv string generator."""
+
+  def test_chunks_match_full_csv(self):
+    """Test that joined csv chunks are the same as the full csv string."""
+    chunks = [
+        [[u"Object type", u"Code"], [u"Control", u"Title"]],
+        [[u"", u"CONTROL-1", u"\u010dfoo"], [u"", u"CONTROL-2"]],
+        [[u""], [u""]],
+    ]
+    full_data = [list(line) for chunk in chunks for line in chunk]
+    csv_string = import_helper.generate_csv_string(full_data)
+    csv_chunks = import_helper.generate_csv_chunks(iter(chunks), 3)
+    self.assertEqual("".join(csv_chunks), csv_string)
+
+
 class TestColumnOrder(unittest.TestCase):
 
   """Tests for colum order function.
@@ -0,0 +1,37 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for the MySQL FULLTEXT indexer."""
+
+import unittest
+
+from ggrc.fulltext.mysql import MysqlFulltextIndexer
+
+
+class Settings(object):
+  FULLTEXT_MIN_TOKEN_SIZE = 3
+
+
+class TestGetMatchTerms(unittest.TestCase):
+  """Tests for building MATCH ... AGAINST search strings."""
+
+  def setUp(self):
+    self.indexer = MysqlFulltextIndexer(Settings())
+
+  def test_prefix_words(self):
+    """All words are required and matched as prefixes."""
+    self.assertEqual(self.indexer.get_match_terms(u"Access Contr"),
+                     u"+access* +contr*")
+
+  def test_operators_removed(self):
+    """Boolean mode operators in terms are not passed to MATCH."""
+    self.assertEqual(self.indexer.get_match_terms(u'+"ctrl-123" (x)*'),
+                     u"+ctrl* +123*")
+
+  def test_unindexed_words_skipped(self):
+    """Short words, stopwords and duplicates are skipped."""
+    self.assertEqual(self.indexer.get_match_terms(u"of the ab data data"),
+                     u"+data*")
+    self.assertIsNone(self.indexer.get_match_terms(u"of ab"))
+    self.assertIsNone(self.indexer.get_match_terms(u""))
+    self.assertIsNone(self.indexer.get_match_terms(None))
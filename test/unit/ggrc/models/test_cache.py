@@ -0,0 +1,35 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for the session change Cache."""
+
+import unittest
+
+import mock
+
+from ggrc.models.cache import Cache
+
+
+class TestCache(unittest.TestCase):
+  """Tests for recording modified objects before flush."""
+
+  @staticmethod
+  def _flush(cache, new=(), dirty=(), deleted=()):
+    session = mock.Mock(new=list(new), dirty=list(dirty),
+                        deleted=list(deleted))
+    session.is_modified.return_value = True
+    cache.update_before_flush(session, None)
+
+  def test_lazy_log_json(self):
+    """Log JSON is only computed for deleted objects, once per object."""
+    new, dirty, deleted = mock.Mock(), mock.Mock(), mock.Mock()
+    cache = Cache()
+    self._flush(cache, new=[new], dirty=[dirty], deleted=[deleted])
+    self._flush(cache, dirty=[new, dirty], deleted=[deleted])
+
+    self.assertEqual(cache.new, {new: None})
+    self.assertEqual(cache.dirty, {dirty: None})
+    self.assertEqual(cache.deleted, {deleted: deleted.log_json.return_value})
+    self.assertFalse(new.log_json.called)
+    self.assertFalse(dirty.log_json.called)
+    deleted.log_json.assert_called_once_with()
@@ -0,0 +1,56 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for encoding compact revision content."""
+
+import unittest
+
+import mock
+
+from ggrc.models import revision_storage
+
+
+class TestRevisionStorage(unittest.TestCase):
+  """Tests for revision_storage encode and decode."""
+
+  BASE = {
+      "title": "title",
+      "description": "description",
+      "custom_attribute_definitions": [{"id": i, "title": "CA %s" % i}
+                                       for i in range(50)],
+  }
+
+  def setUp(self):
+    patcher = mock.patch.object(revision_storage, "settings")
+    patcher.start().REVISION_BLOB_MIN_SIZE = 512
+    self.addCleanup(patcher.stop)
+
+  def test_key_revision(self):
+    """Key revisions contain all values with large ones as blobs."""
+    compact, blobs = revision_storage.encode(self.BASE)
+    self.assertIsNone(compact["base_id"])
+    self.assertEqual(compact["set"]["title"], "title")
+    blob_ref = compact["set"]["custom_attribute_definitions"]
+    self.assertEqual(blobs[blob_ref["$blob"]],
+                     self.BASE["custom_attribute_definitions"])
+    self.assertEqual(revision_storage.decode(compact, None, blobs), self.BASE)
+
+  def test_delta(self):
+    """Deltas only contain changed and removed values."""
+    content = dict(self.BASE, title="new title")
+    del content["description"]
+    compact, blobs = revision_storage.encode(content, self.BASE, 7)
+    self.assertEqual(compact, {
+        "base_id": 7,
+        "set": {"title": "new title"},
+        "unset": ["description"],
+    })
+    self.assertEqual(blobs, {})
+    self.assertEqual(revision_storage.decode(compact, self.BASE, blobs),
+                     content)
+
+  def test_shared_blobs(self):
+    """Equal values are stored under the same hash."""
+    _, blobs = revision_storage.encode(self.BASE)
+    _, other_blobs = revision_storage.encode(dict(self.BASE, title="other"))
+    self.assertEqual(blobs.keys(), other_blobs.keys())
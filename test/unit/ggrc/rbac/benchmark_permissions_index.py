@@ -0,0 +1,100 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+"""
+ Micro-benchmark of permission checks
+
+Compares the cost of a single is_allowed_read check with the compiled
+permissions index against the previous implementation that walked the
+nested permissions dict and scanned context and resource lists.
+
+Run from the test directory:
+
+  PYTHONPATH=../src python -m unit.ggrc.rbac.benchmark_permissions_index
+"""
+
+import random
+import timeit
+
+import mock
+
+# pylint: disable=unused-import
+from ggrc import models  # NOQA
+from ggrc.rbac import permissions_provider
+
+TYPES = 40
+CONTEXTS = 2000
+RESOURCES = 5000
+CHECKS = 20000
+
+
+class RequestGlobals(object):
+  """Replacement for flask.g."""
+
+
+class ListPermissions(permissions_provider.DefaultUserPermissions):
+  """Permission checks without the permissions index."""
+
+  def _permission_match(self, permission, permissions):
+    type_permissions = permissions.get(permission.action, {}).get(
+        permission.resource_type, {})
+    if None in type_permissions.get('contexts', []):
+      return True
+    return (
+        permission.resource_id in type_permissions.get('resources', []) or
+        permission.context_id in type_permissions.get('contexts', []) or
+        permission.context_id in permissions.get(permission.action, {}).get(
+            self.ADMIN_PERMISSION.resource_type, {}).get('contexts', [])
+    )
+
+  def _is_allowed(self, permission):
+    permissions = self._permissions()
+    if permission.resource_type != '/admin' \
+       and permission.context_id \
+       and self._is_allowed(permission._replace(context_id=None)):
+      return True
+    if self._permission_match(permission, permissions):
+      return True
+    if self._permission_match(self.ADMIN_PERMISSION, permissions):
+      return True
+    return self._permission_match(
+        self._admin_permission_for_context(permission.context_id),
+        permissions)
+
+
+def make_permissions(rand):
+  """Generate permissions of a user with access to many contexts."""
+  return {
+      action: {
+          "Type{}".format(i): {
+              "contexts": rand.sample(xrange(CONTEXTS * 2), CONTEXTS),
+              "resources": rand.sample(xrange(RESOURCES * 2), RESOURCES),
+          } for i in range(TYPES)
+      } for action in ("read", "update", "delete")
+  }
+
+
+def run(user_permissions, checks):
+  for type_, id_, context_id in checks:
+    user_permissions.is_allowed_read(type_, id_, context_id)
+
+
+def main():
+  rand = random.Random(42)
+  checks = [("Type{}".format(rand.randrange(TYPES)),
+             rand.randrange(RESOURCES * 2),
+             rand.randrange(CONTEXTS * 2)) for _ in range(CHECKS)]
+  request_globals = RequestGlobals()
+  request_globals._request_permissions = make_permissions(rand)
+  with mock.patch.object(permissions_provider, "g", request_globals):
+    for name, user_permissions in (
+        ("lists", ListPermissions()),
+        ("index", permissions_provider.DefaultUserPermissions()),
+    ):
+      duration = timeit.timeit(lambda: run(user_permissions, checks),
+                               number=1)
+      print "{:<6} {:>10.2f} us per check".format(
+          name, duration / CHECKS * 1000000)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,88 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for the default user permissions."""
+
+import unittest
+
+import mock
+
+# pylint: disable=unused-import
+from ggrc import models  # NOQA
+from ggrc.rbac import permissions_provider
+
+
+class RequestGlobals(object):
+  """Replacement for flask.g."""
+
+
+class TestDefaultUserPermissions(unittest.TestCase):
+  """Tests for permission checks with the compiled permissions index."""
+
+  def setUp(self):
+    patcher = mock.patch.object(permissions_provider, "g", RequestGlobals())
+    self.g = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.user_permissions = permissions_provider.DefaultUserPermissions()
+
+  def set_permissions(self, permissions):
+    # pylint: disable=protected-access
+    self.g._request_permissions = permissions
+
+  def test_is_allowed(self):
+    """Permissions are granted by context, resource and global context."""
+    self.set_permissions({
+        "__user": "user@example.com",
+        "read": {
+            "Control": {"contexts": [1, 2], "resources": [10]},
+            "Market": {"contexts": [None]},
+        },
+        "update": {"Control": {"contexts": [], "resources": []}},
+    })
+    self.assertTrue(self.user_permissions.is_allowed_read("Control", 5, 1))
+    self.assertTrue(self.user_permissions.is_allowed_read("Control", 10, 3))
+    self.assertFalse(self.user_permissions.is_allowed_read("Control", 5, 3))
+    self.assertTrue(self.user_permissions.is_allowed_read("Market", 5, 3))
+    self.assertFalse(self.user_permissions.is_allowed_update("Control", 5, 1))
+    self.assertFalse(self.user_permissions.is_admin())
+
+  def test_admin(self):
+    """Admin permission allows everything."""
+    self.set_permissions({
+        "__GGRC_ADMIN__": {"__GGRC_ALL__": {"contexts": [0]}},
+    })
+    self.assertTrue(self.user_permissions.is_admin())
+    self.assertTrue(self.user_permissions.is_allowed_delete("Control", 5, 3))
+    self.assertIsNone(self.user_permissions.read_contexts_for("Control"))
+
+  def test_context_admin(self):
+    """Context admin permission allows everything in that context."""
+    self.set_permissions({
+        "__GGRC_ADMIN__": {"__GGRC_ALL__": {"contexts": [7]}},
+    })
+    self.assertTrue(self.user_permissions.is_allowed_update("Control", 1, 7))
+    self.assertFalse(self.user_permissions.is_allowed_update("Control", 1, 8))
+
+  def test_conditions(self):
+    """Conditions are checked for instances."""
+    self.set_permissions({
+        "read": {"Control": {
+            "contexts": [],
+            "conditions": {None: [{
+                "condition": "is",
+                "terms": {"property_name": "title", "value": "allowed"},
+            }]},
+        }},
+    })
+    instance = mock.Mock(id=1, context=None, title="allowed")
+    instance._inflector.model_singular = "Control"
+    self.assertTrue(self.user_permissions.is_allowed_read_for(instance))
+    instance.title = "forbidden"
+    self.assertFalse(self.user_permissions.is_allowed_read_for(instance))
+
+  def test_replaced_permissions(self):
+    """Index is rebuilt when request permissions are replaced."""
+    self.set_permissions({"read": {"Control": {"contexts": [1]}}})
+    self.assertTrue(self.user_permissions.is_allowed_read("Control", 1, 1))
+    self.set_permissions({"read": {"Control": {"contexts": [2]}}})
+    self.assertFalse(self.user_permissions.is_allowed_read("Control", 1, 1))
@@ -173,3 +173,57 @@ class TestGetRevisionsList(TestCase):
       self.assertEqual(
           expected_results,
           [r.action for r in self.get_log_revisions(dirty[0])])
+
+
+class TestFilterResource(TestCase):
+  """Tests for filtering representations by read permissions."""
+
+  def setUp(self):
+    self.user_permissions = mock.Mock()
+    self.user_permissions.is_allowed_read.side_effect = (
+        lambda type_, id_, context_id: context_id != 2)
+    patcher = mock.patch.object(common, "_is_creator", return_value=False)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  @staticmethod
+  def stub(id_, context_id):
+    return {"type": "Control", "id": id_, "context_id": context_id}
+
+  def test_prune_objects(self):
+    """Unreadable objects and sub-resources are removed."""
+    resource = [
+        dict(self.stub(1, 1), owner=self.stub(3, 2), context={"id": 1}),
+        self.stub(2, 2),
+    ]
+    filtered = common.filter_resource(
+        resource, user_permissions=self.user_permissions)
+    self.assertEqual(filtered, [
+        dict(self.stub(1, 1), owner=None, context={"id": 1}),
+    ])
+
+  def test_single_check_per_object(self):
+    """Each distinct object is checked only once."""
+    resource = [dict(self.stub(i, 1), parent=self.stub(100, 1))
+                for i in range(10)]
+    common.filter_resource(resource, user_permissions=self.user_permissions)
+    self.assertEqual(self.user_permissions.is_allowed_read.call_count, 11)
+
+  def test_creator_relationship(self):
+    """Creator needs read access to both ends of a relationship."""
+    relationships = [{
+        "type": "Relationship",
+        "id": id_,
+        "context_id": None,
+        "source": self.stub(1, 1),
+        "destination": self.stub(2, context_id),
+    } for id_, context_id in ((1, 1), (2, 2))]
+    with mock.patch.object(common, "_is_creator", return_value=True), \
+        mock.patch.object(common.permissions, "read_contexts_for",
+                          return_value=[1]) as read_contexts_for, \
+        mock.patch.object(common.permissions, "read_resources_for",
+                          return_value=[]):
+      filtered = common.filter_resource(
+          relationships, user_permissions=self.user_permissions)
+    self.assertEqual([rel["id"] for rel in filtered], [1])
+    self.assertEqual(read_contexts_for.call_count, 1)
@@ -146,3 +146,36 @@ class TestUtilsFunctions(unittest.TestCase):
               "<script>>alert(2)<<script>/<script>s<script>c<script>r<script>"
               "i<script>p<script>t<script>>")
     self.assertEqual(clean(nested), "alert(2)")
+
+  def test_html_cleaner_fast_path(self):
+    """Values without unsafe characters are not changed by bleach."""
+    # pylint: disable=protected-access
+    values = [u"plain text", u"a > b", u"tab\tand\nnewline", u"\x01\x0c",
+              u"caf\xe9 \u4e2d\u6587 \U0001f600", u"line\r\nbreak",
+              u"nul\x00char", u"lone \ud800 surrogate"]
+    for value in values:
+      self.assertEqual(utils.html_cleaner.clean(value),
+                       utils.html_cleaner._clean(value))
+
+  def test_html_cleaner_cache(self):
+    """Cleaned values are cached and are a fix point of the cleaner."""
+    cleaner = utils.html_cleaner
+    cleaner._cache.clear()  # pylint: disable=protected-access
+    value = u"<script>alert(3)</script>&amp;"
+    self.assertEqual(cleaner.clean(value), u"alert(3)&")
+    self.assertEqual(len(cleaner._cache), 2)  # pylint: disable=W0212
+    self.assertEqual(cleaner.clean(value), u"alert(3)&")
+    self.assertEqual(cleaner.clean(u"alert(3)&"), u"alert(3)&")
+    self.assertEqual(len(cleaner._cache), 2)  # pylint: disable=W0212
+
+  def test_html_cleaner_precleaned(self):
+    """Values cleaned in bulk are served from the precleaned map."""
+    cleaner = utils.html_cleaner
+    values = [u"<b>bold</b>", u"<i>x</i><script>y</script>", None, 5,
+              u"<b>bold</b>"]
+    with cleaner.precleaned(values) as cleaned_values:
+      self.assertEqual(cleaned_values[u"<i>x</i><script>y</script>"],
+                       u"<i>x</i>y")
+      cleaned_values[u"<b>bold</b>"] = u"marker"
+      self.assertEqual(cleaner.cleaner(None, u"<b>bold</b>"), u"marker")
+    self.assertEqual(cleaner.cleaner(None, u"<b>bold</b>"), u"<b>bold</b>")
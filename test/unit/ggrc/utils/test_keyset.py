@@ -0,0 +1,81 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for keyset pagination helpers."""
+
+import datetime
+import decimal
+import unittest
+
+import sqlalchemy as sa
+
+from ggrc.utils import keyset
+
+
+class TestKeyset(unittest.TestCase):
+  """Tests for cursor encoding and filters for following pages."""
+
+  def test_cursor(self):
+    """Cursor values and total survive encoding."""
+    values = [datetime.datetime(2017, 3, 1, 12, 30, 15),
+              datetime.date(2017, 3, 1), decimal.Decimal("1.50"), u"title",
+              None, 42]
+    cursor = keyset.encode_cursor(values, 100)
+
+    self.assertNotIn("=", cursor)
+    self.assertEqual(keyset.decode_cursor(cursor, len(values)),
+                     (values, 100))
+
+  def test_invalid_cursor(self):
+    """Invalid cursors and cursors of other orderings are rejected."""
+    cursor = keyset.encode_cursor([1, 2])
+    for invalid_cursor, size in (("invalid", 2), (u"\u043a", 2),
+                                 (cursor, 3)):
+      with self.assertRaises(ValueError):
+        keyset.decode_cursor(invalid_cursor, size)
+
+  def test_after(self):
+    """Rows after the cursor respect direction of every column."""
+    table = sa.sql.table("t", sa.sql.column("a"), sa.sql.column("b"),
+                         sa.sql.column("id"))
+    order = [(table.c.a, True), (table.c.b, False), (table.c.id, True)]
+    rows = [
+        {"a": 2, "b": None, "id": 3},
+        {"a": 2, "b": 1, "id": 9},
+        {"a": 2, "b": 1, "id": 4},
+        {"a": 2, "b": 5, "id": 1},
+        {"a": 1, "b": 0, "id": 7},
+        {"a": None, "b": 0, "id": 8},
+    ]
+
+    for index, row in enumerate(rows):
+      values = [row["a"], row["b"], row["id"]]
+      expression = keyset.after(order, values)
+      following = [
+          other for other in rows
+          if self._evaluate(expression, other)
+      ]
+      self.assertEqual(following, rows[index + 1:])
+
+  @classmethod
+  def _evaluate(cls, expression, row):
+    """Evaluate a simple filter expression for a row."""
+    if isinstance(expression, sa.sql.elements.Grouping):
+      return cls._evaluate(expression.element, row)
+    if isinstance(expression, sa.sql.elements.BooleanClauseList):
+      results = [cls._evaluate(clause, row) for clause in expression.clauses]
+      if expression.operator is sa.sql.operators.or_:
+        return any(results)
+      return all(results)
+    if isinstance(expression, sa.sql.elements.False_):
+      return False
+    left = row[expression.left.name]
+    right = getattr(expression.right, "value", None)
+    operator = expression.operator
+    if operator is sa.sql.operators.is_:
+      return left is None
+    if operator is sa.sql.operators.isnot:
+      return left is not None
+    if left is None:
+      return False
+    return operator(left, right)
@@ -0,0 +1,80 @@
+# Copyright (C) 2017 Google Inc.
+# Licensed under http://www.apache.org/licenses/LICENSE-2.0 <see LICENSE file>
+
+"""Unit tests for the request profiler."""
+
+import unittest
+
+import flask
+import mock
+
+from ggrc.utils import profiler
+
+
+class TestProfiler(unittest.TestCase):
+  """Tests for statement fingerprints, timers and aggregated stats."""
+
+  def setUp(self):
+    self.app = flask.Flask(__name__)
+    self.app_context = self.app.app_context()
+    self.app_context.push()
+    profiler.reset_stats()
+
+  def tearDown(self):
+    profiler.reset_stats()
+    self.app_context.pop()
+
+  def test_fingerprint(self):
+    """IN lists of any length and whitespace get the same fingerprint."""
+    self.assertEqual(
+        profiler.get_fingerprint("SELECT a\n  FROM t WHERE id IN (%s)"),
+        profiler.get_fingerprint("SELECT a FROM t WHERE id IN (%s, %s,%s)"),
+    )
+
+  def test_repeated_statements(self):
+    """Repeated statements are reported with their benchmark block."""
+    profile = profiler.RequestProfile()
+    profile.stack.append("Load people")
+    for _ in range(3):
+      profile.add_statement("SELECT * FROM people WHERE id = %s", 0.1)
+    profile.add_statement("SELECT * FROM controls", 0.2)
+
+    with mock.patch.object(profiler.settings,
+                           "REQUEST_PROFILER_REPEAT_THRESHOLD", 3,
+                           create=True):
+      repeated = profile.get_repeated()
+
+    self.assertEqual(profile.statements, 4)
+    self.assertAlmostEqual(profile.db_time, 0.5)
+    self.assertEqual(len(repeated), 1)
+    self.assertEqual(repeated[0]["count"], 3)
+    self.assertEqual(repeated[0]["stack"], "Load people")
+
+  def test_nested_timers(self):
+    """Nested timers with the same name are counted once."""
+    profile = profiler.RequestProfile()
+    setattr(flask.g, profiler.PROFILE_KEY, profile)
+    with mock.patch.object(profiler, "is_enabled", return_value=True):
+      with mock.patch.object(profiler.time, "time", side_effect=[1, 3]):
+        with profiler.timer("serialization"):
+          with profiler.timer("serialization"):
+            pass
+    self.assertEqual(profile.timers["serialization"], 2)
+
+  def test_timer_disabled(self):
+    """Disabled profiler returns a shared no-op timer."""
+    with mock.patch.object(profiler, "is_enabled", return_value=False):
+      self.assertIs(profiler.timer("a"), profiler.timer("b"))
+
+  def test_stats(self):
+    """Stats contain percentiles of recorded requests."""
+    for statements in range(1, 21):
+      profile = profiler.RequestProfile()
+      profile.statements = statements
+      profiler._record(  # pylint: disable=protected-access
+          "GET /api/controls", profile, statements / 10.0, [])
+
+    stats = profiler.get_stats()["GET /api/controls"]
+
+    self.assertEqual(stats["requests"], 20)
+    self.assertEqual(stats["statements"], {"p50": 10, "p95": 19})
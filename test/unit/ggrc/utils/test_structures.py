@@ -93,3 +93,20 @@ class TestCaseInsensitiveDefDict(unittest.TestCase):
         sorted(self.ci_dict.lower_items()),
         sorted([("hello", "World"), ("foo", "BAR")])
     )
+
+
+class TestLRUCache(unittest.TestCase):
+
+  def test_lru(self):
+    """LRU cache drops least recently used entries."""
+    cache = structures.LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    self.assertEqual(cache.get("a"), 1)
+    cache.set("c", 3)
+    self.assertIsNone(cache.get("b"))
+    self.assertEqual(cache.get("a"), 1)
+    self.assertEqual(cache.get("c"), 3)
+    cache.delete("a")
+    self.assertIsNone(cache.get("a"))
+    self.assertEqual(len(cache), 1)